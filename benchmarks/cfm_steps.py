@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+v4 CFM 步数/调度基准: 对每个 (调度, 步数) 统计 CFM+声码器的 RTF,
+并以 32 步 uniform 的输出为参照, 计算对数mel谱 L1 距离作为质量指标(相同随机种子).
+需要已训练的 v4 模型.
+
+    python benchmarks/cfm_steps.py MODEL_ID ref.wav "参考文本" "目标文本" --threads 4
+"""
+import argparse
+import time
+import torch
+
+from mockvox.engine.v4.inference import Inferencer
+from mockvox.engine.v4.registry import ModelRegistry
+from mockvox.models.v4 import CFM_STEP_TIERS, CFM_SCHEDULES
+
+REFERENCE = ("uniform", 32)
+
+def synthesize(inferencer, ref, pred_semantic, phones2, steps, schedule, seed):
+    torch.manual_seed(seed)
+    start = time.perf_counter()
+    mel = torch.cat(list(inferencer.cfm_chunks(
+        ref, pred_semantic, phones2, sample_steps=steps, cfm_schedule=schedule
+    )), 2)
+    with torch.inference_mode():
+        wav = inferencer.hifigan_model(mel)[0][0]
+    return time.perf_counter() - start, mel.float(), wav
+
+def main():
+    parser = argparse.ArgumentParser(description="v4 CFM steps benchmark")
+    parser.add_argument("modelID", type=str)
+    parser.add_argument("refWavFilePath", type=str)
+    parser.add_argument("promptText", type=str)
+    parser.add_argument("targetText", type=str)
+    parser.add_argument("--language", default="zh", type=str)
+    parser.add_argument("--steps", default=list(CFM_STEP_TIERS), type=int, nargs="+")
+    parser.add_argument("--schedules", default=list(CFM_SCHEDULES), type=str, nargs="+", choices=CFM_SCHEDULES)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0: default).")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    gpt_path, sovits_path = ModelRegistry.resolve_paths(args.modelID)
+    inferencer = Inferencer(gpt_path, sovits_path)
+    if inferencer.version != "v4":
+        raise SystemExit(f"v4 model required, got {inferencer.version}")
+
+    ref = inferencer.get_prompt(args.refWavFilePath, args.promptText, args.language)
+    frontend = inferencer.get_phones_and_bert_batch([args.targetText], args.language)[0]
+    torch.manual_seed(args.seed)
+    pred_semantic = inferencer.infer_semantic(ref, [frontend])[0]
+    phones2 = frontend[0]
+
+    # 预热
+    synthesize(inferencer, ref, pred_semantic, phones2, 4, "uniform", args.seed)
+    _, mel_ref, _ = synthesize(inferencer, ref, pred_semantic, phones2, REFERENCE[1], REFERENCE[0], args.seed)
+
+    print(f"threads: {torch.get_num_threads()} | device: {inferencer.device} | mel frames: {mel_ref.shape[-1]}")
+    print(f"{'schedule':>8} {'steps':>5} {'seconds':>8} {'RTF':>6} {'mel L1':>7}")
+    for schedule in args.schedules:
+        for steps in args.steps:
+            results = [
+                synthesize(inferencer, ref, pred_semantic, phones2, steps, schedule, args.seed)
+                for _ in range(args.repeat)
+            ]
+            elapsed = min(result[0] for result in results)
+            _, mel, wav = results[0]
+            rtf = elapsed / (wav.shape[-1] / 48000)
+            distance = (mel - mel_ref).abs().mean().item()
+            print(f"{schedule:>8} {steps:>5} {elapsed:8.3f} {rtf:6.3f} {distance:7.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+CPU 推理精度/量化对比: 依次以 fp32、bf16、int8 动态量化加载同一模型, 报告 RTF 和相对 fp32 的误差.
+  - BERT: 音素级特征与 fp32 的余弦相似度
+  - GPT: 贪心解码(top_k=1)的语义token与 fp32 的一致率
+  - SoVITS/DiT: 输入 fp32 的语义token, 输出音频对数mel谱与 fp32 的 L1 距离(相同随机种子)
+需要已训练的模型.
+
+    python benchmarks/cpu_quantize.py MODEL_ID ref.wav "参考文本" "目标文本" --threads 4
+"""
+import argparse
+import time
+import torch
+
+from mockvox.config import get_config
+from mockvox.engine.v4.inference import Inferencer
+from mockvox.engine.v4.registry import ModelRegistry
+from mockvox.engine.v4.shared import SharedModels
+from mockvox.nn import mel_spectrogram_torch
+
+MODES = {
+    "fp32": ("fp32", "none"),
+    "bf16": ("bf16", "none"),
+    "int8": ("auto", "int8"),
+}
+
+def log_mel(wav, sampling_rate):
+    mel = mel_spectrogram_torch(
+        wav.float().view(1, -1), n_fft=1024, num_mels=100, sampling_rate=sampling_rate,
+        hop_size=256, win_size=1024, fmin=0, fmax=None, center=False
+    )
+    return torch.log(mel.clamp(min=1e-5))
+
+def run(inferencer, args, pred_semantic=None):
+    """返回 (bert特征, 语义token, 音频, 耗时)"""
+    start = time.perf_counter()
+    ref = inferencer.get_prompt(args.refWavFilePath, args.promptText, args.language)
+    frontend = inferencer.get_phones_and_bert_batch([args.targetText], args.language)[0]
+    semantic = inferencer.infer_semantic(ref, [frontend], top_k=1)[0]
+    torch.manual_seed(args.seed)
+    with torch.no_grad():
+        wav = inferencer.synthesize(ref, semantic if pred_semantic is None else pred_semantic, frontend[0])
+    return frontend[1].float(), semantic, wav.float().cpu(), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU precision / int8 quantization comparison")
+    parser.add_argument("modelID", type=str)
+    parser.add_argument("refWavFilePath", type=str)
+    parser.add_argument("promptText", type=str)
+    parser.add_argument("targetText", type=str)
+    parser.add_argument("--language", default="zh", type=str)
+    parser.add_argument("--modes", default=list(MODES), type=str, nargs="+", choices=list(MODES))
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0: default).")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    # 配置项是 Settings 的类属性, 各模块的 cfg 实例共享
+    settings = type(get_config())
+    gpt_path, sovits_path = ModelRegistry.resolve_paths(args.modelID)
+
+    baseline = None
+    rows = []
+    for mode in ["fp32"] + [mode for mode in args.modes if mode != "fp32"]:
+        settings.INFERENCE_PRECISION, settings.CPU_QUANTIZE = MODES[mode]
+        SharedModels.clear()
+        inferencer = Inferencer(gpt_path, sovits_path)
+        if inferencer.device != "cpu":
+            raise SystemExit("this benchmark compares CPU inference modes, run it on a CPU-only node")
+        sampling_rate = 48000 if inferencer.version == "v4" else inferencer.hps.data.sampling_rate
+
+        run(inferencer, args)   # 预热
+        results = [run(inferencer, args) for _ in range(args.repeat)]
+        bert, semantic, wav, _ = results[0]
+        elapsed = min(result[3] for result in results)
+        rtf = elapsed / (wav.shape[-1] / sampling_rate)
+        if baseline is None:
+            baseline = (bert, semantic, log_mel(wav, sampling_rate))
+            rows.append((mode, rtf, 1.0, 1.0, 0.0))
+            continue
+
+        bert_ref, semantic_ref, mel_ref = baseline
+        bert_cos = torch.nn.functional.cosine_similarity(bert, bert_ref, dim=0).mean().item()
+        length = min(semantic.shape[-1], semantic_ref.shape[-1])
+        agreement = (semantic[..., :length] == semantic_ref[..., :length]).float().mean().item() \
+            * length / max(semantic.shape[-1], semantic_ref.shape[-1])
+        # 同一组语义token合成, 只比较声学部分
+        _, _, wav_same, _ = run(inferencer, args, pred_semantic=semantic_ref)
+        mel = log_mel(wav_same, sampling_rate)
+        frames = min(mel.shape[-1], mel_ref.shape[-1])
+        distance = (mel[..., :frames] - mel_ref[..., :frames]).abs().mean().item()
+        rows.append((mode, rtf, bert_cos, agreement, distance))
+
+    print(f"threads: {torch.get_num_threads()} | model: {args.modelID}")
+    print(f"{'mode':>5} {'RTF':>6} {'bert cos':>8} {'token agree':>11} {'mel L1':>7}")
+    for mode, rtf, bert_cos, agreement, distance in rows:
+        print(f"{mode:>5} {rtf:6.3f} {bert_cos:8.4f} {agreement:11.3f} {distance:7.4f}")
+
+if __name__ == "__main__":
+    main()
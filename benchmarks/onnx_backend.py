@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+CPU 推理后端对比: 同一模型分别以 torch 与 onnxruntime 后端加载, 报告 GPT token/s、整句 RTF,
+以及输入相同语义token时两者输出音频的对数mel谱 L1 距离
+(v4 CFM 初始噪声由 torch 按相同种子生成; v2 解码器图内的噪声不受 torch 种子控制, 距离包含噪声差异).
+需要已训练并用 `mockvox export model MODEL_ID` (v4 另需 `mockvox export vocoder`) 导出的模型.
+
+    python benchmarks/onnx_backend.py MODEL_ID ref.wav "参考文本" "目标文本" --threads 4
+"""
+import argparse
+import time
+import torch
+
+from mockvox.config import get_config
+from mockvox.engine.v4.inference import Inferencer
+from mockvox.engine.v4.registry import ModelRegistry
+from mockvox.engine.v4.shared import SharedModels
+from mockvox.nn import mel_spectrogram_torch
+
+BACKENDS = ("torch", "onnx")
+
+def log_mel(wav, sampling_rate):
+    mel = mel_spectrogram_torch(
+        wav.float().view(1, -1), n_fft=1024, num_mels=100, sampling_rate=sampling_rate,
+        hop_size=256, win_size=1024, fmin=0, fmax=None, center=False
+    )
+    return torch.log(mel.clamp(min=1e-5))
+
+def run(inferencer, ref, frontend, seed, pred_semantic=None):
+    """返回 (语义token, 音频, GPT耗时, 总耗时)"""
+    start = time.perf_counter()
+    semantic = inferencer.infer_semantic(ref, [frontend])[0] if pred_semantic is None else pred_semantic
+    semantic_time = time.perf_counter() - start
+    torch.manual_seed(seed)
+    with torch.no_grad():
+        wav = inferencer.synthesize(ref, semantic, frontend[0])
+    return semantic, wav.float().cpu(), semantic_time, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU torch / onnxruntime backend comparison")
+    parser.add_argument("modelID", type=str)
+    parser.add_argument("refWavFilePath", type=str)
+    parser.add_argument("promptText", type=str)
+    parser.add_argument("targetText", type=str)
+    parser.add_argument("--language", default="zh", type=str)
+    parser.add_argument("--threads", type=int, default=0, help="torch / onnxruntime intra-op threads (0: default).")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    # 配置项是 Settings 的类属性, 各模块的 cfg 实例共享
+    type(get_config()).ONNX_INTRA_OP_THREADS = args.threads
+    gpt_path, sovits_path = ModelRegistry.resolve_paths(args.modelID)
+
+    baseline = None
+    rows = []
+    for backend in BACKENDS:
+        SharedModels.clear()
+        inferencer = Inferencer(gpt_path, sovits_path, device="cpu", backend=backend)
+        sampling_rate = 48000 if inferencer.version == "v4" else inferencer.hps.data.sampling_rate
+        ref = inferencer.get_prompt(args.refWavFilePath, args.promptText, args.language)
+        frontend = inferencer.get_phones_and_bert_batch([args.targetText], args.language)[0]
+
+        run(inferencer, ref, frontend, args.seed)   # 预热
+        results = [run(inferencer, ref, frontend, args.seed) for _ in range(args.repeat)]
+        semantic, wav, _, _ = results[0]
+        tokens_per_second = max(result[0].shape[-1] / result[2] for result in results)
+        rtf = min(result[3] for result in results) / (wav.shape[-1] / sampling_rate)
+        if baseline is None:
+            baseline = (semantic, log_mel(wav, sampling_rate))
+            rows.append((backend, tokens_per_second, rtf, 0.0))
+            continue
+
+        # 同一组语义token合成, 只比较声学部分
+        semantic_ref, mel_ref = baseline
+        _, wav_same, _, _ = run(inferencer, ref, frontend, args.seed, pred_semantic=semantic_ref)
+        mel = log_mel(wav_same, sampling_rate)
+        frames = min(mel.shape[-1], mel_ref.shape[-1])
+        rows.append((backend, tokens_per_second, rtf, (mel[..., :frames] - mel_ref[..., :frames]).abs().mean().item()))
+
+    print(f"threads: {args.threads or 'default'} | model: {args.modelID}")
+    print(f"{'backend':>7} {'GPT tok/s':>9} {'RTF':>6} {'mel L1':>7}")
+    for backend, tokens_per_second, rtf, distance in rows:
+        print(f"{backend:>7} {tokens_per_second:9.1f} {rtf:6.3f} {distance:7.4f}")
+
+if __name__ == "__main__":
+    main()
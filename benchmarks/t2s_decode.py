@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+GPT(T2S) 解码速度基准: 对比动态增长KV缓存(torch.cat)、预分配KV缓存与 torch.compile 编译的解码步.
+使用 s1.json 的模型结构与随机权重, 只测 T2STransformer 逐token解码, 不依赖预训练模型.
+
+    python benchmarks/t2s_decode.py --steps 500 --prompt-len 300 --threads 4 --compile
+"""
+import argparse
+import time
+import json
+import torch
+
+from mockvox.config import GPT_MODEL_CONFIG
+from mockvox.models.v2.t2s_model import Text2SemanticDecoder
+
+def build_inputs(model, batch, prompt_len):
+    x = torch.randn(batch, prompt_len, model.model_dim)
+    attn_mask = torch.zeros(batch, model.num_head, prompt_len, prompt_len, dtype=torch.bool)
+    # 与推理一致: 提示段之后为因果mask
+    attn_mask |= torch.triu(torch.ones(prompt_len, prompt_len, dtype=torch.bool), diagonal=1)
+    return x, attn_mask
+
+@torch.no_grad()
+def run_dynamic(model, x, attn_mask, steps):
+    transformer = model.t2s_transformer
+    xy_dec, k_cache, v_cache = transformer.process_prompt(x, attn_mask, None)
+    step_x = xy_dec[:, -1:]
+    start = time.perf_counter()
+    for _ in range(steps):
+        step_x, k_cache, v_cache = transformer.decode_next_token(step_x, k_cache, v_cache)
+    return time.perf_counter() - start, step_x
+
+@torch.no_grad()
+def run_static(model, x, attn_mask, steps):
+    transformer = model.t2s_transformer
+    prompt_len = x.shape[1]
+    xy_dec, k_cache, v_cache = transformer.process_prompt_static(x, attn_mask, prompt_len + steps + 1, None)
+    step_x = xy_dec[:, -1:]
+    start = time.perf_counter()
+    for idx in range(steps):
+        step_x = transformer.decode_next_token_static(step_x, k_cache, v_cache, prompt_len + idx)
+    return time.perf_counter() - start, step_x
+
+@torch.no_grad()
+def run_compiled(model, x, attn_mask, steps):
+    transformer = model.t2s_transformer
+    prompt_len = x.shape[1]
+    max_len = model.compiled_max_len
+    xy_dec, k_cache, v_cache = transformer.process_prompt_static(x, attn_mask, max_len, None)
+    step_x = xy_dec[:, -1:]
+    positions = torch.arange(max_len)
+    start = time.perf_counter()
+    for idx in range(steps):
+        pos = prompt_len + idx
+        step_x = model.compiled_decode_step(step_x, k_cache, v_cache, positions[pos:pos + 1], (positions <= pos).view(1, 1, 1, -1))
+    return time.perf_counter() - start, step_x
+
+def main():
+    parser = argparse.ArgumentParser(description="T2S decode benchmark")
+    parser.add_argument("--steps", type=int, default=500, help="Decoded tokens per run.")
+    parser.add_argument("--prompt-len", type=int, default=300, help="Phoneme + prompt semantic length.")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0: default).")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compile", action="store_true", help="Also benchmark the torch.compile decode step.")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    with open(GPT_MODEL_CONFIG, "r") as f:
+        config = json.load(f)
+    model = Text2SemanticDecoder(config=config).eval()
+    x, attn_mask = build_inputs(model, args.batch, args.prompt_len)
+
+    # 两种方式结果应一致
+    _, out_dynamic = run_dynamic(model, x, attn_mask, 8)
+    _, out_static = run_static(model, x, attn_mask, 8)
+    max_diff = (out_dynamic - out_static).abs().max().item()
+    runners = [("dynamic", run_dynamic), ("static", run_static)]
+    if args.compile:
+        start = time.perf_counter()
+        if model.compile_decode_step(args.prompt_len + args.steps + 1):
+            print(f"compile + warmup: {time.perf_counter() - start:.1f}s")
+            _, out_compiled = run_compiled(model, x, attn_mask, 8)
+            print(f"max abs diff (static vs compiled): {(out_static - out_compiled).abs().max().item():.3e}")
+            runners.append(("compiled", run_compiled))
+
+    results = {}
+    for name, fn in runners:
+        fn(model, x, attn_mask, 16)   # warmup
+        best = min(fn(model, x, attn_mask, args.steps)[0] for _ in range(args.repeat))
+        results[name] = args.steps * args.batch / best
+        print(f"{name:>8}: {1000 * best / args.steps:.3f} ms/token")
+
+    print(f"threads: {torch.get_num_threads()} | layers: {model.num_layers} | "
+          f"prompt_len: {args.prompt_len} | steps: {args.steps} | batch: {args.batch}")
+    print(f"max abs diff (dynamic vs static): {max_diff:.3e}")
+    for name, tps in results.items():
+        print(f"{name:>8}: {tps:8.1f} tokens/s")
+    print(f" speedup: {results['static'] / results['dynamic']:.2f}x")
+    if "compiled" in results:
+        print(f" compiled speedup over static: {results['compiled'] / results['static']:.2f}x")
+
+if __name__ == "__main__":
+    main()
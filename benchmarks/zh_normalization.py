@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+中文文本规整速度基准: 对比原来逐条规则作用于整句的实现
+与一次扫描找出NSW片段、只对片段应用规则的实现.
+语料由数字、日期、时间、电话、温度、单位、运算等模板与随机字符拼成,
+同时逐句检查两者输出完全一致, 有差异时打印并以非零状态退出.
+
+    python benchmarks/zh_normalization.py --sentences 20000 --repeat 3
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from mockvox.text.zh_normalization import TextNormalizer
+from mockvox.text.zh_normalization.char_convert import t2s_dict
+from mockvox.text.zh_normalization.constants import F2H_ASCII_LETTERS, F2H_DIGITS, F2H_SPACE
+from mockvox.text.zh_normalization.chronology import (
+    RE_DATE, RE_DATE2, RE_TIME, RE_TIME_RANGE, replace_date, replace_date2, replace_time
+)
+from mockvox.text.zh_normalization.num import (
+    RE_DECIMAL_NUM, RE_DEFAULT_NUM, RE_FRAC, RE_INTEGER, RE_NUMBER, RE_PERCENTAGE,
+    RE_POSITIVE_QUANTIFIERS, RE_RANGE, RE_TO_RANGE, RE_ASMD, RE_POWER,
+    replace_default_num, replace_frac, replace_negative_num, replace_number, replace_percentage,
+    replace_positive_quantifier, replace_range, replace_to_range, replace_asmd, replace_power
+)
+from mockvox.text.zh_normalization.phonecode import (
+    RE_MOBILE_PHONE, RE_NATIONAL_UNIFORM_NUMBER, RE_TELEPHONE, replace_mobile, replace_phone
+)
+from mockvox.text.zh_normalization.quantifier import RE_TEMPERATURE, replace_measure, replace_temperature
+
+LEGACY_POST_REPLACE = [
+    ('/', '每'), ('①', '一'), ('②', '二'), ('③', '三'), ('④', '四'), ('⑤', '五'),
+    ('⑥', '六'), ('⑦', '七'), ('⑧', '八'), ('⑨', '九'), ('⑩', '十'),
+    ('α', '阿尔法'), ('β', '贝塔'), ('γ', '伽玛'), ('Γ', '伽玛'), ('δ', '德尔塔'), ('Δ', '德尔塔'),
+    ('ε', '艾普西龙'), ('ζ', '捷塔'), ('η', '依塔'), ('θ', '西塔'), ('Θ', '西塔'), ('ι', '艾欧塔'),
+    ('κ', '喀帕'), ('λ', '拉姆达'), ('Λ', '拉姆达'), ('μ', '缪'), ('ν', '拗'), ('ξ', '克西'), ('Ξ', '克西'),
+    ('ο', '欧米克伦'), ('π', '派'), ('Π', '派'), ('ρ', '肉'), ('ς', '西格玛'), ('Σ', '西格玛'), ('σ', '西格玛'),
+    ('τ', '套'), ('υ', '宇普西龙'), ('φ', '服艾'), ('Φ', '服艾'), ('χ', '器'), ('ψ', '普赛'), ('Ψ', '普赛'),
+    ('ω', '欧米伽'), ('Ω', '欧米伽'),
+    ('+', '加'), ('-', '减'), ('×', '乘'), ('÷', '除'), ('=', '等'),
+]
+
+def legacy_normalize_sentence(sentence: str) -> str:
+    """原实现: 逐字繁简转换, 每条规则各扫描一遍整句, 逐个字符替换"""
+    sentence = "".join([t2s_dict[item] if item in t2s_dict else item for item in sentence])
+    sentence = sentence.translate(F2H_ASCII_LETTERS).translate(F2H_DIGITS).translate(F2H_SPACE)
+
+    sentence = RE_DATE.sub(replace_date, sentence)
+    sentence = RE_DATE2.sub(replace_date2, sentence)
+    sentence = RE_TIME_RANGE.sub(replace_time, sentence)
+    sentence = RE_TIME.sub(replace_time, sentence)
+    sentence = RE_TO_RANGE.sub(replace_to_range, sentence)
+    sentence = RE_TEMPERATURE.sub(replace_temperature, sentence)
+    sentence = replace_measure(sentence)
+    while RE_ASMD.search(sentence):
+        sentence = RE_ASMD.sub(replace_asmd, sentence)
+    sentence = RE_POWER.sub(replace_power, sentence)
+    sentence = RE_FRAC.sub(replace_frac, sentence)
+    sentence = RE_PERCENTAGE.sub(replace_percentage, sentence)
+    sentence = RE_MOBILE_PHONE.sub(replace_mobile, sentence)
+    sentence = RE_TELEPHONE.sub(replace_phone, sentence)
+    sentence = RE_NATIONAL_UNIFORM_NUMBER.sub(replace_phone, sentence)
+    sentence = RE_RANGE.sub(replace_range, sentence)
+    sentence = RE_INTEGER.sub(replace_negative_num, sentence)
+    sentence = RE_DECIMAL_NUM.sub(replace_number, sentence)
+    sentence = RE_POSITIVE_QUANTIFIERS.sub(replace_positive_quantifier, sentence)
+    sentence = RE_DEFAULT_NUM.sub(replace_default_num, sentence)
+    sentence = RE_NUMBER.sub(replace_number, sentence)
+
+    for old, new in LEGACY_POST_REPLACE:
+        sentence = sentence.replace(old, new)
+    return re.sub(r'[-——《》【】<=>{}()（）#&@“”^_|\\]', '', sentence)
+
+PLAIN = "今天天气很好我们一起去公园散步吧这个问题需要仔细讨论一下會議將於明天舉行請準時參加"
+UNITS = ["个", "元", "万元", "千克", "米", "岁", "年", "天", "小时", "块", "吨", "名", "度", "摄氏度", "℃", "°C"]
+MEASURES = ["cm", "cm2", "cm³", "db", "ds", "kg", "km", "m", "m2", "m³", "ml", "mm", "s"]
+NOISE = "0123456789０１２３.-+~:/%×÷=²³ⁿ年月日号点个元度摄氏米kgmsxAbαπ①，"
+
+def number(rng):
+    value = str(rng.randint(0, 10 ** rng.randint(1, 9)))
+    if rng.random() < 0.3:
+        value += "." + str(rng.randint(0, 999))
+    if rng.random() < 0.15:
+        value = "-" + value
+    return value
+
+TEMPLATES = [
+    lambda r: f"{r.randint(1950, 2030)}年{r.randint(1, 12)}月{r.randint(1, 31)}{r.choice('日号')}",
+    lambda r: f"{r.randint(0, 99):02d}年{r.randint(1, 12)}月",
+    lambda r: f"{r.randint(1950, 2030)}{r.choice('-/.')}{r.randint(1, 12):02d}{{0}}{r.randint(1, 28):02d}",
+    lambda r: f"{r.randint(0, 23)}:{r.randint(0, 59):02d}",
+    lambda r: f"{r.randint(0, 23)}:{r.randint(0, 59):02d}:{r.randint(0, 59):02d}",
+    lambda r: f"{r.randint(0, 11)}:{r.choice(['00', '30', '15'])}{r.choice('-~')}{r.randint(12, 23)}:{r.choice(['00', '30', '45'])}",
+    lambda r: f"{number(r)}{r.choice(['°C', '℃', '度', '摄氏度'])}",
+    lambda r: f"{r.randint(-20, 10)}{r.choice(['°C', '%', 'kg'])}~{r.randint(11, 40)}{r.choice(['°C', '%', 'kg'])}",
+    lambda r: f"{number(r)}{r.choice(MEASURES)}",
+    lambda r: f"{r.randint(1, 99)}{r.choice('+-×÷=')}{r.randint(1, 99)}{r.choice(['', '=' + str(r.randint(1, 200))])}",
+    lambda r: f"{r.choice(['x', 'a', '2', '10'])}{r.choice(['²', '³', 'ⁿ', '¹⁰'])}",
+    lambda r: f"{r.randint(1, 20)}/{r.randint(2, 50)}",
+    lambda r: f"{number(r)}%",
+    lambda r: f"{r.choice(['', '+86', '+86 ', '86'])}1{r.choice('3578')}{r.randint(0, 9)}{r.randint(0, 99999999):08d}",
+    lambda r: f"{r.choice(['010', '021', '0755', '0421'])}{r.choice(['-', ''])}{r.randint(1000000, 99999999)}",
+    lambda r: f"400{r.choice(['-', ''])}{r.randint(100, 999)}{r.choice(['-', ''])}{r.randint(1000, 9999)}",
+    lambda r: f"{number(r)}{r.choice('-~')}{number(r)}",
+    lambda r: f"{r.randint(1, 9999)}{r.choice(['', '多', '余', '几', '+'])}{r.choice(UNITS)}",
+    lambda r: f"编号{r.randint(0, 999999):06d}",
+    lambda r: number(r),
+    lambda r: f"{r.randint(1, 99)}块{r.randint(1, 9)}",
+    lambda r: r.choice(["αβγ", "π", "①②", "Δx", "ＡＢＣ１２３", "iPhone15", "USB3.0"]),
+]
+
+def make_sentence(rng: random.Random) -> str:
+    if rng.random() < 0.1:
+        # 随机字符串, 覆盖模板之外的组合
+        return "".join(rng.choice(NOISE + PLAIN) for _ in range(rng.randint(1, 30)))
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        plain_start = rng.randrange(len(PLAIN))
+        parts.append(PLAIN[plain_start:plain_start + rng.randint(0, 8)])
+        template = rng.choice(TEMPLATES)(rng)
+        parts.append(template.replace("{0}", rng.choice("-/.")))
+    parts.append(PLAIN[:rng.randint(0, 6)])
+    return "".join(parts)
+
+def make_corpus(sentences: int, seed: int, plain_ratio: float):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(sentences):
+        if rng.random() < plain_ratio:
+            plain_start = rng.randrange(len(PLAIN))
+            corpus.append((PLAIN * 2)[plain_start:plain_start + rng.randint(4, 30)])
+        else:
+            corpus.append(make_sentence(rng))
+    return corpus
+
+def timed(fn, corpus, repeat):
+    best = float("inf")
+    outputs = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [fn(sentence) for sentence in corpus]
+        best = min(best, time.perf_counter() - start)
+    return best, outputs
+
+def main():
+    parser = argparse.ArgumentParser(description="Chinese text normalization benchmark")
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--plain_ratio", type=float, default=0.3, help="Share of sentences without NSW.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.sentences, args.seed, args.plain_ratio)
+    normalizer = TextNormalizer()
+    legacy_time, legacy_outputs = timed(legacy_normalize_sentence, corpus, args.repeat)
+    fast_time, fast_outputs = timed(normalizer.normalize_sentence, corpus, args.repeat)
+
+    mismatches = [
+        (sentence, legacy, fast)
+        for sentence, legacy, fast in zip(corpus, legacy_outputs, fast_outputs) if legacy != fast
+    ]
+    print(f"sentences: {len(corpus)} | chars: {sum(len(sentence) for sentence in corpus)}")
+    print(f"legacy:      {legacy_time * 1000:8.1f} ms | {len(corpus) / legacy_time:10.0f} sentences/s")
+    print(f"single-pass: {fast_time * 1000:8.1f} ms | {len(corpus) / fast_time:10.0f} sentences/s")
+    print(f"speedup: {legacy_time / fast_time:.2f}x | mismatches: {len(mismatches)}")
+    for sentence, legacy, fast in mismatches[:20]:
+        print(f"  input:       {sentence}\n  legacy:      {legacy}\n  single-pass: {fast}")
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ from mockvox.utils import MockVoxLogger, allowed_file, generate_unique_filename,
 from mockvox.config import get_config, SLICED_ROOT_PATH, DENOISED_ROOT_PATH, ASR_PATH
 from mockvox.engine.v2 import slice_audio, batch_denoise, batch_asr
 from mockvox.engine.v4.inference import Inferencer
+from mockvox.engine.v4.synthesis_cache import resolve_seed
+from mockvox.models.v4 import CFM_STEP_TIERS, CFM_SCHEDULES
 from mockvox.engine.v2 import load_asr_data, batch_add_asr
 from mockvox.engine import TrainingPipeline, ResumingPipeline, VersionDispatcher
          
@@ -141,7 +143,8 @@ def handle_inference(args):
                                     prompt_text=args.promptText, # 参考文本
                                     prompt_language=args.promptLanguage, 
                                     text=args.targetText, # 目标文本
-                                    text_language=args.targetLanguage, top_p=float(args.top_p), temperature=float(args.temperature), top_k=int(args.top_k), speed=float(args.speed))
+                                    text_language=args.targetLanguage, top_p=float(args.top_p), temperature=float(args.temperature), top_k=int(args.top_k), speed=float(args.speed),
+                                    sample_steps=args.sample_steps, cfm_schedule=args.cfm_schedule, seed=resolve_seed(args.seed))
         timestamp = str(int(time.time()))
         outputname = reasoning_result_path / Path(timestamp+".WAV")
         if synthesis_result is None:
@@ -204,6 +207,34 @@ def handle_info(args):
                     f"SOVITS trained epoch: {sovits_epoch}\n"
                     f"GPT trained epoch: {gpt_epoch}")
 
+def handle_export(args):
+    try:
+        if args.target == 'bert':
+            from mockvox.engine.v4.bert import export_bert_onnx
+            model_name = Inferencer.MODEL_MAPPING.get(args.language)
+            if model_name is None:
+                MockVoxLogger.error(f"Unsupported language: {args.language}")
+                return
+            onnx_path = export_bert_onnx(model_name, quantize=args.int8)
+            MockVoxLogger.info(f"ONNX model saved in {onnx_path}")
+        elif args.target == 'model':
+            from mockvox.engine.v4.onnx_export import export_model_onnx
+            if not args.modelID:
+                MockVoxLogger.error("modelID is required to export a model")
+                return
+            gpt_path = Path(WEIGHTS_PATH) / args.modelID / GPT_HALF_WEIGHTS_FILE
+            sovits_path = Path(WEIGHTS_PATH) / args.modelID / SOVITS_HALF_WEIGHTS_FILE
+            onnx_dir = export_model_onnx(str(gpt_path), str(sovits_path))
+            MockVoxLogger.info(f"ONNX models saved in {onnx_dir}")
+        elif args.target == 'vocoder':
+            from mockvox.engine.v4.onnx_export import export_vocoder_onnx
+            onnx_path = export_vocoder_onnx()
+            MockVoxLogger.info(f"ONNX model saved in {onnx_path}")
+    except Exception as e:
+        MockVoxLogger.error(
+            f"Export failed: {args.target} | Traceback :\n{traceback.format_exc()}"
+        )
+
 def main():
     parser = argparse.ArgumentParser(prog='mockvox', description=CLI_HELP_MSG)
     subparsers = parser.add_subparsers(dest='command', help='')
@@ -238,6 +269,9 @@ def main():
     parser_inference.add_argument('--top_k', default=15,type=str, help="GPT sampling parameters (do not set too low when there is no reference text.) If you don't understand, use the default.")
     parser_inference.add_argument('--temperature', default=1,type=str, help='GPT temperature')
     parser_inference.add_argument('--speed', default=1,type=str, help='speed')
+    parser_inference.add_argument('--sample_steps', default=None, type=int, choices=CFM_STEP_TIERS, help='v4 CFM steps, fewer is faster (default: CFM_STEPS).')
+    parser_inference.add_argument('--cfm_schedule', default=None, type=str, choices=CFM_SCHEDULES, help='v4 CFM time step schedule (default: CFM_SCHEDULE).')
+    parser_inference.add_argument('--seed', default=None, type=int, help='Random seed for reproducible output, negative for random (default: SYNTHESIS_SEED).')
     parser_inference.set_defaults(func=handle_inference)
 
     # train 子命令
@@ -263,6 +297,16 @@ def main():
     parser_info.add_argument('modelID', type=str, help='Returned model id from train.')
     parser_info.set_defaults(func=handle_info)
 
+    # export 子命令
+    parser_export = subparsers.add_parser('export', help='Export models to ONNX for CPU inference.')
+    parser_export.add_argument('target', type=str, choices=['bert', 'model', 'vocoder'], help='Model to export.')
+    parser_export.add_argument('modelID', type=str, nargs='?', default=None, help='Trained model id (target model).')
+    parser_export.add_argument('--language', type=str, default='zh', help='BERT language, support zh en ja ko.')
+    parser_export.add_argument('--no-int8', dest='int8', action='store_false',
+                               help='Disable int8 dynamic quantization (default: enable).')
+    parser_export.set_defaults(int8=True)
+    parser_export.set_defaults(func=handle_export)
+
     args = parser.parse_args()
     if hasattr(args, 'func'):
         args.func(args)
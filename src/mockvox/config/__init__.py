@@ -1,8 +1,8 @@
 from .config import get_config, Settings, BASE_PATH, PRETRAINED_PATH, DATA_PATH, LOG_PATH, UPLOAD_PATH, SLICED_ROOT_PATH, DENOISED_ROOT_PATH, \
-                    ASR_PATH, PROCESS_PATH, WEIGHTS_PATH, OUT_PUT_PATH, REF_AUDIO_PATH, SOVITS_MODEL_CONFIG, GPT_MODEL_CONFIG, PRETRAINED_S2G_FILE, PRETRAINED_S2D_FILE, \
+                    ASR_PATH, PROCESS_PATH, WEIGHTS_PATH, OUT_PUT_PATH, REF_AUDIO_PATH, REF_CACHE_PATH, POOL_SOCKET_PATH, SYNTH_CACHE_PATH, SENTENCE_CACHE_PATH, SOVITS_MODEL_CONFIG, GPT_MODEL_CONFIG, PRETRAINED_S2G_FILE, PRETRAINED_S2D_FILE, \
                     PRETRAINED_GPT_FILE, SOVITS_G_WEIGHTS_FILE, SOVITS_D_WEIGHTS_FILE, SOVITS_HALF_WEIGHTS_FILE, GPT_WEIGHTS_FILE, \
                     GPT_HALF_WEIGHTS_FILE, PRETRAINED_S2GV4_FILE, PRETRAINED_T2SV4_FILE, OUT_PUT_FILE, PRETRAINED_VOCODER_FILE
-from .celery import celery_config
+from .celery import celery_config, PREPROCESS_QUEUE, TRAIN_QUEUE, INFERENCE_QUEUE, QUEUE_CONCURRENCY
 
 TQDM_BAR_FORMAT = "{l_bar}{bar:20}{r_bar}" # tqdm bar format
 
@@ -10,6 +10,10 @@ __all__ = [
     "get_config", 
     "Settings", 
     "celery_config",
+    "PREPROCESS_QUEUE",
+    "TRAIN_QUEUE",
+    "INFERENCE_QUEUE",
+    "QUEUE_CONCURRENCY",
     "BASE_PATH", 
     "PRETRAINED_PATH",
     "DATA_PATH",
@@ -22,6 +26,10 @@ __all__ = [
     "WEIGHTS_PATH",
     "OUT_PUT_PATH",
     "REF_AUDIO_PATH",
+    "REF_CACHE_PATH",
+    "POOL_SOCKET_PATH",
+    "SYNTH_CACHE_PATH",
+    "SENTENCE_CACHE_PATH",
     "SOVITS_MODEL_CONFIG",
     "GPT_MODEL_CONFIG",
     "PRETRAINED_S2G_FILE",
@@ -1,6 +1,19 @@
+from kombu import Queue
 from .config import get_config
 cfg = get_config()
 
+# 任务队列: 预处理(切分/降噪/ASR)、训练、推理分开, 长时间的训练任务不阻塞推理
+PREPROCESS_QUEUE = "preprocess"
+TRAIN_QUEUE = "train"
+INFERENCE_QUEUE = "inference"
+
+# 只消费单个队列(celery worker -Q <队列>)且未指定 --concurrency 时的进程数
+QUEUE_CONCURRENCY = {
+    PREPROCESS_QUEUE: cfg.CELERY_PREPROCESS_CONCURRENCY,
+    TRAIN_QUEUE: cfg.CELERY_TRAIN_CONCURRENCY,
+    INFERENCE_QUEUE: cfg.CELERY_INFERENCE_CONCURRENCY,
+}
+
 class CeleryConfig:
     # 连接配置
     broker_url = f"redis://:{cfg.REDIS_PASSWORD}@{cfg.REDIS_HOST}:{cfg.REDIS_PORT}/{cfg.REDIS_DB_BROKER}"
@@ -29,8 +42,20 @@ class CeleryConfig:
         'interval_max': 1.0,
     }
     
+    # 队列与任务路由; 未指定 -Q 的 worker 消费全部队列
+    task_queues = (Queue(PREPROCESS_QUEUE), Queue(TRAIN_QUEUE), Queue(INFERENCE_QUEUE))
+    task_default_queue = PREPROCESS_QUEUE
+    task_routes = {
+        "preprocess": {"queue": PREPROCESS_QUEUE},
+        "add audio": {"queue": PREPROCESS_QUEUE},
+        "train": {"queue": TRAIN_QUEUE},
+        "resume": {"queue": TRAIN_QUEUE},
+        "inference": {"queue": INFERENCE_QUEUE},
+        "prepare reference": {"queue": INFERENCE_QUEUE},
+    }
+
     # 其他高级配置
     worker_prefetch_multiplier = 1  # 控制并发性能
     task_acks_late = True  # 确保任务不丢失
 
-celery_config = CeleryConfig()
\ No newline at end of file
+celery_config = CeleryConfig()
@@ -15,6 +15,10 @@ PROCESS_PATH = os.path.join(DATA_PATH, "process")
 WEIGHTS_PATH = os.path.join(DATA_PATH, "weights")
 OUT_PUT_PATH = os.path.join(DATA_PATH, "output")
 REF_AUDIO_PATH = os.path.join(DATA_PATH, "refAudio")
+REF_CACHE_PATH = os.path.join(DATA_PATH, "refCache")
+POOL_SOCKET_PATH = os.path.join(DATA_PATH, "pool")
+SYNTH_CACHE_PATH = os.path.join(DATA_PATH, "synthCache")
+SENTENCE_CACHE_PATH = os.path.join(DATA_PATH, "sentenceCache")
 
 SOVITS_MODEL_CONFIG = os.path.join(BASE_PATH, "src/mockvox/config/s2.json")
 GPT_MODEL_CONFIG = os.path.join(BASE_PATH, "src/mockvox/config/s1.json")
@@ -42,6 +46,8 @@ class Settings:
     VERSION: str = os.environ.get("VERSION", "0.0.1")
     MAIN_HOST: str = os.environ.get("MAIN_HOST", "0.0.0.0")
     MAIN_PORT: int = int(os.environ.get("MAIN_PORT", "5000"))  # 端口号转int
+    API_EXECUTOR_WORKERS: int = int(os.environ.get("API_EXECUTOR_WORKERS", "4")) # 接口阻塞调用(模型加载、合成、磁盘读写)的线程数
+    API_EXECUTOR_QUEUE: int = int(os.environ.get("API_EXECUTOR_QUEUE", "32")) # 线程都忙时最多排队的请求数, 超出返回503
 
     # 上传文件
     MAX_UPLOAD_SIZE: int = int(os.environ.get("MAX_UPLOAD_SIZE", "10"))*1024*1024 # (单位：MB)
@@ -63,6 +69,59 @@ class Settings:
     REDIS_MEMORY_LIMIT: str = os.environ.get("REDIS_MEMORY_LIMIT","2GB")
     REDIS_PASSWORD: str = os.environ.get("REDIS_PASSWORD")
 
+    # Celery 队列配置
+    CELERY_PREPROCESS_CONCURRENCY: int = int(os.environ.get("CELERY_PREPROCESS_CONCURRENCY", "1")) # preprocess 队列 worker 进程数(切分/降噪/ASR)
+    CELERY_TRAIN_CONCURRENCY: int = int(os.environ.get("CELERY_TRAIN_CONCURRENCY", "1")) # train 队列 worker 进程数, 每个训练任务独占GPU
+    CELERY_INFERENCE_CONCURRENCY: int = int(os.environ.get("CELERY_INFERENCE_CONCURRENCY", "2")) # inference 队列 worker 进程数
+    CELERY_PRELOAD_MODELS: str = os.environ.get("CELERY_PRELOAD_MODELS", "") # inference 队列 worker 进程启动时预加载的模型ID(逗号分隔)
+    CELERY_PRELOAD_LANGUAGES: str = os.environ.get("CELERY_PRELOAD_LANGUAGES", "zh") # inference 队列 worker 进程启动时预加载 BERT 的语言(逗号分隔)
+
+    # 推理配置
+    MODEL_CACHE_MEMORY: int = int(os.environ.get("MODEL_CACHE_MEMORY", "4096"))*1024*1024 # 常驻模型内存预算(单位：MB)
+    INFERENCE_PRECISION: str = os.environ.get("INFERENCE_PRECISION", "auto") # 推理浮点精度 auto/fp16/bf16/fp32, auto 时 GPU 用 fp16, CPU 用 fp32
+    CPU_QUANTIZE: str = os.environ.get("CPU_QUANTIZE", "none") # CPU推理时 GPT、DiT、BERT 的 Linear 层量化方式 none/int8(动态量化)
+    BERT_BACKEND: str = os.environ.get("BERT_BACKEND", "torch") # torch / onnx (仅CPU节点生效)
+    INFERENCE_BACKEND: str = os.environ.get("INFERENCE_BACKEND", "torch") # GPT/SoVITS/DiT/声码器推理后端 torch / onnx (仅CPU节点生效, 需先用 mockvox export 导出)
+    ONNX_INTRA_OP_THREADS: int = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0")) # onnxruntime 算子内线程数, 0为默认(物理核数)
+    ONNX_INTER_OP_THREADS: int = int(os.environ.get("ONNX_INTER_OP_THREADS", "1")) # onnxruntime 算子间线程数, 大于1时并行执行图中的独立分支
+    INFERENCE_POOL_WORKERS: int = int(os.environ.get("INFERENCE_POOL_WORKERS", "0")) # 推理工作进程数(python -m mockvox.engine.v4.pool), 0为在API/Celery进程内推理
+    INFERENCE_POOL_CPUS: str = os.environ.get("INFERENCE_POOL_CPUS", "") # 推理工作进程可用的CPU(如 0-15), 平均分组后各进程绑定一组; 为空时用全部CPU
+    INFERENCE_POOL_AFFINITY: str = os.environ.get("INFERENCE_POOL_AFFINITY", "") # 模型固定分配到的工作进程(如 model_a=0,model_b=1), 其余模型按哈希分配
+    INFERENCE_POOL_CONNECT_TIMEOUT: float = float(os.environ.get("INFERENCE_POOL_CONNECT_TIMEOUT", "30")) # 连接工作进程的超时秒数(进程重启期间重试)
+    SYNTHESIS_SEED: int = int(os.environ.get("SYNTHESIS_SEED", "-1")) # 请求未指定 seed 时使用的随机种子, 负数为不固定(不使用合成结果缓存)
+    SYNTHESIS_CACHE_SIZE: int = int(os.environ.get("SYNTHESIS_CACHE_SIZE", "1024"))*1024*1024 # 固定种子请求的合成结果缓存上限(单位：MB), 0为关闭
+    SENTENCE_CACHE_SIZE: int = int(os.environ.get("SENTENCE_CACHE_SIZE", "1024"))*1024*1024 # 固定种子请求的单句音频缓存上限(单位：MB), 0为关闭
+    FRONTEND_CACHE_MEMORY: int = int(os.environ.get("FRONTEND_CACHE_MEMORY", "256"))*1024*1024 # 文本前端(音素与BERT特征)进程内缓存上限(单位：MB), 0为关闭
+    FRONTEND_CACHE_REDIS: bool = os.environ.get("FRONTEND_CACHE_REDIS", "false").lower() in ("1", "true", "yes") # 文本前端缓存同时写入 Redis, 供其他进程与节点复用
+    FRONTEND_CACHE_REDIS_TTL: int = int(os.environ.get("FRONTEND_CACHE_REDIS_TTL", "604800")) # Redis 中文本前端缓存的过期秒数, 0为不过期
+    BERT_BATCH_SIZE: int = int(os.environ.get("BERT_BATCH_SIZE", "16"))
+    G2PW_INTRA_OP_THREADS: int = int(os.environ.get("G2PW_INTRA_OP_THREADS", "2")) # 中文多音字模型(g2pW)的 onnxruntime 算子内线程数, 0为默认(物理核数)
+    G2PW_INTER_OP_THREADS: int = int(os.environ.get("G2PW_INTER_OP_THREADS", "1")) # g2pW 的 onnxruntime 算子间线程数
+    G2PW_BATCH_SIZE: int = int(os.environ.get("G2PW_BATCH_SIZE", "64")) # g2pW 每次推理的最大多音字查询数
+    G2PW_CACHE_SIZE: int = int(os.environ.get("G2PW_CACHE_SIZE", "4096")) # 内存中缓存的 g2pW 汉字串结果条数, 0为关闭(同时关闭整篇批量预测)
+    T2S_STATIC_KV_CACHE: bool = os.environ.get("T2S_STATIC_KV_CACHE", "true").lower() in ("1", "true", "yes") # GPT解码使用预分配KV缓存
+    REF_CACHE_SIZE: int = int(os.environ.get("REF_CACHE_SIZE", "64")) # 内存中缓存的参考音频特征条数
+    REF_CACHE_DISK_SIZE: int = int(os.environ.get("REF_CACHE_DISK_SIZE", "1024"))*1024*1024 # 落盘的参考音频特征缓存上限(单位：MB), 0为不落盘
+    T2S_COMPILE: bool = os.environ.get("T2S_COMPILE", "false").lower() in ("1", "true", "yes") # 加载模型时用 torch.compile 编译GPT单token解码步并预热
+    T2S_COMPILE_MAX_LEN: int = int(os.environ.get("T2S_COMPILE_MAX_LEN", "2048")) # 编译解码步的固定KV缓存长度, 超出的序列走未编译路径
+    T2S_BATCH_SIZE: int = int(os.environ.get("T2S_BATCH_SIZE", "8")) # 同一请求内GPT批量解码的句子数, 1为逐句解码
+    T2S_SCHEDULER: bool = os.environ.get("T2S_SCHEDULER", "false").lower() in ("1", "true", "yes") # 并发请求共享GPT连续批处理
+    T2S_SCHEDULER_BATCH_SIZE: int = int(os.environ.get("T2S_SCHEDULER_BATCH_SIZE", "8")) # 调度器同时解码的最大序列数
+    T2S_SCHEDULER_MAX_LEN: int = int(os.environ.get("T2S_SCHEDULER_MAX_LEN", "2048")) # 调度器每个序列的KV缓存长度(文本+提示+生成)
+    T2S_SPECULATIVE: bool = os.environ.get("T2S_SPECULATIVE", "false").lower() in ("1", "true", "yes") # 单句GPT解码使用投机解码
+    T2S_DRAFT_LAYERS: int = int(os.environ.get("T2S_DRAFT_LAYERS", "6")) # 投机解码草稿模型使用的GPT前几层
+    T2S_DRAFT_TOKENS: int = int(os.environ.get("T2S_DRAFT_TOKENS", "4")) # 投机解码每轮提出的草稿token数
+    V4_STREAM_CHUNK: bool = os.environ.get("V4_STREAM_CHUNK", "true").lower() in ("1", "true", "yes") # v4流式推理逐块声码
+    V4_STREAM_FIRST_CHUNK: int = int(os.environ.get("V4_STREAM_FIRST_CHUNK", "100")) # v4流式首块mel帧数(100帧约1秒), 决定首包延迟
+    VOCODER_CHUNK_SIZE: int = int(os.environ.get("VOCODER_CHUNK_SIZE", "500")) # v4声码器每块mel帧数, 0为整句一次声码
+    VOCODER_OVERLAP: int = int(os.environ.get("VOCODER_OVERLAP", "8")) # v4声码器相邻块交叉淡化的mel帧数
+    V2_STREAM_INCREMENTAL: bool = os.environ.get("V2_STREAM_INCREMENTAL", "true").lower() in ("1", "true", "yes") # v2流式推理边生成边解码
+    V2_STREAM_WINDOW: int = int(os.environ.get("V2_STREAM_WINDOW", "25")) # v2流式每次解码的新语义token数(25个约1秒)
+    V2_STREAM_LOOKBACK: int = int(os.environ.get("V2_STREAM_LOOKBACK", "10")) # v2流式解码时带上的已输出token数
+    CFM_STEPS: int = int(os.environ.get("CFM_STEPS", "32")) # v4 CFM默认步数(质量档位 4/8/16/32), 步数越少越快
+    CFM_SCHEDULE: str = os.environ.get("CFM_SCHEDULE", "uniform") # v4 CFM时间步调度: uniform/sway
+    CFM_BATCH: bool = os.environ.get("CFM_BATCH", "false").lower() in ("1", "true", "yes") # v4 同一批句子的CFM合并为一次DiT调用
+
     # Security
     SECRET_KEY: str = os.environ.get("SECRET_KEY")
     SECRET_KEY_EXPIRE_MINUTES: int = int(os.environ.get("SECRET_KEY_EXPIRE_MINUTES", "1440"))
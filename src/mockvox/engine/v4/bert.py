@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""BERT 文本特征提取"""
+import os
+import threading
+from typing import List, Optional
+import numpy as np
+import torch
+from torch import nn
+from transformers import AutoTokenizer, AutoModelForMaskedLM
+
+from mockvox.config import PRETRAINED_PATH, get_config
+from mockvox.utils import MockVoxLogger
+from mockvox.engine.v4.precision import inference_dtype, quantize_enabled, quantize_linear
+from mockvox.engine.v4.onnx_backend import session_options
+
+cfg = get_config()
+
+ONNX_DIR = "onnx"
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+class BertHiddenState(nn.Module):
+    """导出 ONNX 用的包装: 只输出推理需要的倒数第三层隐状态"""
+    def __init__(self, bert_model):
+        super().__init__()
+        self.bert_model = bert_model
+
+    def forward(self, input_ids, attention_mask):
+        res = self.bert_model(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True)
+        return res["hidden_states"][-3]
+
+class BertFeatureExtractor:
+    """
+    单个 BERT 模型的特征提取器, 进程内只加载一次.
+    同一请求的多个文本片段合并为一次批量前向. 可被多个线程同时调用, 分词串行执行.
+    backend 为 onnx 时优先使用导出的 (int8) ONNX 模型, 不存在则回退到 torch;
+    torch 后端在 CPU_QUANTIZE=int8 时对 Linear 层做动态量化.
+    """
+    def __init__(
+        self,
+        model_name: str,
+        device: str,
+        backend: Optional[str] = None,
+        batch_size: Optional[int] = None
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size or cfg.BERT_BATCH_SIZE
+        bert_path = os.path.join(PRETRAINED_PATH, model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(bert_path)
+        # fast tokenizer 每次调用会修改 padding/truncation 状态, 并发调用会抛出 "Already borrowed"
+        self._tokenizer_lock = threading.Lock()
+        self.session = None
+        self.bert_model = None
+
+        backend = backend or cfg.BERT_BACKEND
+        if backend == "onnx" and device == "cpu":
+            self.session = self._load_onnx(bert_path)
+        if self.session is None:
+            bert_model = AutoModelForMaskedLM.from_pretrained(bert_path)
+            bert_model.eval()
+            self.bert_model = bert_model.to(dtype=inference_dtype(device)).to(device)
+            if quantize_enabled(device):
+                quantize_linear(self.bert_model)
+
+    def _load_onnx(self, bert_path):
+        import onnxruntime
+        onnx_dir = os.path.join(bert_path, ONNX_DIR)
+        for name in (ONNX_INT8_FILE, ONNX_FILE):
+            onnx_path = os.path.join(onnx_dir, name)
+            if os.path.exists(onnx_path):
+                MockVoxLogger.info(f"loading bert onnx: {onnx_path}")
+                return onnxruntime.InferenceSession(onnx_path, sess_options=session_options(), providers=['CPUExecutionProvider'])
+        MockVoxLogger.warning(f"BERT ONNX model not found in {onnx_dir}, fallback to torch.")
+        return None
+
+    def _hidden_states(self, texts: List[str]):
+        with self._tokenizer_lock:
+            inputs = self.tokenizer(texts, return_tensors="pt", padding=True)
+        lengths = inputs["attention_mask"].sum(dim=1).tolist()
+        if self.session is not None:
+            hidden = self.session.run(None, {
+                "input_ids": inputs["input_ids"].numpy().astype(np.int64),
+                "attention_mask": inputs["attention_mask"].numpy().astype(np.int64),
+            })[0]
+            hidden = torch.from_numpy(hidden)
+        else:
+            with torch.no_grad():
+                for i in inputs:
+                    inputs[i] = inputs[i].to(self.device)
+                res = self.bert_model(**inputs, output_hidden_states=True)
+                hidden = res["hidden_states"][-3].cpu()
+        # 去掉 [CLS] 与 [SEP]/padding
+        return [hidden[i, 1:length - 1] for i, length in enumerate(lengths)]
+
+    def __call__(self, texts: List[str], word2phs: List[List[int]], language: str) -> List[torch.Tensor]:
+        """返回每段文本的音素级特征, 形状 (1024, 音素数)"""
+        # 按长度排序后分批, 减少 padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        hiddens = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, res in zip(batch, self._hidden_states([texts[i] for i in batch])):
+                hiddens[i] = res
+
+        features = []
+        for text, word2ph, res in zip(texts, word2phs, hiddens):
+            if language == "zh":
+                assert len(word2ph) == len(text)
+            phone_level_feature = []
+            for i in range(len(word2ph)):
+                repeat_feature = res[i].repeat(word2ph[i], 1)
+                phone_level_feature.append(repeat_feature)
+            phone_level_feature = torch.cat(phone_level_feature, dim=0)
+            features.append(phone_level_feature.T)
+        return features
+
+def export_bert_onnx(model_name: str, quantize: bool = True):
+    """导出 CPU 推理用的 ONNX 模型, quantize 时额外生成 int8 动态量化版本"""
+    bert_path = os.path.join(PRETRAINED_PATH, model_name)
+    onnx_dir = os.path.join(bert_path, ONNX_DIR)
+    os.makedirs(onnx_dir, exist_ok=True)
+    onnx_path = os.path.join(onnx_dir, ONNX_FILE)
+
+    tokenizer = AutoTokenizer.from_pretrained(bert_path)
+    bert_model = AutoModelForMaskedLM.from_pretrained(bert_path).float().eval()
+    inputs = tokenizer(["语音合成", "文本特征提取"], return_tensors="pt", padding=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            BertHiddenState(bert_model),
+            (inputs["input_ids"], inputs["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+        )
+    MockVoxLogger.info(f"BERT ONNX exported: {onnx_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(onnx_dir, ONNX_INT8_FILE)
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        MockVoxLogger.info(f"BERT ONNX int8 exported: {int8_path}")
+        return int8_path
+    return onnx_path
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""文本前端缓存: 热门句子跳过文本规整、G2P 与 BERT"""
+import io
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import torch
+
+from mockvox.config import get_config
+from mockvox.utils import MockVoxLogger
+
+cfg = get_config()
+
+# 文本前端或BERT的输出变化时递增, 使 Redis 中的旧条目失效
+CACHE_VERSION = 1
+REDIS_PREFIX = "mockvox:frontend:"
+# Redis 出错后暂停访问的秒数
+REDIS_RETRY_INTERVAL = 60
+
+class FrontendCache:
+    """
+    以 (语言, 句子, BERT特征精度) 为键, 缓存句子各片段的 (phones, word2ph, norm_text, bert_language) 与 BERT 特征(CPU Tensor).
+    进程内按 LRU 保留, 总大小不超过 capacity 字节; 启用 Redis 时作为共享的第二层, 其他进程与节点可复用.
+    """
+    def __init__(self, capacity: int, redis_enabled: bool = False, redis_ttl: int = 0):
+        self.capacity = capacity
+        self.redis_enabled = redis_enabled
+        self.redis_ttl = redis_ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_retry_at = 0.0
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 or self.redis_enabled
+
+    @staticmethod
+    def key(language: str, text: str, dtype) -> str:
+        material = [CACHE_VERSION, language, text, str(dtype), cfg.BERT_BACKEND]
+        return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str):
+        """返回 (片段列表, BERT特征列表), 未命中返回 None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        entry = self._redis_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.redis_hits += 1
+            self._store(key, entry)
+        return entry
+
+    def put(self, key: str, segments, berts):
+        entry = (segments, [bert.detach().cpu() for bert in berts])
+        with self._lock:
+            self._store(key, entry)
+        self._redis_put(key, entry)
+
+    def _store(self, key, entry):
+        if self.capacity <= 0:
+            return
+        size = self._entry_size(entry)
+        if size > self.capacity:
+            return
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+        self._entries[key] = (entry, size)
+        self._size += size
+        while self._size > self.capacity:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    @staticmethod
+    def _entry_size(entry):
+        segments, berts = entry
+        # 音素、word2ph 与文本按每项约 64 字节估算
+        text_size = sum(64 * (len(phones) + len(word2ph or []) + len(norm_text)) for phones, word2ph, norm_text, _ in segments)
+        return text_size + sum(bert.numel() * bert.element_size() for bert in berts)
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis(
+                host=cfg.REDIS_HOST,
+                port=int(cfg.REDIS_PORT),
+                db=int(cfg.REDIS_DB_RESULT),
+                password=cfg.REDIS_PASSWORD or None,
+                socket_timeout=1,
+                socket_connect_timeout=1
+            )
+        return self._redis
+
+    def _redis_available(self) -> bool:
+        return self.redis_enabled and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, e):
+        MockVoxLogger.warning(f"Frontend cache redis unavailable, retry in {REDIS_RETRY_INTERVAL}s: {e}")
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+
+    def _redis_get(self, key):
+        if not self._redis_available():
+            return None
+        try:
+            data = self._client().get(REDIS_PREFIX + key)
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        if data is None:
+            return None
+        try:
+            # 只含基本类型与张量, 不反序列化任意对象
+            value = torch.load(io.BytesIO(data), map_location="cpu", weights_only=True)
+            return [tuple(segment) for segment in value["segments"]], value["berts"]
+        except Exception as e:
+            MockVoxLogger.warning(f"Broken frontend cache entry {key}: {e}")
+            return None
+
+    def _redis_put(self, key, entry):
+        if not self._redis_available():
+            return
+        buffer = io.BytesIO()
+        torch.save({"segments": [list(segment) for segment in entry[0]], "berts": entry[1]}, buffer)
+        try:
+            self._client().set(REDIS_PREFIX + key, buffer.getvalue(), ex=self.redis_ttl or None)
+        except Exception as e:
+            self._redis_failed(e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.redis_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory": self._size,
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.redis_hits) / requests if requests else 0.0,
+                "evictions": self.evictions
+            }
+
+frontend_cache = FrontendCache(cfg.FRONTEND_CACHE_MEMORY, cfg.FRONTEND_CACHE_REDIS, cfg.FRONTEND_CACHE_REDIS_TTL)
@@ -1,31 +1,51 @@
 import os, re
+import threading
+import weakref
+from collections import OrderedDict
 import torch
+import torch.nn.functional as F
 from typing import Optional
 from mockvox.utils import MockVoxLogger
 from mockvox.utils import i18n
 from time import time as ttime
 import numpy as np
 import librosa
-from mockvox.models import CNHubert
 from mockvox.text import normalizer as nl
 from mockvox.text import Normalizer
 from mockvox.text import symbols 
-from mockvox.config import (
-    PRETRAINED_PATH,
-    PRETRAINED_S2GV4_FILE,
-    PRETRAINED_VOCODER_FILE)
-from transformers import AutoTokenizer, AutoModelForMaskedLM
+from mockvox.config import PRETRAINED_S2GV4_FILE
 import torchaudio
 from mockvox.nn.mel import spectrogram_torch
-from mockvox.models.v2.t2s_model import Text2SemanticDecoder
+from mockvox.models.v2.t2s_model import Text2SemanticDecoder, DecodeStats
 from io import BytesIO
 from mockvox.models.v4.synthesizer import SynthesizerTrnV3
-from mockvox.models.v2.SynthesizerTrn import Generator,SynthesizerTrn
+from mockvox.models.v2.SynthesizerTrn import SynthesizerTrn, ChunkedVocoder
 from peft import LoraConfig, get_peft_model
 from mockvox.nn import mel_spectrogram_torch
 from mockvox.text.LangSegmenter import LangSegmenter
+from mockvox.engine.v4.shared import SharedModels
+from mockvox.engine.v4.reference import ReferenceExtractor, reference_cache
+from mockvox.engine.v4.synthesis_cache import sentence_cache, normalize_sentence, sentence_seed
+from mockvox.engine.v4.frontend_cache import frontend_cache
+from mockvox.engine.v4.scheduler import T2SScheduler
+from mockvox.engine.v4.speculative import SpeculativeDecoder
+from mockvox.engine.v4.precision import inference_dtype, quantize_enabled, quantize_linear, tensor_bytes
+from mockvox.engine.v4.onnx_backend import (
+    ONNX_DIR,
+    VITS_DECODER_FILE,
+    DIT_STEP_FILE,
+    OnnxT2S,
+    OnnxVitsDecoder,
+    OnnxDiT,
+    load_session
+)
+from mockvox.config import get_config
 import traceback
 
+cfg = get_config()
+# 整篇预测多音字用的中文规整器, 进程内共用
+zh_normalizer = nl.Normalizer("zh")
+
 class Inferencer:
     MODEL_MAPPING = {
         "zh": "GPT-SoVITS/chinese-roberta-wwm-ext-large",
@@ -38,37 +58,118 @@ class Inferencer:
         self,
         gpt_path: Optional[str] = None,
         sovits_path: Optional[str] = None,
-        version: Optional[str] = None
+        version: Optional[str] = None,
+        device: Optional[str] = None,
+        backend: Optional[str] = None
     ):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        # torch / onnx, onnx 后端仅在CPU上生效, 缺少导出的模型时对应部分回退到 torch
+        self.backend = backend or cfg.INFERENCE_BACKEND
         
         
         self.splits = {"，", "。", "？", "！", ",", ".", "?", "!", "~", ":", "：", "—", "…", }     
         self.punctuation = set(['!', '?', '…', ',', '.', '-'," "])
         self.hz = 50
+        # GPU 默认 fp16, CPU 默认 fp32; CPU_QUANTIZE=int8 时 Linear 层做动态量化
+        self.dtype = inference_dtype(self.device)
         self.t2s_model,self.config,self.max_sec = self._change_gpt_weights(gpt_path)
+        if cfg.T2S_COMPILE and cfg.T2S_STATIC_KV_CACHE:
+            # 编译并预热单token解码步, 失败时保持原路径
+            self.t2s_model.compile_decode_step(cfg.T2S_COMPILE_MAX_LEN)
         self.vq_model, self.hps,self.mel_fn_v4 = self._change_sovits_weights(sovits_path)
-        if version=="v4":
-            self.resample_transform_dict={}
+        self.version = version or self.config["model"]["version"]
+        self.gpt_path, self.sovits_path = gpt_path, sovits_path
+        self.onnx_t2s = None
+        self.onnx_vits = None
+        if self.backend == "onnx":
+            self._load_onnx(gpt_path)
+        self.resample_transform_dict={}
+        self.hifigan_model = None
+        if self.version=="v4":
             self.hifigan_model = self._init_hifigan()
+        self.reference_extractor = ReferenceExtractor(self.hps, self.device, self.dtype)
+        # 参考音频+参考文本对应的提示特征(与本模型相关), LRU
+        self._prompts = OrderedDict()
+        self._prompts_lock = threading.Lock()
+        # 并发请求共享的GPT连续批处理调度器
+        self.scheduler = T2SScheduler(
+            self.t2s_model, cfg.T2S_SCHEDULER_BATCH_SIZE, cfg.T2S_SCHEDULER_MAX_LEN
+        ) if cfg.T2S_SCHEDULER else None
+        # 实例不再被引用(移出注册表且进行中的请求都已结束)时停止调度器线程
+        self._finalizer = weakref.finalize(self, self.scheduler.stop) if self.scheduler is not None else None
+        # 单句解码的投机解码器
+        self.speculative = SpeculativeDecoder(
+            self.t2s_model, cfg.T2S_DRAFT_LAYERS, cfg.T2S_DRAFT_TOKENS
+        ) if cfg.T2S_SPECULATIVE else None
+        # GPT解码循环指标(步数、token/s、结束原因)
+        self.decode_stats = DecodeStats()
+        self.t2s_model.decode_hook = self.decode_stats
 
     def _init_hifigan(self):
-        hifigan_model = Generator(
-            initial_channel=100,
-            resblock="1",
-            resblock_kernel_sizes=[3, 7, 11],
-            resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
-            upsample_rates=[10, 6, 2, 2, 2],
-            upsample_initial_channel=512,
-            upsample_kernel_sizes=[20, 12, 4, 4, 4],
-            gin_channels=0,is_bias=True
-        )
-        hifigan_model.eval()
-        hifigan_model.remove_weight_norm()
-        state_dict_g = torch.load(PRETRAINED_VOCODER_FILE, map_location="cpu")
-        MockVoxLogger.info(f"loading vocoder {hifigan_model.load_state_dict(state_dict_g)}")
+        # 声码器与音色无关, 所有模型共用一份
+        return SharedModels.vocoder(self.device, self.backend)
 
-        return hifigan_model.half().to(self.device)
+    def _get_vocoder(self):
+        """v4 分块声码器, 峰值内存与句长无关"""
+        if self.hifigan_model is None:
+            self.hifigan_model = self._init_hifigan()
+        return ChunkedVocoder(self.hifigan_model, cfg.VOCODER_CHUNK_SIZE, cfg.VOCODER_OVERLAP)
+
+    def _load_onnx(self, gpt_path):
+        """onnx 后端: GPT 单句解码、v2 SoVITS 解码器、v4 DiT 单步改用 onnxruntime 会话"""
+        if self.device != "cpu":
+            MockVoxLogger.warning("INFERENCE_BACKEND=onnx only takes effect on CPU nodes, using torch.")
+            return
+        onnx_dir = os.path.join(os.path.dirname(gpt_path), ONNX_DIR)
+        self.onnx_t2s = OnnxT2S.load(self.t2s_model, onnx_dir)
+        if self.version == "v4":
+            session = load_session(os.path.join(onnx_dir, DIT_STEP_FILE))
+            if session is not None:
+                # CFM 的采样循环不变, 每步调用的 DiT 换成 ONNX 会话, 释放 torch 权重
+                self.vq_model.cfm.estimator = OnnxDiT(session)
+        else:
+            session = load_session(os.path.join(onnx_dir, VITS_DECODER_FILE))
+            if session is not None:
+                self.onnx_vits = OnnxVitsDecoder(session)
+
+    def vits_decode(self, codes, text, refers, speed=1, generator=None):
+        """
+        v2 SoVITS 解码; ONNX 模型只包含单参考音频、speed=1 的情形, 其余情况走 torch.
+        指定 generator 时也走 torch: ONNX 图内的噪声无法指定随机数生成器
+        """
+        if self.onnx_vits is not None and speed == 1 and len(refers) == 1 and generator is None:
+            return self.onnx_vits(codes, text, refers[0])
+        return self.vq_model.decode(codes, text, refers, speed=speed, generator=generator)
+
+    def make_generator(self, seed):
+        """独占的随机数生成器, GPT采样与声学模型噪声从中取, 不受并发请求与调度器影响"""
+        if seed is None:
+            return None
+        return torch.Generator(device=self.device).manual_seed(seed)
+
+    def sentence_generator(self, seeds, i_text):
+        """按句重新设定种子的生成器; 未固定种子时为 None"""
+        return self.make_generator(seeds[i_text]) if seeds is not None else None
+
+    def sentence_generators(self, seeds, i_texts):
+        """同一批句子的生成器, 每句一个; 未固定种子时为 None"""
+        if seeds is None:
+            return None
+        return [self.sentence_generator(seeds, i_text) for i_text in i_texts]
+
+    def close(self):
+        """立即停止调度器线程, 调用后不可再推理; 注册表淘汰时不调用, 由GC在最后一个请求结束后停止"""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def memory_footprint(self):
+        """本实例独占的模型权重占用字节数(不含共享组件), 含 int8 量化层的打包权重"""
+        modules = [self.t2s_model, self.vq_model]
+        if self.t2s_model.quantized:
+            # 量化后重建的 t2s_transformer 不是 nn.Module, 其中注意力投影的量化层不在 t2s_model 的 state_dict 里
+            for block in self.t2s_model.t2s_transformer.blocks:
+                modules += [value for value in vars(block).values() if isinstance(value, torch.nn.Module)]
+        return tensor_bytes(*modules)
         
     def _change_gpt_weights(self, gpt_path):
         dict_s1 = torch.load(gpt_path, map_location="cpu")
@@ -79,9 +180,11 @@ class Inferencer:
         state_dict = {k.replace("model.", "", 1) if k.startswith("model.") else k: v 
                 for k, v in dict_s1["weight"].items()}
         t2s_model.load_state_dict(state_dict)
-        t2s_model = t2s_model.half()
+        t2s_model = t2s_model.to(dtype=self.dtype)
         t2s_model = t2s_model.to(self.device)
         t2s_model.eval()
+        if quantize_enabled(self.device):
+            t2s_model.quantize_int8()
         return t2s_model,config,max_sec
 
     def _change_sovits_weights(self, sovits_path):
@@ -105,7 +208,7 @@ class Inferencer:
                 **hps.model
             )
             if_lora_v3=False
-        vq_model = vq_model.half().to(self.device)
+        vq_model = vq_model.to(dtype=self.dtype, device=self.device)
         vq_model.eval()
         if if_lora_v3 == False:
             vq_model.load_state_dict(dict_s2["weight"], strict=False)
@@ -125,6 +228,9 @@ class Inferencer:
             vq_model.load_state_dict(dict_s2["weight"], strict=False)
             vq_model.cfm = vq_model.cfm.merge_and_unload()
             vq_model.eval()
+        if hps.model.version == "v4" and quantize_enabled(self.device):
+            # DiT 的 Linear 层 int8 动态量化
+            quantize_linear(vq_model.cfm)
         mel_fn_v4 = lambda x: mel_spectrogram_torch(
             x,
             **{
@@ -299,26 +405,39 @@ class Inferencer:
         return new_ph, phones[1], norm_text
 
     def get_bert_feature(self, text, word2ph,language):
-        bert_path = os.path.join(PRETRAINED_PATH,self.MODEL_MAPPING.get(language, "GPT-SoVITS/chinese-roberta-wwm-ext-large"))
-        tokenizer = AutoTokenizer.from_pretrained(bert_path)
-        bert_model = AutoModelForMaskedLM.from_pretrained(bert_path)
-        bert_model = bert_model.half().to(self.device)
-        with torch.no_grad():
-            inputs = tokenizer(text, return_tensors="pt")
-            for i in inputs:
-                inputs[i] = inputs[i].to(self.device)
-            res = bert_model(**inputs, output_hidden_states=True)
-            res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
-        if language == "zh":
-            assert len(word2ph) == len(text)
-        phone_level_feature = []
-        for i in range(len(word2ph)):
-            repeat_feature = res[i].repeat(word2ph[i], 1)
-            phone_level_feature.append(repeat_feature)
-        phone_level_feature = torch.cat(phone_level_feature, dim=0)
-        return phone_level_feature.T
-
-    def get_phones_and_bert(self, text,language,final=False):        
+        return self.get_bert_features([(None, word2ph, text, language)])[0]
+
+    def get_bert_features(self, segments):
+        """
+        批量计算片段的BERT特征, 使用同一BERT模型的片段合并为一次前向.
+        segments: [(phones, word2ph, norm_text, bert_language)], bert_language 为 None 时返回全零特征
+        """
+        berts = [None] * len(segments)
+        groups = {}
+        for i, (phones, word2ph, norm_text, bert_language) in enumerate(segments):
+            if bert_language is None:
+                berts[i] = torch.zeros(
+                    (1024, len(phones)),
+                    dtype=self.dtype,
+                ).to(self.device)
+            else:
+                groups.setdefault(bert_language, []).append(i)
+        for bert_language, indexes in groups.items():
+            extractor = SharedModels.bert(
+                self.MODEL_MAPPING.get(bert_language, "GPT-SoVITS/chinese-roberta-wwm-ext-large"), self.device)
+            features = extractor(
+                [segments[i][2] for i in indexes],
+                [segments[i][1] for i in indexes],
+                bert_language
+            )
+            for i, feature in zip(indexes, features):
+                berts[i] = feature.to(self.device)
+        return berts
+
+    def get_phones_segments(self, text, language, final=False):
+        """
+        文本前端处理(不含BERT), 返回 [(phones, word2ph, norm_text, bert_language)]
+        """
         if language in {"en", "all_zh", "all_ja", "all_ko", "all_can"}:
             formattext = text
             while "  " in formattext:
@@ -328,23 +447,20 @@ class Inferencer:
                 if re.search(r"[A-Za-z]", formattext):
                     formattext = re.sub(r"[a-z]", lambda x: x.group(0).upper(), formattext)
                     formattext = normalizer.do_normalize(formattext)
-                    return self.get_phones_and_bert(formattext, "zh")
+                    return self.get_phones_segments(formattext, "zh")
                 else:
                     phones, word2ph, norm_text = self.clean_text_inf(formattext, language)
-                    bert = self.get_bert_feature(norm_text, word2ph,language).to(self.device)
+                    segments = [(phones, word2ph, norm_text, language)]
             elif language == "all_can" and re.search(r"[A-Za-z]", formattext):
                 formattext = re.sub(r"[a-z]", lambda x: x.group(0).upper(), formattext)
                 formattext = normalizer.do_normalize(formattext)
-                return self.get_phones_and_bert(formattext, "can")
+                return self.get_phones_segments(formattext, "can")
             elif language in {"all_ja", "en", "all_ko"}:
                 phones, word2ph, norm_text = self.clean_text_inf(formattext, language)
-                bert = self.get_bert_feature(norm_text, word2ph,language).to(self.device)
+                segments = [(phones, word2ph, norm_text, language)]
             else:
                 phones, word2ph, norm_text = self.clean_text_inf(formattext, language)
-                bert = torch.zeros(
-                    (1024, len(phones)),
-                    dtype=torch.float16,
-                ).to(self.device)
+                segments = [(phones, word2ph, norm_text, None)]
         elif language in {"zh", "ja", "ko", "can", "auto", "auto_can"}:
             textlist = []
             langlist = []
@@ -366,34 +482,70 @@ class Inferencer:
                         # 因无法区别中日韩文汉字,以用户输入为准
                         langlist.append(language)
                     textlist.append(tmp["text"])
-            phones_list = []
-            bert_list = []
-            norm_text_list = []
+            segments = []
             for i in range(len(textlist)):
                 lang = langlist[i]
                 phones, word2ph, norm_text = self.clean_text_inf(textlist[i], lang)
-                bert = self.get_bert_inf(phones, word2ph, norm_text, lang)
-                phones_list.append(phones)
-                norm_text_list.append(norm_text)
-                bert_list.append(bert)
-            bert = torch.cat(bert_list, dim=1)
-            phones = sum(phones_list, [])
-            norm_text = "".join(norm_text_list)
+                lang = lang.replace("all_", "")
+                segments.append((phones, word2ph, norm_text, lang if lang in {"zh", "ja"} else None))
+        phones = sum([segment[0] for segment in segments], [])
         if not final and len(phones) < 6:
-            return self.get_phones_and_bert("." + text, language, final=True)
+            return self.get_phones_segments("." + text, language, final=True)
 
-        return phones, bert.to(torch.float16), norm_text
+        return segments
 
-    def get_bert_inf(self, phones, word2ph, norm_text, language):
-        language=language.replace("all_","")
-        if language == "zh" or language == "ja":
-            bert = self.get_bert_feature(norm_text, word2ph,language).to(self.device)#.to(dtype)
-        else:
-            bert = torch.zeros(
-                (1024, len(phones)),
-                dtype=torch.float16,
-            ).to(self.device)
-        return bert
+    def prefetch_g2p(self, texts, language):
+        """
+        按 get_phones_segments 相同的语言切分取出全部中文片段, 多音字一次批量预测;
+        预测结果缓存在 g2pW 中, 规整结果缓存在 normalize_text 中, 逐句前端处理时直接命中
+        """
+        if len(texts) < 2 or language not in {"zh", "all_zh", "auto"}:
+            return
+        zh_texts = []
+        for text in texts:
+            if language == "all_zh":
+                # 与 get_phones_segments 相同的空白处理, 含英文时另走中英混合路径, 不预测
+                while "  " in text:
+                    text = text.replace("  ", " ")
+                if not re.search(r"[A-Za-z]", text):
+                    zh_texts.append(text)
+                continue
+            for tmp in LangSegmenter.getTexts(text):
+                if (tmp["lang"] == "zh") if language == "auto" else (tmp["lang"] != "en"):
+                    zh_texts.append(tmp["text"])
+        try:
+            zh_normalizer.prefetch(zh_texts)
+        except Exception as e:
+            # 预测失败不影响合成, 逐句处理时再推理
+            MockVoxLogger.warning(f"g2pW prefetch failed: {e}")
+
+    def get_phones_and_bert(self, text,language,final=False):
+        return self.get_phones_and_bert_batch([text], language)[0]
+
+    def get_phones_and_bert_batch(self, texts, language):
+        """
+        批量前端处理, 所有文本片段的BERT特征合并计算.
+        命中前端缓存的文本跳过规整、G2P与BERT
+        """
+        keys = [frontend_cache.key(language, text, self.dtype) for text in texts] if frontend_cache.enabled else [None] * len(texts)
+        entries = [frontend_cache.get(key) if key else None for key in keys]
+        pending = [i for i, entry in enumerate(entries) if entry is None]
+        self.prefetch_g2p([texts[i] for i in pending], language)
+        segments_list = [self.get_phones_segments(texts[i], language) for i in pending]
+        berts = self.get_bert_features([segment for segments in segments_list for segment in segments])
+        offset = 0
+        for i, segments in zip(pending, segments_list):
+            entries[i] = (segments, berts[offset:offset + len(segments)])
+            offset += len(segments)
+            if keys[i]:
+                frontend_cache.put(keys[i], *entries[i])
+        results = []
+        for segments, segment_berts in entries:
+            phones = sum([segment[0] for segment in segments], [])
+            bert = torch.cat([bert.to(self.device) for bert in segment_berts], dim=1)
+            norm_text = "".join([segment[2] for segment in segments])
+            results.append((phones, bert.to(self.dtype), norm_text))
+        return results
 
     def split(self,todo_text):
         todo_text = str(todo_text).replace("……", "。").replace("——", "，")
@@ -434,7 +586,7 @@ class Inferencer:
         )
         return spec
 
-    def inference(self,ref_wav_path, prompt_text, prompt_language, text, text_language, how_to_cut=i18n("凑四句一切"), top_k=15, top_p=1,inp_refs=None, temperature=1,speed=1,is_stream=False):
+    def inference(self,ref_wav_path, prompt_text, prompt_language, text, text_language, how_to_cut=i18n("凑四句一切"), top_k=15, top_p=1,inp_refs=None, temperature=1,speed=1,is_stream=False,batch_size=None,sample_steps=None,cfm_schedule=None,seed=None):
         if ref_wav_path:
             pass
         else:
@@ -449,7 +601,8 @@ class Inferencer:
         if prompt_text is None or len(prompt_text) == 0:
             ref_free = True
             
-        # t0 = ttime()
+        t0 = ttime()
+        first_packet = True
 
         dict_language = [
             "all_zh",#全部按中文识别
@@ -475,31 +628,12 @@ class Inferencer:
         text = text.strip("\n")
 
         MockVoxLogger.info(i18n("实际输入的目标文本:")+text)
-        zero_wav = np.zeros(
+        zero_wav_torch = torch.zeros(
             int(self.hps.data.sampling_rate * 0.3),
-            dtype=np.float16,
-        )        
-        
-        ssl_model = CNHubert()
-        ssl_model.eval()
-        ssl_model = ssl_model.half().to(self.device)
-        zero_wav_torch = torch.from_numpy(zero_wav)
-        zero_wav_torch = zero_wav_torch.half().to(self.device)
+            dtype=torch.float32,
+        ).to(self.device)
 
-        with torch.no_grad():
-            wav16k, sr = librosa.load(ref_wav_path, sr=16000)
-            if wav16k.shape[0] > 160000 or wav16k.shape[0] < 48000:
-                MockVoxLogger.error(i18n("参考音频在3~10秒范围外，请更换！"))
-                raise OSError(i18n("参考音频在3~10秒范围外，请更换！"))
-            wav16k = torch.from_numpy(wav16k)
-            
-            wav16k = wav16k.half().to(self.device)
-            
-            wav16k = torch.cat([wav16k, zero_wav_torch])
-            ssl_content = ssl_model.model(wav16k.unsqueeze(0))["last_hidden_state"].transpose(1, 2)  # .float()
-            codes = self.vq_model.extract_latent(ssl_content)
-            prompt_semantic = codes[0, 0]
-            prompt = prompt_semantic.unsqueeze(0).to(self.device)
+        ref = self.get_prompt(ref_wav_path, prompt_text, prompt_language)
 
         # t1 = ttime()
         # t.append(t1-t0)
@@ -519,129 +653,489 @@ class Inferencer:
         texts = self.process_text(texts)
         texts = self.merge_short_text_in_array(texts, 5)
         
-        phones1,bert1,norm_text1=self.get_phones_and_bert(prompt_text, prompt_language)
         audio_opt = []
         # MockVoxLogger.info("%.3f\t%.3f\t%.3f\t%.3f" % (t[0], sum(t[1::3]), sum(t[2::3]), sum(t[3::3])))
-        for i_text,text in enumerate(texts):
-            
+        target_texts = []
+        for text in texts:
+            # 解决输入目标文本的空行导致报错的问题
             if len(text.strip()) == 0:
                 continue
-            # 解决输入目标文本的空行导致报错的问题
-            
             if text[-1] not in self.splits: 
                 text += "。" if text_language != "en" else "."
-            MockVoxLogger.info(i18n("实际输入的目标文本(每句):")+text)
-            phones2,bert2,norm_text2=self.get_phones_and_bert(text, text_language)
-            MockVoxLogger.info(i18n("前端处理后的文本(每句):")+norm_text2)
+            target_texts.append(text)
+        sampling_rate = 48000 if self.hps.model.version == "v4" else self.hps.data.sampling_rate
+
+        # 句子级缓存: 固定种子时已合成过的句子直接取缓存, 只合成其余句子
+        sentence_keys = [None] * len(target_texts)
+        if seed is not None and sentence_cache.enabled and not inp_refs:
+            sentence_keys = self.sentence_keys(
+                ref_wav_path, target_texts, seed,
+                prompt_text=prompt_text, prompt_language=prompt_language, text_language=text_language,
+                top_k=top_k, top_p=top_p, temperature=temperature, speed=speed,
+                sample_steps=sample_steps, cfm_schedule=cfm_schedule, is_stream=is_stream, batch_size=batch_size
+            )
+        cached = {}
+        for i_text, key in enumerate(sentence_keys):
+            entry = sentence_cache.load(key) if key else None
+            if entry is not None and entry[0] == sampling_rate:
+                cached[i_text] = torch.from_numpy(entry[1]).to(self.device)
+        pending = [i_text for i_text in range(len(target_texts)) if i_text not in cached]
+        # 固定种子: 每句的种子由请求种子与句子派生, GPT与声学模型合成前各自重新设定, 随机数与句子位置无关;
+        # 但单句与多句批量走不同的解码路径(补齐、调度器、投机解码), 数值误差可能使采样结果不同,
+        # 缓存的句子与重新合成的结果只是近似一致
+        seeds = {i_text: sentence_seed(seed, target_texts[i_text]) for i_text in pending} if seed is not None else None
+        if cached:
+            MockVoxLogger.info(f"Sentence cache: {len(cached)}/{len(target_texts)} sentences reused")
+
+        # 未命中的句子前端处理一次完成, BERT特征批量计算
+        frontends = dict(zip(pending, self.get_phones_and_bert_batch(
+            [target_texts[i_text] for i_text in pending], text_language
+        ))) if pending else {}
+
+        def log_first_packet():
+            nonlocal first_packet
+            if first_packet:
+                MockVoxLogger.info(f"First chunk latency: {ttime() - t0:.3f}s")
+                first_packet = False
+
+        def emit(audio):
+            """输出一句音频及其后的 zero_wav 间隔; 非流式时暂存, 最后整段输出"""
+            if is_stream:
+                log_first_packet()
+                yield sampling_rate, (torch.cat([audio, zero_wav_torch], 0).cpu().detach().numpy()* 32767).astype(np.int16)
+            else:
+                audio_opt.append(audio)
+                audio_opt.append(zero_wav_torch)
+
+        def emit_cached(until):
+            """按句子顺序输出 until 之前的缓存句子"""
+            for i_text in sorted(i_text for i_text in cached if i_text < until):
+                yield from emit(cached.pop(i_text))
+
+        def emit_chunks(i_text, chunks):
+            """逐块流式输出一句, 完整输出后写入句子缓存"""
+            parts = []
+            for audio in chunks:
+                log_first_packet()
+                parts.append(audio)
+                yield sampling_rate, (audio.cpu().detach().numpy()* 32767).astype(np.int16)
+            yield sampling_rate, (zero_wav_torch.cpu().detach().numpy()* 32767).astype(np.int16)
+            if parts:
+                self.cache_sentence(sentence_keys[i_text], sampling_rate, torch.cat(parts, 0))
+
+        if is_stream and self.hps.model.version != "v4" and cfg.V2_STREAM_INCREMENTAL:
+            # v2 边生成语义token边解码
+            for i_text in pending:
+                yield from emit_cached(i_text)
+                MockVoxLogger.info(i18n("实际输入的目标文本(每句):")+target_texts[i_text])
+                MockVoxLogger.info(i18n("前端处理后的文本(每句):")+frontends[i_text][2])
+                yield from emit_chunks(i_text, self.synthesize_incremental(
+                    ref, frontends[i_text], top_k=top_k, top_p=top_p, temperature=temperature, speed=speed, inp_refs=inp_refs,
+                    generator=self.sentence_generator(seeds, i_text),
+                    acoustic_generator=self.sentence_generator(seeds, i_text)
+                ))
+            yield from emit_cached(len(target_texts))
+            return
+        for positions in self.split_batches(len(pending), batch_size or cfg.T2S_BATCH_SIZE, is_stream):
+            batch = [pending[position] for position in positions]
+            for i_text in batch:
+                MockVoxLogger.info(i18n("实际输入的目标文本(每句):")+target_texts[i_text])
+                MockVoxLogger.info(i18n("前端处理后的文本(每句):")+frontends[i_text][2])
+            # 同一批句子一次批量解码
+            pred_semantics = self.infer_semantic(
+                ref, [frontends[i_text] for i_text in batch],
+                top_k=top_k, top_p=top_p, temperature=temperature,
+                generator=self.sentence_generators(seeds, batch)
+            )
+            mels = [None] * len(batch)
+            if self.hps.model.version == "v4" and cfg.CFM_BATCH and len(batch) > 1 \
+                    and not (is_stream and cfg.V4_STREAM_CHUNK):
+                # 同一批句子的CFM一起计算
+                mels = self.cfm_batch(
+                    ref, pred_semantics, [frontends[i_text][0] for i_text in batch],
+                    speed=speed, sample_steps=sample_steps, cfm_schedule=cfm_schedule,
+                    generator=self.sentence_generators(seeds, batch)
+                )
+            for i_text, pred_semantic, mel in zip(batch, pred_semantics, mels):
+                yield from emit_cached(i_text)
+                phones2 = frontends[i_text][0]
+                if is_stream and self.hps.model.version == "v4" and cfg.V4_STREAM_CHUNK:
+                    # 逐块声码, 不等整句CFM完成
+                    yield from emit_chunks(i_text, self.synthesize_stream(
+                        ref, pred_semantic, phones2, speed=speed, sample_steps=sample_steps, cfm_schedule=cfm_schedule,
+                        generator=self.sentence_generator(seeds, i_text)
+                    ))
+                    continue
+                audio = self.synthesize(
+                    ref, pred_semantic, phones2, speed=speed, inp_refs=inp_refs,
+                    sample_steps=sample_steps, cfm_schedule=cfm_schedule, mel=mel,
+                    generator=self.sentence_generator(seeds, i_text)
+                )
+                self.cache_sentence(sentence_keys[i_text], sampling_rate, audio)
+                yield from emit(audio)
+        yield from emit_cached(len(target_texts))
+
+        if len(audio_opt) > 0:
+            audio_opt = torch.cat(audio_opt, 0)
+            audio_opt = audio_opt.cpu().detach().numpy()
+            yield sampling_rate, (audio_opt* 32767).astype(np.int16)
+
+    def sentence_keys(self, ref_wav_path, target_texts, seed, **params):
+        """
+        句子缓存键: 模型权重、参考音频内容哈希、规整空白后的句子、合成参数与种子.
+        每句按 sentence_seed 重新设定随机数生成器; 同一批次组成下结果可复现,
+        批次不同时解码路径不同, 缓存的结果与重新合成的结果只是近似一致
+        """
+        return [
+            sentence_cache.key(
+                self.gpt_path, self.sovits_path, ref_wav_path, seed,
+                sentence=normalize_sentence(text), **params
+            ) for text in target_texts
+        ]
+
+    def cache_sentence(self, key, sampling_rate, audio):
+        if key:
+            sentence_cache.save(key, sampling_rate, audio.float().cpu().numpy())
+
+    def split_batches(self, count, batch_size, is_stream=False):
+        """按 batch_size 切分句子序号; 流式时第一句单独解码以尽快输出首包"""
+        indexes = list(range(count))
+        batches = []
+        if is_stream and indexes:
+            batches.append(indexes[:1])
+            indexes = indexes[1:]
+        for start in range(0, len(indexes), max(batch_size, 1)):
+            batches.append(indexes[start:start + max(batch_size, 1)])
+        return batches
+
+    @torch.no_grad()
+    def infer_semantic(self, ref, frontends, top_k=15, top_p=1, temperature=1, generator=None):
+        """
+        GPT 生成语义token. 多句时走批量解码, 每行生成EOS后即从批中移除.
+        frontends: [(phones2, bert2, norm_text2)], 返回每句形如 (1, 1, T) 的语义token;
+        generator 为采样用的随机数生成器, 或与 frontends 对应、每句一个的列表
+        """
+        phones1, bert1, prompt = ref["phones"], ref["bert"], ref["prompt"]
+        early_stop_num = self.hz * self.max_sec
+        generators = generator if isinstance(generator, list) else [generator] * len(frontends)
+        if self.onnx_t2s is not None:
+            # onnx 后端逐句解码
+            return [
+                self.onnx_t2s.generate(
+                    torch.LongTensor(phones1+phones2).unsqueeze(0),
+                    prompt,
+                    torch.cat([bert1, bert2], 1).unsqueeze(0),
+                    top_k=top_k,
+                    top_p=top_p,
+                    temperature=temperature,
+                    early_stop_num=early_stop_num,
+                    generator=sentence_generator,
+                ).unsqueeze(0)
+                for (phones2, bert2, _), sentence_generator in zip(frontends, generators)
+            ]
+        if self.scheduler is not None and all(
+            self.scheduler.fits(len(phones1) + len(phones2), prompt.shape[-1], early_stop_num)
+            for phones2, _, _ in frontends
+        ):
+            # 提交给调度器, 与其他请求的句子一起解码
+            futures = [
+                self.scheduler.submit(
+                    torch.LongTensor(phones1+phones2).to(self.device).unsqueeze(0),
+                    prompt,
+                    torch.cat([bert1, bert2], 1).to(self.device).unsqueeze(0),
+                    top_k=top_k,
+                    top_p=top_p,
+                    temperature=temperature,
+                    early_stop_num=early_stop_num,
+                    generator=sentence_generator,
+                )
+                for (phones2, bert2, _), sentence_generator in zip(frontends, generators)
+            ]
+            return [future.result() for future in futures]
+
+        if len(frontends) == 1:
+            phones2, bert2, _ = frontends[0]
             bert = torch.cat([bert1, bert2], 1)
             all_phoneme_ids = torch.LongTensor(phones1+phones2).to(self.device).unsqueeze(0)
             bert = bert.to(self.device).unsqueeze(0)
-            all_phoneme_len = torch.tensor([all_phoneme_ids.shape[-1]]).to(self.device)
-
-            # t2 = ttime()
-            
-            with torch.no_grad():
-                pred_semantic, idx = self.t2s_model.infer_panel(
+            if self.speculative is not None:
+                return [self.speculative.generate(
                     all_phoneme_ids,
-                    all_phoneme_len,
                     prompt,
                     bert,
-                    # prompt_phone_len=ph_offset,
                     top_k=top_k,
                     top_p=top_p,
                     temperature=temperature,
-                    early_stop_num=self.hz * self.max_sec,
-                )
-                pred_semantic = pred_semantic[:, -idx:].unsqueeze(0)
-                    
-            # t3 = ttime()
-            if self.hps.model.version == "v4":
-                refer = self.get_spepc(self.hps, ref_wav_path).to(self.device).to(torch.float16)
-                phoneme_ids0 = torch.LongTensor(phones1).to(self.device).unsqueeze(0)
-                phoneme_ids1 = torch.LongTensor(phones2).to(self.device).unsqueeze(0)
-                fea_ref, ge = self.vq_model.decode_encp(prompt.unsqueeze(0), phoneme_ids0, refer)
-                ref_audio, sr = torchaudio.load(ref_wav_path)
-                ref_audio = ref_audio.to(self.device).float()
-                if ref_audio.shape[0] == 2:
-                    ref_audio = ref_audio.mean(0).unsqueeze(0)
-                tgt_sr= 32000
-                if sr != tgt_sr:
-                    ref_audio = self.resample(ref_audio, sr,tgt_sr)
-                mel2 = self.mel_fn_v4(ref_audio)
-                mel2 = self.norm_spec(mel2)
-                T_min = min(mel2.shape[2], fea_ref.shape[2])
-                mel2 = mel2[:, :, :T_min]
-                fea_ref = fea_ref[:, :, :T_min]
-                Tref= 500
-                Tchunk= 1000
-                if T_min > Tref:
-                    mel2 = mel2[:, :, -Tref:]
-                    fea_ref = fea_ref[:, :, -Tref:]
-                    T_min = Tref
-                chunk_len = Tchunk - T_min
-                mel2 = mel2.to(torch.float16)
-                fea_todo, ge = self.vq_model.decode_encp(pred_semantic, phoneme_ids1, refer, ge, speed)
-                cfm_resss = []
-                idx = 0
-                while 1:
-                    fea_todo_chunk = fea_todo[:, :, idx : idx + chunk_len]
-                    if fea_todo_chunk.shape[-1] == 0:
+                    early_stop_num=early_stop_num,
+                    generator=generators[0],
+                ).unsqueeze(0)]
+            all_phoneme_len = torch.tensor([all_phoneme_ids.shape[-1]]).to(self.device)
+            pred_semantic, idx = self.t2s_model.infer_panel(
+                all_phoneme_ids,
+                all_phoneme_len,
+                prompt,
+                bert,
+                top_k=top_k,
+                top_p=top_p,
+                temperature=temperature,
+                early_stop_num=early_stop_num,
+                static_kv_cache=cfg.T2S_STATIC_KV_CACHE,
+                generator=generators[0],
+            )
+            return [pred_semantic[:, -idx:].unsqueeze(0)]
+
+        all_phoneme_ids = [torch.LongTensor(phones1+phones2).to(self.device) for phones2, _, _ in frontends]
+        all_phoneme_len = torch.LongTensor([ids.shape[-1] for ids in all_phoneme_ids]).to(self.device)
+        bert = [torch.cat([bert1, bert2], 1).to(self.device) for _, bert2, _ in frontends]
+        y_list, idx_list = self.t2s_model.infer_panel(
+            all_phoneme_ids,
+            all_phoneme_len,
+            prompt.repeat(len(frontends), 1),
+            bert,
+            top_k=top_k,
+            top_p=top_p,
+            temperature=temperature,
+            early_stop_num=early_stop_num,
+            max_len=int(all_phoneme_len.max()),
+            parallel_infer=True,
+            generator=generator,
+        )
+        return [y[-idx:].unsqueeze(0).unsqueeze(0) for y, idx in zip(y_list, idx_list)]
+
+    def synthesize(self, ref, pred_semantic, phones2, speed=1, inp_refs=None, sample_steps=None, cfm_schedule=None, mel=None, generator=None):
+        """语义token合成单句音频, v4 已有 cfm_batch 算好的mel谱时直接声码"""
+        if self.hps.model.version == "v4":
+            cfm_res = mel if mel is not None else torch.cat(list(self.cfm_chunks(
+                ref, pred_semantic, phones2, speed=speed, sample_steps=sample_steps, cfm_schedule=cfm_schedule,
+                generator=generator
+            )), 2)
+            audio = self._get_vocoder()(cfm_res)
+        else:
+            refers = self.get_refers(ref, inp_refs)
+            audio = self.vits_decode(pred_semantic, torch.LongTensor(phones2).to(self.device).unsqueeze(0), refers,speed=speed, generator=generator)[0, 0]
+        audio = torch.clamp(audio.float(), -1.0, 1.0)
+        # max_audio=torch.abs(audio).max()
+        # if max_audio>1:
+        #     audio=audio/max_audio
+        # audio = self.soft_clip(audio)
+        return audio
+
+    def get_refers(self, ref, inp_refs=None):
+        """v2 音色参考: 额外上传的多个参考音频, 没有则用主参考音频"""
+        refers=[]
+        if inp_refs:
+            for path in inp_refs:
+                try:
+                    refer = self.get_spepc(self.hps, path.name).to(self.dtype).to(self.device)
+                    refers.append(refer)
+                except:
+                    traceback.print_exc()
+        if(len(refers)==0):
+            refers = [ref["refer"]]
+        return refers
+
+    def synthesize_incremental(self, ref, frontend, top_k=15, top_p=1, temperature=1, speed=1, inp_refs=None, generator=None, acoustic_generator=None):
+        """
+        v2 流式合成: GPT 每生成 V2_STREAM_WINDOW 个语义token就解码一次, 不等EOS.
+        每次解码带上 V2_STREAM_LOOKBACK 个已输出token作为上下文, 只输出新token对应的音频;
+        每段末尾一个token的音频暂缓输出, 与下一段交叉淡化.
+        generator/acoustic_generator 分别为GPT采样与SoVITS噪声的随机数生成器
+        """
+        phones1, bert1, prompt = ref["phones"], ref["bert"], ref["prompt"]
+        phones2, bert2, _ = frontend
+        window = max(cfg.V2_STREAM_WINDOW, 1)
+        lookback = max(cfg.V2_STREAM_LOOKBACK, 1)
+        refers = self.get_refers(ref, inp_refs)
+        text = torch.LongTensor(phones2).to(self.device).unsqueeze(0)
+        all_phoneme_ids = torch.LongTensor(phones1+phones2).to(self.device).unsqueeze(0)
+        bert = torch.cat([bert1, bert2], 1).to(self.device).unsqueeze(0)
+        all_phoneme_len = torch.tensor([all_phoneme_ids.shape[-1]]).to(self.device)
+        prefix_len = prompt.shape[1]
+
+        emitted = 0 # 已输出音频的token数
+        held = None
+        decoder = self.onnx_t2s or self.speculative
+        if decoder is not None:
+            semantic_stream = decoder.stream(
+                all_phoneme_ids,
+                prompt,
+                bert,
+                top_k=top_k,
+                top_p=top_p,
+                temperature=temperature,
+                early_stop_num=self.hz * self.max_sec,
+                generator=generator,
+            )
+        else:
+            semantic_stream = self.t2s_model.infer_panel_naive_stream(
+                all_phoneme_ids,
+                all_phoneme_len,
+                prompt,
+                bert,
+                top_k=top_k,
+                top_p=top_p,
+                temperature=temperature,
+                early_stop_num=self.hz * self.max_sec,
+                static_kv_cache=cfg.T2S_STATIC_KV_CACHE,
+                generator=generator,
+            )
+        with torch.no_grad():
+            for y, idx, done in semantic_stream:
+                # 结束时最后一个token(EOS)不解码
+                tokens = y[:, prefix_len:-1] if done else y[:, prefix_len:]
+                if not done and tokens.shape[1] - emitted < window:
+                    continue
+                start = max(emitted - lookback, 0)
+                end = tokens.shape[1] if done else tokens.shape[1] - 1
+                if end <= emitted:
+                    # 窗口为1时首个token要等下一个token作为右侧上下文才能输出
+                    if done:
                         break
-                    idx += chunk_len
-                    fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
-                    # 如果有点电可以调整下面的参数{8,16,32,64,128}
-                    cfm_res = self.vq_model.cfm.inference(
-                        fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, 32, inference_cfg_rate=0
-                    )
-                    cfm_res = cfm_res[:, :, mel2.shape[2] :]
-                    mel2 = cfm_res[:, :, -T_min:]
-                    fea_ref = fea_todo_chunk[:, :, -T_min:]
-                    cfm_resss.append(cfm_res)
-                cfm_res = torch.cat(cfm_resss, 2)
-                cfm_res = self.denorm_spec(cfm_res)
-                if self.hifigan_model == None:
-                    self._init_hifigan()
-                vocoder_model=self.hifigan_model
-                with torch.inference_mode():
-                    wav_gen = vocoder_model(cfm_res)
-                    audio = wav_gen[0][0]
-            else:
-                refers=[]
-                if inp_refs:
-                    for path in inp_refs:
-                        try:
-                            refer = self.get_spepc(self.hps, path.name).to(torch.float16).to(self.device)
-                            refers.append(refer)
-                        except:
-                            traceback.print_exc()
-                if(len(refers)==0):
-                    refers = [self.get_spepc(self.hps, ref_wav_path).to(torch.float16).to(self.device)]
-                audio = self.vq_model.decode(pred_semantic, torch.LongTensor(phones2).to(self.device).unsqueeze(0), refers,speed=speed)[0, 0]
-            audio = torch.clamp(audio, -1.0, 1.0)
-            # max_audio=torch.abs(audio).max()
-            # if max_audio>1:
-            #     audio=audio/max_audio
-            # audio = self.soft_clip(audio)
-            audio_opt.append(audio)
-            audio_opt.append(zero_wav_torch)
-            if is_stream and len(audio_opt) == 2:
-                audio_opt = torch.cat(audio_opt, 0)
-                if self.hps.model.version == "v4":
-                    opt_st = 48000
-                else:
-                    opt_st = self.hps.data.sampling_rate
-                audio_opt = audio_opt.cpu().detach().numpy()
-                yield opt_st, (audio_opt* 32767).astype(np.int16)
-                audio_opt = []
-            
-        if len(audio_opt) > 0:
-            audio_opt = torch.cat(audio_opt, 0)
-            if self.hps.model.version == "v4":
-                opt_st = 48000
-            else:
-                opt_st = self.hps.data.sampling_rate
-            audio_opt = audio_opt.cpu().detach().numpy()
-            yield opt_st, (audio_opt* 32767).astype(np.int16)
+                    continue
+                audio = self.vits_decode(tokens[:, start:].unsqueeze(0), text, refers, speed=speed, generator=acoustic_generator)[0, 0]
+                samples_per_token = audio.shape[0] / (tokens.shape[1] - start)
+                audio = audio[int(round((emitted - start) * samples_per_token)):]
+                if held is not None:
+                    fade_len = min(held.shape[0], audio.shape[0])
+                    fade = torch.linspace(0, 1, fade_len, dtype=audio.dtype, device=audio.device)
+                    audio = torch.cat([held[:fade_len] * (1 - fade) + audio[:fade_len] * fade, audio[fade_len:]])
+                    held = None
+                if not done:
+                    # 末尾token缺少右侧上下文, 暂缓输出
+                    held_len = int(round(samples_per_token))
+                    audio, held = audio[:-held_len], audio[-held_len:]
+                emitted = end
+                if audio.shape[0] > 0:
+                    yield torch.clamp(audio.float(), -1.0, 1.0)
+                if done:
+                    break
+        if held is not None:
+            yield torch.clamp(held.float(), -1.0, 1.0)
+
+    @torch.no_grad()
+    def cfm_chunks(self, ref, pred_semantic, phones2, speed=1, first_chunk_len=None, sample_steps=None, cfm_schedule=None, generator=None):
+        """
+        v4: 逐块生成反归一化后的mel谱, 每块以上一块的末尾作为提示.
+        sample_steps/cfm_schedule 为CFM步数与时间步调度, 默认取 CFM_STEPS/CFM_SCHEDULE
+        """
+        sample_steps = sample_steps or cfg.CFM_STEPS
+        cfm_schedule = cfm_schedule or cfg.CFM_SCHEDULE
+        refer = ref["refer"]
+        phoneme_ids1 = torch.LongTensor(phones2).to(self.device).unsqueeze(0)
+        fea_ref, ge, mel2, T_min = ref["fea_ref"], ref["ge"], ref["mel2"], ref["T_min"]
+        Tchunk= 1000
+        chunk_len = Tchunk - T_min
+        fea_todo, ge = self.vq_model.decode_encp(pred_semantic, phoneme_ids1, refer, ge, speed)
+        idx = 0
+        while 1:
+            size = min(first_chunk_len, chunk_len) if idx == 0 and first_chunk_len else chunk_len
+            fea_todo_chunk = fea_todo[:, :, idx : idx + size]
+            if fea_todo_chunk.shape[-1] == 0:
+                break
+            idx += size
+            fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
+            cfm_res = self.vq_model.cfm.inference(
+                fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps,
+                inference_cfg_rate=0, schedule=cfm_schedule, generator=generator
+            )
+            cfm_res = cfm_res[:, :, mel2.shape[2] :]
+            # 下一块的提示取上一提示与本块拼接后的末尾 T_min 帧, 首块短于 T_min 时不丢参考上下文
+            mel2 = torch.cat([mel2, cfm_res], 2)[:, :, -T_min:]
+            fea_ref = torch.cat([fea_ref, fea_todo_chunk], 2)[:, :, -T_min:]
+            yield self.denorm_spec(cfm_res)
+
+    @torch.no_grad()
+    def cfm_batch(self, ref, pred_semantics, phones2_list, speed=1, sample_steps=None, cfm_schedule=None, generator=None):
+        """
+        v4: 多句一起做CFM. 各句的第k块补齐后组成一批, 一次送入DiT(按 x_lens 掩码);
+        每句的下一块仍以该句上一块的末尾为提示. 返回每句反归一化后的mel谱
+        """
+        sample_steps = sample_steps or cfg.CFM_STEPS
+        cfm_schedule = cfm_schedule or cfg.CFM_SCHEDULE
+        T_min = ref["T_min"]
+        Tchunk= 1000
+        chunk_len = Tchunk - T_min
+        fea_todos = []
+        for pred_semantic, phones2 in zip(pred_semantics, phones2_list):
+            phoneme_ids1 = torch.LongTensor(phones2).to(self.device).unsqueeze(0)
+            fea_todo, _ = self.vq_model.decode_encp(pred_semantic, phoneme_ids1, ref["refer"], ref["ge"], speed)
+            fea_todos.append(fea_todo)
+        fea_refs = [ref["fea_ref"]] * len(fea_todos)
+        mel2s = [ref["mel2"]] * len(fea_todos)
+        cfm_resss = [[] for _ in fea_todos]
+        idx = 0
+        while 1:
+            rows = [i for i, fea_todo in enumerate(fea_todos) if fea_todo.shape[-1] > idx]
+            if not rows:
+                break
+            chunks = [fea_todos[i][:, :, idx : idx + chunk_len] for i in rows]
+            feas = [torch.cat([fea_refs[i], chunk], 2) for i, chunk in zip(rows, chunks)]
+            lens = [fea.shape[-1] for fea in feas]
+            fea = torch.cat([F.pad(fea, (0, max(lens) - fea.shape[-1])) for fea in feas], 0).transpose(2, 1)
+            mel2 = torch.cat([mel2s[i] for i in rows], 0)
+            cfm_res = self.vq_model.cfm.inference(
+                fea, torch.LongTensor(lens).to(fea.device), mel2, sample_steps,
+                inference_cfg_rate=0, schedule=cfm_schedule,
+                generator=[generator[i] for i in rows] if isinstance(generator, list) else generator
+            )
+            for row, (i, chunk, length) in enumerate(zip(rows, chunks, lens)):
+                res = cfm_res[row : row + 1, :, T_min : length]
+                mel2s[i] = res[:, :, -T_min:]
+                fea_refs[i] = chunk[:, :, -T_min:]
+                cfm_resss[i].append(res)
+            idx += chunk_len
+        return [self.denorm_spec(torch.cat(cfm_ress, 2)) for cfm_ress in cfm_resss]
+
+    def synthesize_stream(self, ref, pred_semantic, phones2, speed=1, sample_steps=None, cfm_schedule=None, generator=None):
+        """v4 流式合成: 每生成一块mel谱就送入分块声码器, 右侧上下文足够的部分立即输出"""
+        vocoder = self._get_vocoder()
+        for wav in vocoder.stream(self.cfm_chunks(
+            ref, pred_semantic, phones2, speed=speed, first_chunk_len=cfg.V4_STREAM_FIRST_CHUNK,
+            sample_steps=sample_steps, cfm_schedule=cfm_schedule, generator=generator
+        )):
+            yield torch.clamp(wav.float(), -1.0, 1.0)
+
+    def get_prompt(self, ref_wav_path, prompt_text, prompt_language):
+        """
+        参考音频+参考文本的提示特征: 提示语义token、参考频谱、参考文本音素与BERT,
+        v4 另含 fea_ref/ge/mel2. 同一参考音频重复使用时直接命中缓存.
+        """
+        digest = reference_cache.digest(ref_wav_path)
+        key = (digest, prompt_text, prompt_language)
+        with self._prompts_lock:
+            if key in self._prompts:
+                self._prompts.move_to_end(key)
+                return self._prompts[key]
+
+        features = self.reference_extractor.load(ref_wav_path, digest)
+        with torch.no_grad():
+            ssl_content = features["ssl_content"].to(self.device, self.dtype)
+            codes = self.vq_model.extract_latent(ssl_content)
+            prompt_semantic = codes[0, 0]
+            prompt = prompt_semantic.unsqueeze(0).to(self.device)
+        phones1,bert1,norm_text1=self.get_phones_and_bert(prompt_text, prompt_language)
+        refer = features["refer"].to(self.device, self.dtype)
+        ref = {"prompt": prompt, "phones": phones1, "bert": bert1, "refer": refer}
+
+        if self.hps.model.version == "v4":
+            phoneme_ids0 = torch.LongTensor(phones1).to(self.device).unsqueeze(0)
+            fea_ref, ge = self.vq_model.decode_encp(prompt.unsqueeze(0), phoneme_ids0, refer)
+            mel2 = features["mel2"].to(self.device, self.dtype)
+            T_min = min(mel2.shape[2], fea_ref.shape[2])
+            mel2 = mel2[:, :, :T_min]
+            fea_ref = fea_ref[:, :, :T_min]
+            Tref= 500
+            if T_min > Tref:
+                mel2 = mel2[:, :, -Tref:]
+                fea_ref = fea_ref[:, :, -Tref:]
+                T_min = Tref
+            ref.update(fea_ref=fea_ref, ge=ge, mel2=mel2, T_min=T_min)
+
+        with self._prompts_lock:
+            self._prompts[key] = ref
+            while len(self._prompts) > cfg.REF_CACHE_SIZE:
+                self._prompts.popitem(last=False)
+        return ref
 
     def soft_clip(self, x, threshold=0.9):
         scale = torch.abs(x) - threshold
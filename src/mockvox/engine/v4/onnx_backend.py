@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""onnxruntime 推理后端: GPT 解码、SoVITS v2 解码器、v4 DiT 单步、HiFiGAN 声码器"""
+import os
+import numpy as np
+import torch
+from torch import nn
+
+from mockvox.config import get_config
+from mockvox.utils import MockVoxLogger
+from mockvox.models.v2.t2s_model import DecodeMetrics
+from mockvox.nn.AR.utils import sample, token_histogram, update_token_histogram
+from mockvox.engine.v4.speculative import MIN_TOKENS, MAX_STEPS
+
+cfg = get_config()
+
+# 模型权重目录(声码器为预训练目录)下的 ONNX 文件
+ONNX_DIR = "onnx"
+T2S_PREFILL_FILE = "t2s_prefill.onnx"
+T2S_DECODE_FILE = "t2s_decode.onnx"
+VITS_DECODER_FILE = "vits_decoder.onnx"
+DIT_STEP_FILE = "dit_step.onnx"
+VOCODER_FILE = "vocoder.onnx"
+
+def session_options():
+    """CPU 会话配置: 算子内线程数 ONNX_INTRA_OP_THREADS(0 为 onnxruntime 默认), 算子间线程数 ONNX_INTER_OP_THREADS"""
+    import onnxruntime
+    sess_options = onnxruntime.SessionOptions()
+    sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if cfg.ONNX_INTRA_OP_THREADS > 0:
+        sess_options.intra_op_num_threads = cfg.ONNX_INTRA_OP_THREADS
+    inter_op_threads = max(cfg.ONNX_INTER_OP_THREADS, 1)
+    sess_options.inter_op_num_threads = inter_op_threads
+    # 各模型图基本是串行的, 只有显式要求多个算子间线程时才并行执行
+    sess_options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1 \
+        else onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    return sess_options
+
+def load_session(onnx_path: str):
+    """加载 ONNX 模型, 文件不存在时返回 None(调用方回退到 torch)"""
+    if not os.path.exists(onnx_path):
+        MockVoxLogger.warning(f"ONNX model not found: {onnx_path}, fallback to torch.")
+        return None
+    import onnxruntime
+    MockVoxLogger.info(f"loading onnx: {onnx_path}")
+    return onnxruntime.InferenceSession(onnx_path, sess_options=session_options(), providers=['CPUExecutionProvider'])
+
+def _numpy(tensor: torch.Tensor, dtype=np.float32):
+    return tensor.detach().cpu().numpy().astype(dtype, copy=False)
+
+class OnnxT2S:
+    """
+    GPT 单句解码的 onnxruntime 实现, 接口与 SpeculativeDecoder 相同(generate/stream).
+    KV缓存以 OrtValue 在解码步之间传递, 不转换为 numpy; 采样与 infer_panel_naive 相同, 在 torch 中完成.
+    """
+    def __init__(self, t2s_model, prefill_session, decode_session):
+        self.t2s_model = t2s_model
+        self.prefill_session = prefill_session
+        self.decode_session = decode_session
+        self.EOS = t2s_model.EOS
+
+    @classmethod
+    def load(cls, t2s_model, onnx_dir: str):
+        prefill_session = load_session(os.path.join(onnx_dir, T2S_PREFILL_FILE))
+        decode_session = load_session(os.path.join(onnx_dir, T2S_DECODE_FILE))
+        if prefill_session is None or decode_session is None:
+            return None
+        return cls(t2s_model, prefill_session, decode_session)
+
+    def generate(self, x, prompt, bert_feature, **kwargs) -> torch.LongTensor:
+        """返回生成的语义token (1, T), 与 infer_panel_naive 一致丢弃最后一个token"""
+        y = prompt
+        for y, _, _ in self.stream(x, prompt, bert_feature, **kwargs):
+            pass
+        return y[:, prompt.shape[1]:-1]
+
+    @torch.no_grad()
+    def stream(
+        self,
+        x: torch.LongTensor,
+        prompt: torch.LongTensor,
+        bert_feature: torch.Tensor,
+        top_k: int = 15,
+        top_p: float = 1.0,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        early_stop_num: int = -1,
+        generator: torch.Generator = None
+    ):
+        """
+        x: (1, 音素数) 全部文本token, prompt: (1, 提示长度) 参考音频token, bert_feature: (1, 1024, 音素数)
+        与 infer_panel_naive_stream 相同, 每生成一个token产出 (当前y, idx, 是否结束);
+        logits 在CPU上采样, generator 须为CPU随机数生成器
+        """
+        from onnxruntime import OrtValue
+
+        metrics = DecodeMetrics(self.t2s_model.decode_hook)
+        logits, k_cache, v_cache = self.prefill_session.run(None, {
+            "phoneme_ids": _numpy(x, np.int64),
+            "prompt": _numpy(prompt, np.int64),
+            "bert_feature": _numpy(bert_feature),
+        })
+        k_cache, v_cache = OrtValue.ortvalue_from_numpy(k_cache), OrtValue.ortvalue_from_numpy(v_cache)
+        logits = torch.from_numpy(logits)
+
+        y = prompt.long().cpu()
+        prefix_len = y.shape[1]
+        token_counts = token_histogram(y, self.t2s_model.vocab_size)
+        for idx in range(MAX_STEPS):
+            if idx < MIN_TOKENS:   ###至少预测出10个token不然不给停止（0.4s）
+                logits = logits[:, :-1]
+            samples = sample(
+                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature,
+                token_counts=token_counts, generator=generator
+            )[0]
+            y = torch.concat([y, samples], dim=1)
+            update_token_histogram(token_counts, samples)
+
+            stop = False
+            stop_reason = "max_steps"
+            if early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num:
+                stop_reason = "early_stop"
+                stop = True
+            if torch.argmax(logits, dim=-1)[0] == self.EOS or samples[0, 0] == self.EOS:
+                stop_reason = "eos"
+                stop = True
+            done = stop or idx == MAX_STEPS - 1
+            if done:
+                metrics.finish(idx + 1, y.shape[1] - prefix_len, stop_reason, prefix_len)
+            yield y, idx, done
+            if done:
+                break
+
+            # 下一步: 新token在音频段中的位置为 提示长度 + idx
+            logits, k_cache, v_cache = self.decode_session.run_with_ort_values(
+                ["logits", "k_cache_out", "v_cache_out"],
+                {
+                    "token": OrtValue.ortvalue_from_numpy(_numpy(samples, np.int64)),
+                    "position": OrtValue.ortvalue_from_numpy(np.array([prefix_len + idx], dtype=np.int64)),
+                    "k_cache": k_cache,
+                    "v_cache": v_cache,
+                }
+            )
+            logits = torch.from_numpy(logits.numpy())
+
+class OnnxVitsDecoder:
+    """v2 SoVITS 解码器(单参考音频, speed=1), 返回 (1, 1, 样本数)"""
+    def __init__(self, session):
+        self.session = session
+
+    def __call__(self, codes, text, refer):
+        audio = self.session.run(None, {
+            "codes": _numpy(codes, np.int64),
+            "text": _numpy(text, np.int64),
+            "refer": _numpy(refer),
+        })[0]
+        return torch.from_numpy(audio)
+
+class OnnxDiT(nn.Module):
+    """替换 CFM 的 estimator, 参数与 DiT.forward 相同; 导出图中不含无条件分支(drop_*)"""
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def forward(self, x0, cond0, x_lens, time, dt_base_bootstrap, text0, use_grad_ckpt=False, drop_audio_cond=False, drop_text=False):
+        if drop_audio_cond or drop_text:
+            raise NotImplementedError("ONNX DiT step has no unconditional branch, inference_cfg_rate must be 0")
+        velocity = self.session.run(None, {
+            "x": _numpy(x0),
+            "prompt_x": _numpy(cond0),
+            "x_lens": _numpy(x_lens, np.int64),
+            "time": _numpy(time),
+            "dt": _numpy(dt_base_bootstrap),
+            "mu": _numpy(text0),
+        })[0]
+        return torch.from_numpy(velocity).to(dtype=x0.dtype, device=x0.device)
+
+class OnnxVocoder(nn.Module):
+    """v4 HiFiGAN 声码器, 感受野与上采样倍数取自同结构的 torch Generator, 供 ChunkedVocoder 分块使用"""
+    def __init__(self, session, generator):
+        super().__init__()
+        self.session = session
+        self._receptive_field = generator.receptive_field()
+        self._upsample_factor = generator.upsample_factor()
+
+    def receptive_field(self):
+        return self._receptive_field
+
+    def upsample_factor(self):
+        return self._upsample_factor
+
+    def forward(self, mel):
+        audio = self.session.run(None, {"mel": _numpy(mel)})[0]
+        return torch.from_numpy(audio).to(dtype=mel.dtype, device=mel.device)
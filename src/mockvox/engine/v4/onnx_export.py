@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+导出 onnxruntime 推理后端使用的 ONNX 模型:
+  - GPT(T2S): 首步前向(prefill) 与 单token解码步(KV缓存作为输入/输出)
+  - SoVITS v2 解码器
+  - v4 DiT 单步(CFM 每个时间步调用一次)
+  - v4 HiFiGAN 声码器(与音色无关, 导出到预训练模型目录)
+"""
+import os
+import torch
+from torch import nn
+
+from mockvox.config import PRETRAINED_VOCODER_FILE
+from mockvox.utils import MockVoxLogger, sequence_mask
+from mockvox.engine.v4.precision import quantize_enabled
+from mockvox.engine.v4.onnx_backend import (
+    ONNX_DIR,
+    T2S_PREFILL_FILE,
+    T2S_DECODE_FILE,
+    VITS_DECODER_FILE,
+    DIT_STEP_FILE,
+    VOCODER_FILE
+)
+
+OPSET_VERSION = 17
+
+class T2SPrefill(nn.Module):
+    """首步前向: 返回最后位置的logits 与 堆叠后的各层KV缓存 (层数, 1, 长度, 隐层维度)"""
+    def __init__(self, t2s_model):
+        super().__init__()
+        self.t2s_model = t2s_model
+
+    def forward(self, phoneme_ids, prompt, bert_feature):
+        logits, k_cache, v_cache, _ = self.t2s_model.prefill(phoneme_ids, prompt, bert_feature)
+        return logits, torch.stack(k_cache), torch.stack(v_cache)
+
+class T2SDecodeStep(nn.Module):
+    """单token解码步: 输入上一个token、其在音频段中的位置和KV缓存, 返回logits与追加后的KV缓存"""
+    def __init__(self, t2s_model):
+        super().__init__()
+        self.t2s_model = t2s_model
+
+    def forward(self, token, position, k_cache, v_cache):
+        x = self.t2s_model.embed_next_tokens(token, position)
+        x, k_list, v_list = self.t2s_model.t2s_transformer.decode_next_token(
+            x, list(k_cache.unbind(0)), list(v_cache.unbind(0))
+        )
+        logits = self.t2s_model.ar_predict_layer(x[:, -1])
+        return logits, torch.stack(k_list), torch.stack(v_list)
+
+class VitsDecoder(nn.Module):
+    """
+    v2 SynthesizerTrn.decode 的单参考音频、speed=1 版本.
+    长度用张量运算得到(而不是 LongTensor([...])), 导出后随输入长度变化.
+    """
+    def __init__(self, vq_model, noise_scale: float = 0.5):
+        super().__init__()
+        self.vq_model = vq_model
+        self.noise_scale = noise_scale
+
+    def forward(self, codes, text, refer):
+        model = self.vq_model
+        refer_lengths = torch.ones_like(refer[0, 0], dtype=torch.long).sum(-1, keepdim=True)
+        refer_mask = torch.unsqueeze(sequence_mask(refer_lengths, refer.size(2)), 1).to(refer.dtype)
+        ge = model.ref_enc(refer[:, :704] * refer_mask, refer_mask)
+
+        quantized = model.quantizer.decode(codes)
+        quantized = torch.repeat_interleave(quantized, 2, dim=-1) # 25hz -> 50hz, 同 nearest 插值
+        y_lengths = torch.ones_like(quantized[0, 0], dtype=torch.long).sum(-1, keepdim=True)
+        text_lengths = torch.ones_like(text[0], dtype=torch.long).sum(-1, keepdim=True)
+        _, m_p, logs_p, y_mask = model.enc_p(quantized, y_lengths, text, text_lengths, ge)
+        z_p = m_p + torch.randn_like(m_p) * torch.exp(logs_p) * self.noise_scale
+        z = model.flow(z_p, y_mask, g=ge, reverse=True)
+        return model.dec(z * y_mask, g=ge)
+
+class DiTStep(nn.Module):
+    """CFM 单步的速度场估计(不含无条件分支)"""
+    def __init__(self, estimator):
+        super().__init__()
+        self.estimator = estimator
+
+    def forward(self, x, prompt_x, x_lens, time, dt, mu):
+        return self.estimator(x, prompt_x, x_lens, time, dt, mu, use_grad_ckpt=False, drop_audio_cond=False, drop_text=False)
+
+def _export(module, args, path, input_names, output_names, dynamic_axes):
+    with torch.no_grad():
+        torch.onnx.export(
+            module,
+            args,
+            path,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET_VERSION,
+        )
+    MockVoxLogger.info(f"ONNX exported: {path}")
+    return path
+
+def export_t2s_onnx(t2s_model, onnx_dir: str):
+    """导出 GPT 首步前向与单token解码步"""
+    t2s_model = t2s_model.float().eval()
+    phoneme_ids = torch.randint(0, 100, (1, 24))
+    prompt = torch.randint(0, t2s_model.EOS, (1, 16))
+    bert_feature = torch.randn(1, 1024, phoneme_ids.shape[1])
+    prefill_path = _export(
+        T2SPrefill(t2s_model),
+        (phoneme_ids, prompt, bert_feature),
+        os.path.join(onnx_dir, T2S_PREFILL_FILE),
+        input_names=["phoneme_ids", "prompt", "bert_feature"],
+        output_names=["logits", "k_cache", "v_cache"],
+        dynamic_axes={
+            "phoneme_ids": {1: "phonemes"},
+            "prompt": {1: "prompt_len"},
+            "bert_feature": {2: "phonemes"},
+            "k_cache": {2: "kv_len"},
+            "v_cache": {2: "kv_len"},
+        },
+    )
+
+    with torch.no_grad():
+        _, k_cache, v_cache = T2SPrefill(t2s_model)(phoneme_ids, prompt, bert_feature)
+    decode_path = _export(
+        T2SDecodeStep(t2s_model),
+        (prompt[:, -1:], torch.LongTensor([prompt.shape[1]]), k_cache, v_cache),
+        os.path.join(onnx_dir, T2S_DECODE_FILE),
+        input_names=["token", "position", "k_cache", "v_cache"],
+        output_names=["logits", "k_cache_out", "v_cache_out"],
+        dynamic_axes={
+            "k_cache": {2: "kv_len"},
+            "v_cache": {2: "kv_len"},
+            "k_cache_out": {2: "kv_len_out"},
+            "v_cache_out": {2: "kv_len_out"},
+        },
+    )
+    return prefill_path, decode_path
+
+def export_vits_onnx(vq_model, onnx_dir: str):
+    """导出 v2 SoVITS 解码器"""
+    vq_model = vq_model.float().eval()
+    codes = torch.randint(0, 1024, (1, 1, 40))
+    text = torch.randint(0, 100, (1, 24))
+    refer = torch.randn(1, vq_model.spec_channels, 120)
+    return _export(
+        VitsDecoder(vq_model),
+        (codes, text, refer),
+        os.path.join(onnx_dir, VITS_DECODER_FILE),
+        input_names=["codes", "text", "refer"],
+        output_names=["audio"],
+        dynamic_axes={
+            "codes": {2: "tokens"},
+            "text": {1: "phonemes"},
+            "refer": {2: "refer_frames"},
+            "audio": {2: "samples"},
+        },
+    )
+
+def export_dit_onnx(vq_model, onnx_dir: str):
+    """导出 v4 DiT 单步"""
+    cfm = vq_model.cfm.float().eval()
+    frames = 200
+    x = torch.randn(1, cfm.in_channels, frames)
+    mu = torch.randn(1, vq_model.linear_mel.in_channels, frames) # 条件特征 (batch, text_dim, 帧数)
+    return _export(
+        DiTStep(cfm.estimator),
+        (x, torch.zeros_like(x), torch.LongTensor([frames]), torch.ones(1) * 0.5, torch.ones(1) * 0.25, mu),
+        os.path.join(onnx_dir, DIT_STEP_FILE),
+        input_names=["x", "prompt_x", "x_lens", "time", "dt", "mu"],
+        output_names=["velocity"],
+        dynamic_axes={
+            "x": {0: "batch", 2: "frames"},
+            "prompt_x": {0: "batch", 2: "frames"},
+            "x_lens": {0: "batch"},
+            "time": {0: "batch"},
+            "dt": {0: "batch"},
+            "mu": {0: "batch", 2: "frames"},
+            "velocity": {0: "batch", 1: "frames"},
+        },
+    )
+
+def export_vocoder_onnx():
+    """导出 v4 HiFiGAN 声码器"""
+    from mockvox.engine.v4.shared import SharedModels
+
+    onnx_dir = os.path.join(os.path.dirname(PRETRAINED_VOCODER_FILE), ONNX_DIR)
+    os.makedirs(onnx_dir, exist_ok=True)
+    return _export(
+        SharedModels._load_vocoder("cpu").float().eval(),
+        (torch.randn(1, 100, 64),),
+        os.path.join(onnx_dir, VOCODER_FILE),
+        input_names=["mel"],
+        output_names=["audio"],
+        dynamic_axes={"mel": {0: "batch", 2: "frames"}, "audio": {0: "batch", 2: "samples"}},
+    )
+
+def export_model_onnx(gpt_path: str, sovits_path: str):
+    """导出一个已训练模型的 GPT 与 SoVITS(v2 解码器 / v4 DiT) 到权重目录下的 onnx 子目录"""
+    from mockvox.engine.v4.inference import Inferencer
+
+    if quantize_enabled("cpu"):
+        raise ValueError("ONNX export requires unquantized weights, unset CPU_QUANTIZE")
+    inferencer = Inferencer(gpt_path, sovits_path, device="cpu", backend="torch")
+    onnx_dir = os.path.join(os.path.dirname(gpt_path), ONNX_DIR)
+    os.makedirs(onnx_dir, exist_ok=True)
+    export_t2s_onnx(inferencer.t2s_model, onnx_dir)
+    if inferencer.version == "v4":
+        export_dit_onnx(inferencer.vq_model, onnx_dir)
+    else:
+        export_vits_onnx(inferencer.vq_model, onnx_dir)
+    inferencer.close()
+    return onnx_dir
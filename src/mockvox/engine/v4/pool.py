@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+推理进程池: 常驻的推理工作进程各自绑定一组CPU, 按 model_id 亲和性分担模型.
+API 与 Celery 作为客户端, 通过本机 Unix socket 把合成请求发给负责该模型的工作进程.
+
+    python -m mockvox.engine.v4.pool
+"""
+import os
+import signal
+import time
+import hashlib
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client
+from typing import List, Optional
+import numpy as np
+
+from mockvox.config import get_config, POOL_SOCKET_PATH
+from mockvox.utils import MockVoxLogger
+
+cfg = get_config()
+
+def socket_path(index: int) -> str:
+    return os.path.join(POOL_SOCKET_PATH, f"worker-{index}.sock")
+
+def parse_cpus(spec: str) -> List[int]:
+    """解析 "0-7,12,14-15" 形式的CPU列表, 为空时取当前进程可用的全部CPU"""
+    if not spec.strip():
+        if hasattr(os, "sched_getaffinity"):
+            return sorted(os.sched_getaffinity(0))
+        return list(range(os.cpu_count() or 1))
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        elif part:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+def split_cpus(cpus: List[int], workers: int) -> List[List[int]]:
+    """把CPU平均切成连续的 workers 组; CPU不足时多个进程共用一个CPU"""
+    if workers > len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+    return [cpus[i * len(cpus) // workers:(i + 1) * len(cpus) // workers] for i in range(workers)]
+
+def parse_affinity(spec: str) -> dict:
+    """解析 "model_a=0,model_b=1" 形式的固定分配"""
+    affinity = {}
+    for part in spec.split(","):
+        if "=" in part:
+            model_id, index = part.split("=")
+            affinity[model_id.strip()] = int(index)
+    return affinity
+
+def route(model_id: str, workers: int) -> int:
+    """
+    model_id 对应的工作进程: 优先取 INFERENCE_POOL_AFFINITY 中的固定分配,
+    否则用 rendezvous 哈希, 同一模型总落在同一进程上(模型常驻复用), 进程数变化时只迁移少量模型.
+    """
+    index = parse_affinity(cfg.INFERENCE_POOL_AFFINITY).get(model_id)
+    if index is not None and 0 <= index < workers:
+        return index
+    return max(range(workers), key=lambda i: hashlib.md5(f"{model_id}:{i}".encode()).digest())
+
+class PoolWorker:
+    """
+    工作进程内的服务端: 每个连接一个线程, 同一进程内的并发请求共享常驻模型(及GPT连续批处理调度器).
+    协议: 客户端发送请求字典; 服务端逐块回复 ("chunk", 采样率, dtype) + 原始音频字节, 最后 ("done", 结果) 或 ("error", 信息).
+    """
+    def __init__(self, index: int, cpus: List[int]):
+        from mockvox.engine.v4.registry import model_registry
+        self.index = index
+        self.cpus = cpus
+        self.registry = model_registry
+
+    def serve(self):
+        path = socket_path(self.index)
+        if os.path.exists(path):
+            os.remove(path)
+        listener = Listener(path, family="AF_UNIX")
+        MockVoxLogger.info(f"Inference worker {self.index} listening on {path} | pid: {os.getpid()} | cpus: {self.cpus}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        results = None
+        try:
+            request = conn.recv()
+            op = request.get("op")
+            if op == "stats":
+                conn.send(("done", self.stats()))
+            elif op == "inference":
+                inferencer = self.registry.get(request["model_id"], request.get("gpt_path"), request.get("sovits_path"))
+                results = inferencer.inference(**request["kwargs"])
+                for sampling_rate, audio in results:
+                    conn.send(("chunk", int(sampling_rate), str(audio.dtype)))
+                    # 音频以原始字节传输, 不经过 pickle
+                    conn.send_bytes(np.ascontiguousarray(audio).tobytes())
+                conn.send(("done", None))
+            else:
+                conn.send(("error", f"unknown op: {op}"))
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            # 客户端已断开, 停止合成
+            pass
+        except Exception as e:
+            MockVoxLogger.error(f"Inference worker {self.index} request failed: {e}", exc_info=True)
+            try:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+            except OSError:
+                pass
+        finally:
+            if results is not None:
+                results.close()
+            conn.close()
+
+    def stats(self):
+        from mockvox.engine.v4.synthesis_cache import sentence_cache
+        from mockvox.engine.v4.frontend_cache import frontend_cache
+        return {
+            "pid": os.getpid(),
+            "cpus": self.cpus,
+            "model_registry": self.registry.stats(),
+            "t2s_decode": self.registry.decode_stats(),
+            "sentence_cache": sentence_cache.stats(),
+            "frontend_cache": frontend_cache.stats()
+        }
+
+def _worker_main(index: int, cpus: List[int]):
+    # 在加载模型、创建计算线程之前绑定CPU, 之后创建的线程继承绑定; 计算线程数与CPU数一致, 避免超额订阅
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    import torch
+    torch.set_num_threads(len(cpus))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由主进程统一退出
+    PoolWorker(index, cpus).serve()
+
+class InferencePool:
+    """启动并看护推理工作进程, 进程退出后重新拉起"""
+    def __init__(self, workers: Optional[int] = None, cpus: Optional[str] = None):
+        self.workers = workers or cfg.INFERENCE_POOL_WORKERS
+        self.cpu_sets = split_cpus(parse_cpus(cfg.INFERENCE_POOL_CPUS if cpus is None else cpus), self.workers)
+        self._context = mp.get_context("spawn")
+        self._processes = [None] * self.workers
+        self._stopped = threading.Event()
+
+    def start(self):
+        # socket 目录只允许当前用户访问
+        os.makedirs(POOL_SOCKET_PATH, mode=0o700, exist_ok=True)
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_main, args=(index, self.cpu_sets[index]), name=f"mockvox-inference-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+
+    def run_forever(self, interval: float = 5.0):
+        while not self._stopped.wait(interval):
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    MockVoxLogger.warning(f"Inference worker {index} exited ({process.exitcode}), restarting")
+                    self._spawn(index)
+
+    def stop(self):
+        self._stopped.set()
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for index, process in enumerate(self._processes):
+            if process is not None:
+                process.join(timeout=10)
+            if os.path.exists(socket_path(index)):
+                os.remove(socket_path(index))
+
+class PoolResults:
+    """
+    工作进程回传的 (采样率, 音频) 迭代器.
+    close() 在开始迭代前调用也会关闭连接(未启动的生成器 close 时不执行 finally)
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self._chunks = InferencePoolClient._receive(conn)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        self._chunks.close()
+        self._conn.close()
+
+class InferencePoolClient:
+    """按 model_id 把合成请求转发到对应的工作进程; 只依赖进程数与 socket 路径, 不持有状态"""
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers if workers is not None else cfg.INFERENCE_POOL_WORKERS
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _connect(self, index: int):
+        """工作进程重启或加载中时重试, 超时抛出 ConnectionError"""
+        deadline = time.monotonic() + cfg.INFERENCE_POOL_CONNECT_TIMEOUT
+        while True:
+            try:
+                return Client(socket_path(index), family="AF_UNIX")
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"inference worker {index} unavailable: {e}")
+                time.sleep(0.2)
+
+    def inference(self, model_id: str, gpt_path=None, sovits_path=None, **kwargs):
+        """
+        参数与 Inferencer.inference 相同. 连接和发送请求在调用时完成(连接失败立即抛出),
+        返回逐个产出 (采样率, 音频) 的 PoolResults
+        """
+        conn = self._connect(route(model_id, self.workers))
+        try:
+            conn.send({
+                "op": "inference",
+                "model_id": model_id,
+                "gpt_path": str(gpt_path) if gpt_path else None,
+                "sovits_path": str(sovits_path) if sovits_path else None,
+                "kwargs": kwargs
+            })
+        except BaseException:
+            conn.close()
+            raise
+        return PoolResults(conn)
+
+    @staticmethod
+    def _receive(conn):
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "chunk":
+                    yield message[1], np.frombuffer(conn.recv_bytes(), dtype=message[2])
+                elif message[0] == "done":
+                    return
+                else:
+                    raise RuntimeError(message[1])
+        finally:
+            conn.close()
+
+    def stats(self):
+        stats = {}
+        for index in range(self.workers):
+            try:
+                conn = Client(socket_path(index), family="AF_UNIX")
+                try:
+                    conn.send({"op": "stats"})
+                    stats[index] = conn.recv()[1]
+                finally:
+                    conn.close()
+            except OSError:
+                stats[index] = {"alive": False}
+        return stats
+
+inference_pool = InferencePoolClient()
+
+def main():
+    if cfg.INFERENCE_POOL_WORKERS <= 0:
+        raise SystemExit("set INFERENCE_POOL_WORKERS > 0 to run the inference pool")
+    pool = InferencePool()
+    signal.signal(signal.SIGTERM, lambda *_: pool.stop())
+    pool.start()
+    MockVoxLogger.info(f"Inference pool started: {pool.workers} workers | cpus: {pool.cpu_sets}")
+    try:
+        pool.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""推理精度: 模型与特征的浮点类型, 以及 CPU 上 Linear 层的 int8 动态量化"""
+import torch
+from torch import nn
+
+from mockvox.config import get_config
+from mockvox.utils import MockVoxLogger
+
+cfg = get_config()
+
+PRECISIONS = ("auto", "fp16", "bf16", "fp32")
+CPU_QUANTIZE_MODES = ("none", "int8")
+
+_DTYPES = {
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "fp32": torch.float32
+}
+
+def quantize_enabled(device) -> bool:
+    """CPU_QUANTIZE=int8 且在 CPU 上推理"""
+    return cfg.CPU_QUANTIZE == "int8" and str(device) == "cpu"
+
+def inference_dtype(device) -> torch.dtype:
+    """
+    INFERENCE_PRECISION=auto 时 GPU 用 fp16, CPU 用 fp32 (CPU 上很多 fp16 算子很慢或不支持).
+    int8 动态量化的 Linear 只接受 fp32 激活, 开启量化时 CPU 固定为 fp32.
+    """
+    precision = cfg.INFERENCE_PRECISION
+    if precision not in PRECISIONS:
+        MockVoxLogger.warning(f"Unknown INFERENCE_PRECISION {precision}, using auto")
+        precision = "auto"
+    if quantize_enabled(device):
+        if precision not in ("auto", "fp32"):
+            MockVoxLogger.warning(f"CPU_QUANTIZE=int8 requires fp32 activations, ignoring INFERENCE_PRECISION={precision}")
+        return torch.float32
+    if precision == "auto":
+        return torch.float32 if str(device) == "cpu" else torch.float16
+    return _DTYPES[precision]
+
+def tensor_bytes(*modules: nn.Module) -> int:
+    """
+    模块 state_dict 中全部张量的字节数. 动态量化 Linear 的 int8 权重打包在 _packed_params 中,
+    不属于 parameters()/buffers(), 只有 state_dict 会解包出来; 同一块内存只计一次
+    """
+    seen = set()
+    total = 0
+    def visit(value):
+        nonlocal total
+        if isinstance(value, torch.Tensor):
+            key = (str(value.device), value.data_ptr())
+            if key not in seen:
+                seen.add(key)
+                total += value.numel() * value.element_size()
+        elif isinstance(value, (tuple, list)):
+            for item in value:
+                visit(item)
+    for module in modules:
+        for value in module.state_dict().values():
+            visit(value)
+    return total
+
+def quantize_linear(module: nn.Module) -> nn.Module:
+    """把 module 中的 nn.Linear 原地替换为 int8 动态量化版本(权重int8, 激活按批次动态量化)"""
+    return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""参考音频特征缓存"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+import torch
+import torchaudio
+import librosa
+
+from mockvox.config import get_config, REF_CACHE_PATH
+from mockvox.nn import spectrogram_torch, mel_spectrogram_torch
+from mockvox.utils import MockVoxLogger, i18n
+from mockvox.engine.v4.shared import SharedModels
+from mockvox.engine.v4.precision import inference_dtype
+
+cfg = get_config()
+
+class ReferenceCache:
+    """
+    参考音频特征缓存, 以音频文件内容的 sha256 为键.
+    内存中按 LRU 保留最近使用的条目, 同时落盘到 REF_CACHE_PATH 供其他进程复用;
+    磁盘上读取时更新文件修改时间, 写入后按修改时间淘汰最久未用的文件, 使总大小不超过 disk_capacity 字节.
+    每个条目是 {特征名: CPU Tensor} 字典, 不同参数下的特征以不同特征名共存.
+    """
+    def __init__(self, capacity: int, cache_dir: str, disk_capacity: int):
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.disk_capacity = disk_capacity
+        self._entries = OrderedDict()
+        self._digests = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def digest(self, path) -> str:
+        """文件内容哈希, 按 (路径, 修改时间, 大小) 记忆"""
+        stat = os.stat(path)
+        memo_key = (str(path), stat.st_mtime, stat.st_size)
+        with self._lock:
+            if memo_key in self._digests:
+                return self._digests[memo_key]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self._lock:
+            if len(self._digests) > 4096:
+                self._digests.clear()
+            self._digests[memo_key] = digest
+        return digest
+
+    def _file(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.pt")
+
+    def get(self, digest: str) -> dict:
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return self._entries[digest]
+        entry = {}
+        cache_file = self._file(digest)
+        if self.disk_capacity > 0 and os.path.exists(cache_file):
+            try:
+                entry = torch.load(cache_file, map_location="cpu")
+                os.utime(cache_file)
+            except Exception:
+                MockVoxLogger.warning(f"Broken reference cache file: {cache_file}")
+                entry = {}
+        with self._lock:
+            if entry:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            self._store(digest, entry)
+        return entry
+
+    def put(self, digest: str, entry: dict):
+        with self._lock:
+            self._store(digest, entry)
+        if self.disk_capacity <= 0:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 先写临时文件再替换, 避免其他进程读到写了一半的文件
+        tmp_file = f"{self._file(digest)}.{os.getpid()}.tmp"
+        torch.save(entry, tmp_file)
+        os.replace(tmp_file, self._file(digest))
+        self._evict()
+
+    def _store(self, digest, entry):
+        self._entries[digest] = entry
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _disk_entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".pt"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_capacity:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        disk_entries = self._disk_entries()
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "disk_entries": len(disk_entries),
+                "disk_size": sum(size for _, size, _ in disk_entries),
+                "disk_capacity": self.disk_capacity,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+reference_cache = ReferenceCache(cfg.REF_CACHE_SIZE, REF_CACHE_PATH, cfg.REF_CACHE_DISK_SIZE)
+
+class ReferenceExtractor:
+    """
+    参考音频中与音色模型无关的特征: HuBERT 特征、线性频谱、(v4) 归一化 mel 谱.
+    特征按推理精度 dtype 保存, 特征名包含相关超参数与精度, 超参数或精度不同的模型不会误用缓存.
+    """
+    def __init__(self, hps, device: str, dtype: Optional[torch.dtype] = None):
+        self.hps = hps
+        self.device = device
+        self.dtype = dtype or inference_dtype(device)
+        self.version = hps.model.version
+        data = hps.data
+        self.hop_length = data.hop_length_v4 if self.version == "v4" else data.hop_length
+        precision = str(self.dtype).replace("torch.", "")
+        self.ssl_name = f"ssl_content-{int(data.sampling_rate)}-{precision}"
+        self.refer_name = f"refer-{int(data.sampling_rate)}-{data.filter_length}-{self.hop_length}-{data.win_length}-{precision}"
+        self.mel_name = (
+            f"mel2-{data.filter_length}-{data.win_length}-{data.hop_length_v4}-{data.n_mel_channels_v4}-"
+            f"{int(data.sampling_rate)}-{data.mel_fmin}-{data.mel_fmax}-{precision}"
+        ) if self.version == "v4" else None
+        self.resample_transform_dict = {}
+
+    def load(self, ref_wav_path, digest: Optional[str] = None) -> dict:
+        """返回 {"ssl_content", "refer", "mel2"(v4)}, 缺失的特征即时计算并写回缓存"""
+        digest = digest or reference_cache.digest(ref_wav_path)
+        entry = reference_cache.get(digest)
+        names = [self.ssl_name, self.refer_name] + ([self.mel_name] if self.mel_name else [])
+        missing = [name for name in names if name not in entry]
+        if missing:
+            entry = dict(entry)
+            if self.ssl_name in missing:
+                entry[self.ssl_name] = self.extract_ssl(ref_wav_path)
+            if self.refer_name in missing:
+                entry[self.refer_name] = self.extract_refer(ref_wav_path)
+            if self.mel_name in missing:
+                entry[self.mel_name] = self.extract_mel(ref_wav_path)
+            reference_cache.put(digest, entry)
+        features = {
+            "ssl_content": entry[self.ssl_name],
+            "refer": entry[self.refer_name]
+        }
+        if self.mel_name:
+            features["mel2"] = entry[self.mel_name]
+        return features
+
+    @torch.no_grad()
+    def extract_ssl(self, ref_wav_path):
+        dtype = self.dtype
+        zero_wav_torch = torch.zeros(
+            int(self.hps.data.sampling_rate * 0.3),
+            dtype=dtype,
+        ).to(self.device)
+        wav16k, sr = librosa.load(ref_wav_path, sr=16000)
+        if wav16k.shape[0] > 160000 or wav16k.shape[0] < 48000:
+            MockVoxLogger.error(i18n("参考音频在3~10秒范围外，请更换！"))
+            raise OSError(i18n("参考音频在3~10秒范围外，请更换！"))
+        wav16k = torch.from_numpy(wav16k).to(dtype).to(self.device)
+        wav16k = torch.cat([wav16k, zero_wav_torch])
+        ssl_model = SharedModels.ssl_model(self.device)
+        ssl_content = ssl_model.model(wav16k.unsqueeze(0))["last_hidden_state"].transpose(1, 2)
+        return ssl_content.cpu()
+
+    def extract_refer(self, ref_wav_path):
+        audio, sampling_rate = librosa.load(ref_wav_path, sr=int(self.hps.data.sampling_rate))
+        audio = torch.FloatTensor(audio)
+        maxx=audio.abs().max()
+        if(maxx>1):audio/=min(2,maxx)
+        spec = spectrogram_torch(
+            audio.unsqueeze(0),
+            self.hps.data.filter_length,
+            self.hop_length,
+            self.hps.data.win_length,
+            center=False,
+        )
+        return spec.to(self.dtype)
+
+    def extract_mel(self, ref_wav_path):
+        ref_audio, sr = torchaudio.load(ref_wav_path)
+        ref_audio = ref_audio.to(self.device).float()
+        if ref_audio.shape[0] == 2:
+            ref_audio = ref_audio.mean(0).unsqueeze(0)
+        tgt_sr = 32000
+        if sr != tgt_sr:
+            key="%s-%s"%(sr,tgt_sr)
+            if key not in self.resample_transform_dict:
+                self.resample_transform_dict[key] = torchaudio.transforms.Resample(sr, tgt_sr).to(self.device)
+            ref_audio = self.resample_transform_dict[key](ref_audio)
+        mel2 = mel_spectrogram_torch(
+            ref_audio,
+            n_fft=self.hps.data.filter_length,
+            win_size=self.hps.data.win_length,
+            hop_size=self.hps.data.hop_length_v4,
+            num_mels=self.hps.data.n_mel_channels_v4,
+            sampling_rate=self.hps.data.sampling_rate,
+            fmin=self.hps.data.mel_fmin,
+            fmax=self.hps.data.mel_fmax,
+            center=False,
+        )
+        # 与 Inferencer.norm_spec 一致
+        spec_min = -12
+        spec_max = 2
+        mel2 = (mel2 - spec_min) / (spec_max - spec_min) * 2 - 1
+        return mel2.to(self.dtype).cpu()
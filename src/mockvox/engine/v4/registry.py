@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""常驻模型注册表"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from mockvox.config import get_config, WEIGHTS_PATH, GPT_HALF_WEIGHTS_FILE, SOVITS_HALF_WEIGHTS_FILE
+from mockvox.utils import MockVoxLogger, i18n
+from mockvox.engine.v4.inference import Inferencer
+from mockvox.engine.v4.shared import SharedModels
+
+cfg = get_config()
+
+class _Entry:
+    def __init__(self, inferencer, size, signature):
+        self.inferencer = inferencer
+        self.size = size
+        self.signature = signature
+
+class ModelRegistry:
+    """
+    按 model_id 缓存已加载的 Inferencer, 避免每次请求重复 torch.load 模型权重.
+    超出内存预算时按 LRU 淘汰; 权重文件更新(如继续训练)后自动重新加载.
+    淘汰只是移出注册表, 不关闭实例: 仍在使用它的请求照常完成, 之后由GC回收(见 Inferencer.close).
+    """
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def resolve_paths(model_id: str):
+        gpt_path = Path(WEIGHTS_PATH) / model_id / GPT_HALF_WEIGHTS_FILE
+        sovits_path = Path(WEIGHTS_PATH) / model_id / SOVITS_HALF_WEIGHTS_FILE
+        return gpt_path, sovits_path
+
+    def get(
+        self,
+        model_id: str,
+        gpt_path: Optional[str] = None,
+        sovits_path: Optional[str] = None
+    ) -> Inferencer:
+        """获取常驻的 Inferencer, 未命中时加载"""
+        default_gpt, default_sovits = self.resolve_paths(model_id)
+        gpt_path = Path(gpt_path or default_gpt)
+        sovits_path = Path(sovits_path or default_sovits)
+        if not gpt_path.exists():
+            raise FileNotFoundError(f"{i18n('路径错误! 找不到GPT模型')}: {gpt_path}")
+        if not sovits_path.exists():
+            raise FileNotFoundError(f"{i18n('路径错误! 找不到SOVITS模型')}: {sovits_path}")
+        signature = (os.path.getmtime(gpt_path), os.path.getmtime(sovits_path))
+
+        with self._lock:
+            entry = self._lookup(model_id, signature)
+            if entry is not None:
+                return entry.inferencer
+            loading_lock = self._loading_locks.setdefault(model_id, threading.Lock())
+
+        # 同一模型只加载一次, 其余请求等待加载完成后重新查找;
+        # 每个模型的加载锁一直保留, 加载失败后等待者与新请求仍在同一把锁上排队, 不会并发加载
+        with loading_lock:
+            with self._lock:
+                entry = self._lookup(model_id, signature)
+                if entry is not None:
+                    return entry.inferencer
+                self.misses += 1
+
+            inferencer = Inferencer(gpt_path, sovits_path)
+            size = inferencer.memory_footprint()
+            MockVoxLogger.info(
+                f"Model loaded: {model_id} | version: {inferencer.version} | "
+                f"size: {size / 1024 / 1024:.1f}MB"
+            )
+
+            with self._lock:
+                self._entries[model_id] = _Entry(inferencer, size, signature)
+                self._evict_over_budget(keep=model_id)
+            return inferencer
+
+    def _lookup(self, model_id, signature):
+        entry = self._entries.get(model_id)
+        if entry is None:
+            return None
+        if entry.signature != signature:
+            # 权重已更新, 丢弃旧实例
+            del self._entries[model_id]
+            return None
+        self._entries.move_to_end(model_id)
+        self.hits += 1
+        return entry
+
+    def _evict_over_budget(self, keep):
+        while self.memory_usage() > self.memory_budget and len(self._entries) > 1:
+            model_id = next(iter(self._entries))
+            if model_id == keep:
+                break
+            self._entries.pop(model_id)
+            self.evictions += 1
+            MockVoxLogger.info(f"Model evicted: {model_id}")
+
+    def memory_usage(self):
+        return sum(entry.size for entry in self._entries.values())
+
+    def evict(self, model_id: str):
+        with self._lock:
+            entry = self._entries.pop(model_id, None)
+            if entry is not None:
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        SharedModels.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": list(self._entries.keys()),
+                "memory_usage": self.memory_usage(),
+                "memory_budget": self.memory_budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def scheduler_stats(self):
+        """各常驻模型的GPT调度器指标"""
+        with self._lock:
+            return {
+                model_id: entry.inferencer.scheduler.stats()
+                for model_id, entry in self._entries.items()
+                if entry.inferencer.scheduler is not None
+            }
+
+    def decode_stats(self):
+        """各常驻模型的GPT解码循环指标"""
+        with self._lock:
+            return {
+                model_id: entry.inferencer.decode_stats.stats()
+                for model_id, entry in self._entries.items()
+            }
+
+    def speculative_stats(self):
+        """各常驻模型的投机解码指标"""
+        with self._lock:
+            return {
+                model_id: entry.inferencer.speculative.stats()
+                for model_id, entry in self._entries.items()
+                if entry.inferencer.speculative is not None
+            }
+
+model_registry = ModelRegistry(cfg.MODEL_CACHE_MEMORY)
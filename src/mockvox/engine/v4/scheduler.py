@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""GPT(T2S) 连续批处理调度器"""
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+import torch
+
+from mockvox.nn.AR.utils import sample, token_histogram, update_token_histogram
+from mockvox.utils import MockVoxLogger
+
+# 与 infer_panel_naive 一致: 至少生成的token数、最多解码步数
+MIN_TOKENS = 11
+MAX_STEPS = 1500
+
+class _Sequence:
+    def __init__(self, x, prompt, bert_feature, top_k, top_p, temperature, repetition_penalty, early_stop_num, generator=None):
+        self.x = x
+        self.prompt = prompt
+        self.bert_feature = bert_feature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.temperature = temperature
+        self.repetition_penalty = repetition_penalty
+        self.early_stop_num = early_stop_num
+        self.generator = generator
+        self.future = Future()
+        self.submit_time = time.perf_counter()
+        self.prefix_len = prompt.shape[-1]
+        self.src_len = 0
+        self.y_len = 0
+        self.step = 0
+        self.tokens = []
+
+class T2SScheduler:
+    """
+    持有一个 Text2SemanticDecoder, 在后台线程中做迭代级调度:
+    每个解码步之间接纳新的请求进入批, 生成EOS的序列立即退出批.
+    各序列的KV缓存放在预分配的 (max_batch_size, max_len, hidden) 槽位中, 活跃序列始终占据前若干行.
+    采样参数 top_k/top_p/temperature 以逐行向量传入 logits_to_probs, 各序列的随机数生成器逐行使用.
+    """
+    def __init__(self, t2s_model, max_batch_size: int, max_len: int):
+        self.t2s_model = t2s_model
+        self.max_batch_size = max_batch_size
+        self.max_len = max_len
+        self.EOS = t2s_model.EOS
+        self._pending = queue.Queue()
+        self._active = []
+        self._k_cache = None
+        self._v_cache = None
+        self._y_buffer = None
+        self._token_counts = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # 指标
+        self._ttft = deque(maxlen=1000)
+        self._occupancy_sum = 0.0
+        self.steps = 0
+        self.tokens = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def fits(self, x_len: int, prompt_len: int, early_stop_num: int = -1) -> bool:
+        """序列在最坏情况下是否放得进KV缓存槽位"""
+        max_new = min(early_stop_num, MAX_STEPS) if early_stop_num != -1 else MAX_STEPS
+        return x_len + prompt_len + max_new + 1 <= self.max_len
+
+    def submit(
+        self,
+        x: torch.LongTensor,
+        prompt: torch.LongTensor,
+        bert_feature: torch.Tensor,
+        top_k: int = 15,
+        top_p: float = 1.0,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        early_stop_num: int = -1,
+        generator: Optional[torch.Generator] = None
+    ) -> Future:
+        """
+        x: (1, 音素数) 全部文本token, prompt: (1, 提示长度) 参考音频token, bert_feature: (1, 1024, 音素数)
+        generator 为该序列采样用的随机数生成器, 与同批其他序列互不影响.
+        返回的 Future 结果为生成的语义token, 形状 (1, 1, T)
+        """
+        seq = _Sequence(x, prompt, bert_feature, top_k, top_p, temperature, repetition_penalty, early_stop_num, generator)
+        self._ensure_running()
+        self._pending.put(seq)
+        return seq.future
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="t2s-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """处理完已提交的请求后退出后台线程"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._pending.put(None)
+
+    def _loop(self):
+        stopping = False
+        with torch.no_grad():
+            while True:
+                if not self._active:
+                    if stopping:
+                        break
+                    seq = self._pending.get()
+                    if seq is None:
+                        break
+                    self._admit(seq)
+                while len(self._active) < self.max_batch_size:
+                    try:
+                        seq = self._pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    if seq is None:
+                        stopping = True
+                        break
+                    self._admit(seq)
+                if self._active:
+                    self._step()
+
+    def _allocate(self, k_cache):
+        batch, hidden = self.max_batch_size, k_cache[0].shape[-1]
+        dtype, device = k_cache[0].dtype, k_cache[0].device
+        self._k_cache = [torch.zeros((batch, self.max_len, hidden), dtype=dtype, device=device) for _ in k_cache]
+        self._v_cache = [torch.zeros((batch, self.max_len, hidden), dtype=dtype, device=device) for _ in k_cache]
+        self._y_buffer = torch.zeros((batch, self.max_len), dtype=torch.long, device=device)
+        self._token_counts = torch.zeros((batch, self.t2s_model.vocab_size), dtype=torch.int32, device=device)
+
+    def _admit(self, seq: _Sequence):
+        if seq.future.cancelled():
+            return
+        start = time.perf_counter()
+        try:
+            logits, k_cache, v_cache, y_len = self.t2s_model.prefill(seq.x, seq.prompt, seq.bert_feature)
+            if self._k_cache is None:
+                self._allocate(k_cache)
+            row = len(self._active)
+            seq.src_len = k_cache[0].shape[1]
+            seq.y_len = y_len
+            for i in range(len(k_cache)):
+                self._k_cache[i][row, :seq.src_len].copy_(k_cache[i][0])
+                self._v_cache[i][row, :seq.src_len].copy_(v_cache[i][0])
+            prompt = seq.prompt[0].long()
+            self._y_buffer[row, :seq.prefix_len].copy_(prompt)
+            # 重复惩罚用的token计数, 每步累加
+            self._token_counts[row].copy_(token_histogram(seq.prompt, self.t2s_model.vocab_size)[0])
+            self._active.append(seq)
+            self._sample([seq], logits)
+        except Exception as e:
+            self.failed += 1
+            seq.future.set_exception(e)
+            if seq in self._active:
+                self._retire(seq)
+        self.busy_time += time.perf_counter() - start
+
+    def _step(self):
+        start = time.perf_counter()
+        active = list(self._active)
+        n = len(active)
+        try:
+            device = self._y_buffer.device
+            tokens = self._y_buffer[:n].gather(
+                1, torch.tensor([[seq.prefix_len + seq.step - 1] for seq in active], device=device)
+            )
+            positions = torch.tensor([seq.y_len + seq.step - 1 for seq in active], device=device)
+            cache_positions = torch.tensor([seq.src_len + seq.step - 1 for seq in active], device=device)
+            kv_len = int(cache_positions.max()) + 1
+            attn_mask = (torch.arange(kv_len, device=device).unsqueeze(0) > cache_positions.unsqueeze(1)).view(n, 1, 1, kv_len)
+
+            xy_pos = self.t2s_model.embed_next_tokens(tokens, positions)
+            xy_dec = self.t2s_model.t2s_transformer.decode_next_token_slots(
+                xy_pos,
+                [k.narrow(0, 0, n) for k in self._k_cache],
+                [v.narrow(0, 0, n) for v in self._v_cache],
+                cache_positions,
+                kv_len,
+                attn_mask,
+            )
+            logits = self.t2s_model.ar_predict_layer(xy_dec[:, -1])
+            self._sample(active, logits)
+        except Exception as e:
+            MockVoxLogger.error(f"T2S scheduler step failed: {e}")
+            for seq in active:
+                self.failed += 1
+                if not seq.future.done():
+                    seq.future.set_exception(e)
+            self._active.clear()
+        self.steps += 1
+        self._occupancy_sum += n / self.max_batch_size
+        self.busy_time += time.perf_counter() - start
+
+    def _sample(self, active, logits):
+        n = len(active)
+        device = logits.device
+        for row, seq in enumerate(active):
+            if seq.step < MIN_TOKENS:   ###至少预测出10个token不然不给停止（0.4s）
+                logits[row, self.EOS] = -float("Inf")
+        offset = self._active.index(active[0])
+        token_counts = self._token_counts[offset:offset + n]
+        generators = [seq.generator for seq in active]
+        samples = sample(
+            logits,
+            token_counts=token_counts,
+            top_k=torch.tensor([seq.top_k for seq in active], device=device),
+            top_p=torch.tensor([seq.top_p for seq in active], device=device),
+            temperature=torch.tensor([seq.temperature for seq in active], device=device),
+            repetition_penalty=torch.tensor([seq.repetition_penalty for seq in active], device=device),
+            generator=generators if any(g is not None for g in generators) else None,
+        )[0]
+        update_token_histogram(token_counts, samples)
+        argmax = torch.argmax(logits, dim=-1)
+        now = time.perf_counter()
+
+        finished = []
+        for row, seq in enumerate(active):
+            token = int(samples[row, 0])
+            if seq.step == 0:
+                self._ttft.append(now - seq.submit_time)
+            self._y_buffer[offset + row, seq.prefix_len + seq.step] = token
+            seq.tokens.append(token)
+            seq.step += 1
+            self.tokens += 1
+            stop = token == self.EOS or int(argmax[row]) == self.EOS or seq.step >= MAX_STEPS
+            if seq.early_stop_num != -1 and seq.step > seq.early_stop_num:
+                stop = True
+            if stop:
+                finished.append(seq)
+
+        for seq in finished:
+            # 与 infer_panel_naive 一致, 丢弃最后一个token
+            pred_semantic = torch.LongTensor(seq.tokens[:-1]).to(device).view(1, 1, -1)
+            self._retire(seq)
+            self.completed += 1
+            if not seq.future.cancelled():
+                seq.future.set_result(pred_semantic)
+
+    def _retire(self, seq: _Sequence):
+        """移出批, 最后一行搬到空出的槽位, 保持活跃序列连续"""
+        row = self._active.index(seq)
+        last = len(self._active) - 1
+        if row != last:
+            for i in range(len(self._k_cache)):
+                self._k_cache[i][row].copy_(self._k_cache[i][last])
+                self._v_cache[i][row].copy_(self._v_cache[i][last])
+            self._y_buffer[row].copy_(self._y_buffer[last])
+            self._token_counts[row].copy_(self._token_counts[last])
+            self._active[row] = self._active[last]
+        self._active.pop()
+
+    def stats(self):
+        ttft = sorted(self._ttft)
+        return {
+            "queue_depth": self._pending.qsize(),
+            "active": len(self._active),
+            "max_batch_size": self.max_batch_size,
+            "batch_occupancy": self._occupancy_sum / self.steps if self.steps else 0.0,
+            "ttft_avg": sum(ttft) / len(ttft) if ttft else 0.0,
+            "ttft_p95": ttft[int(len(ttft) * 0.95)] if ttft else 0.0,
+            "tokens_per_second": self.tokens / self.busy_time if self.busy_time else 0.0,
+            "steps": self.steps,
+            "tokens": self.tokens,
+            "completed": self.completed,
+            "failed": self.failed
+        }
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""推理共享组件: 与音色无关的模型(声码器、CNHubert、BERT)在进程内只加载一次"""
+import os
+import threading
+import torch
+
+from mockvox.models import CNHubert
+from mockvox.models.v2.SynthesizerTrn import Generator
+from mockvox.config import PRETRAINED_VOCODER_FILE, get_config
+from mockvox.utils import MockVoxLogger
+from mockvox.engine.v4.bert import BertFeatureExtractor
+from mockvox.engine.v4.precision import inference_dtype
+from mockvox.engine.v4.onnx_backend import ONNX_DIR, VOCODER_FILE, OnnxVocoder, load_session
+
+cfg = get_config()
+
+class SharedModels:
+    """进程级共享模型缓存, 所有 Inferencer 共用同一份实例"""
+    _lock = threading.Lock()
+    _vocoders = {}
+    _ssl_models = {}
+    _berts = {}
+
+    @classmethod
+    def vocoder(cls, device, backend=None):
+        """v4 HiFiGAN 声码器, backend 为 onnx 时在 CPU 上优先使用导出的 ONNX 模型"""
+        backend = backend or cfg.INFERENCE_BACKEND
+        key = (device, backend)
+        with cls._lock:
+            if key not in cls._vocoders:
+                vocoder = None
+                if backend == "onnx" and device == "cpu":
+                    vocoder = cls._load_onnx_vocoder()
+                cls._vocoders[key] = vocoder if vocoder is not None else cls._load_vocoder(device)
+            return cls._vocoders[key]
+
+    @classmethod
+    def ssl_model(cls, device):
+        """CNHubert 语音特征提取模型"""
+        with cls._lock:
+            if device not in cls._ssl_models:
+                ssl_model = CNHubert()
+                ssl_model.eval()
+                cls._ssl_models[device] = ssl_model.to(dtype=inference_dtype(device)).to(device)
+            return cls._ssl_models[device]
+
+    @classmethod
+    def bert(cls, model_name, device):
+        """BERT 特征提取器, model_name 为 PRETRAINED_PATH 下的相对路径"""
+        key = (model_name, device)
+        with cls._lock:
+            if key not in cls._berts:
+                cls._berts[key] = BertFeatureExtractor(model_name, device)
+            return cls._berts[key]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._vocoders.clear()
+            cls._ssl_models.clear()
+            cls._berts.clear()
+
+    @staticmethod
+    def _build_vocoder():
+        return Generator(
+            initial_channel=100,
+            resblock="1",
+            resblock_kernel_sizes=[3, 7, 11],
+            resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
+            upsample_rates=[10, 6, 2, 2, 2],
+            upsample_initial_channel=512,
+            upsample_kernel_sizes=[20, 12, 4, 4, 4],
+            gin_channels=0,is_bias=True
+        )
+
+    @classmethod
+    def _load_vocoder(cls, device):
+        hifigan_model = cls._build_vocoder()
+        hifigan_model.eval()
+        hifigan_model.remove_weight_norm()
+        state_dict_g = torch.load(PRETRAINED_VOCODER_FILE, map_location="cpu")
+        MockVoxLogger.info(f"loading vocoder {hifigan_model.load_state_dict(state_dict_g)}")
+        return hifigan_model.to(dtype=inference_dtype(device)).to(device)
+
+    @classmethod
+    def _load_onnx_vocoder(cls):
+        session = load_session(os.path.join(os.path.dirname(PRETRAINED_VOCODER_FILE), ONNX_DIR, VOCODER_FILE))
+        if session is None:
+            return None
+        return OnnxVocoder(session, cls._build_vocoder())
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""GPT(T2S) 投机解码"""
+import time
+import threading
+import torch
+
+from mockvox.models.v2.t2s_model import DecodeMetrics
+from mockvox.nn.AR.utils import (
+    logits_to_probs,
+    multinomial_sample_one_no_sync,
+    token_histogram,
+    update_token_histogram
+)
+
+# 与 infer_panel_naive 一致: 至少生成的token数、最多解码步数
+MIN_TOKENS = 11
+MAX_STEPS = 1500
+
+class SpeculativeDecoder:
+    """
+    以 GPT 的前 draft_layers 层加共用的 ar_predict_layer 作为草稿模型, 每轮连续提出 draft_tokens 个token,
+    再由完整模型一次前向并行校验. 草稿层与完整模型前几层是同一组权重, 两者共用同一份KV缓存.
+    接受规则: 以 min(1, p/q) 的概率接受草稿token, 拒绝时从 max(0, p-q) 重新采样,
+    输出分布与逐token采样相同(p/q 为经过重复惩罚、top-k/top-p、温度后的分布).
+    """
+    def __init__(self, t2s_model, draft_layers: int, draft_tokens: int):
+        self.t2s_model = t2s_model
+        self.draft_layers = max(1, min(draft_layers, t2s_model.num_layers - 1))
+        self.draft_tokens = max(1, draft_tokens)
+        self.EOS = t2s_model.EOS
+        self._lock = threading.Lock()
+        # 指标
+        self.rounds = 0
+        self.drafted = 0
+        self.accepted = 0
+        self.tokens = 0
+        self.busy_time = 0.0
+
+    def generate(self, x, prompt, bert_feature, **kwargs) -> torch.LongTensor:
+        """返回生成的语义token (1, T), 与 infer_panel_naive 一致丢弃最后一个token"""
+        y = prompt
+        for y, _, _ in self.stream(x, prompt, bert_feature, **kwargs):
+            pass
+        return y[:, prompt.shape[1]:-1]
+
+    @torch.no_grad()
+    def stream(
+        self,
+        x: torch.LongTensor,
+        prompt: torch.LongTensor,
+        bert_feature: torch.Tensor,
+        top_k: int = 15,
+        top_p: float = 1.0,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        early_stop_num: int = -1,
+        generator: torch.Generator = None
+    ):
+        """
+        x: (1, 音素数) 全部文本token, prompt: (1, 提示长度) 参考音频token, bert_feature: (1, 1024, 音素数)
+        与 infer_panel_naive_stream 相同, 每生成一个token产出 (当前y, idx, 是否结束);
+        generator 为采样与接受判定所用的随机数生成器
+        """
+        model = self.t2s_model
+        start = time.perf_counter()
+        metrics = DecodeMetrics(model.decode_hook)
+        params = dict(top_k=top_k, top_p=top_p, temperature=temperature, repetition_penalty=repetition_penalty)
+        max_new = min(early_stop_num, MAX_STEPS) if early_stop_num != -1 else MAX_STEPS
+
+        logits, k_cache, v_cache, y_len = model.prefill(x, prompt, bert_feature)
+        src_len = k_cache[0].shape[1]
+        max_len = src_len + max_new + self.draft_tokens + 1
+        k_cache = [self._static_cache(k, max_len) for k in k_cache]
+        v_cache = [self._static_cache(v, max_len) for v in v_cache]
+
+        y = prompt.long()
+        token_counts = token_histogram(y, model.vocab_size)
+        rounds = drafted = accepted = 0
+        pending = []
+        try:
+            probs, argmax = self._probs(logits, 0, token_counts, params)
+            token = multinomial_sample_one_no_sync(probs, generator).long()
+            while True:
+                # 输出一个token, 判断是否结束
+                y = torch.cat([y, token], dim=1)
+                update_token_histogram(token_counts, token)
+                n = y.shape[1] - prompt.shape[1]
+                stop = int(token) == self.EOS or int(argmax) == self.EOS or (early_stop_num != -1 and n > early_stop_num)
+                if stop or n >= MAX_STEPS:
+                    stop_reason = "eos" if int(token) == self.EOS or int(argmax) == self.EOS else \
+                        "early_stop" if stop else "max_steps"
+                    metrics.finish(rounds + 1, n, stop_reason, prompt.shape[1])
+                yield y, n - 1, stop or n >= MAX_STEPS
+                if stop or n >= MAX_STEPS:
+                    break
+                if pending:
+                    token, argmax = pending.pop(0)
+                    continue
+
+                # 草稿: 前 draft_layers 层逐token生成
+                pos = n - 1 # 最后一个token在生成段中的位置
+                drafts, draft_probs = [], []
+                draft_counts = token_counts.clone()
+                draft = token
+                for j in range(self.draft_tokens):
+                    h = model.embed_next_tokens(draft, torch.tensor([y_len + pos + j]))
+                    for i in range(self.draft_layers):
+                        h = model.t2s_transformer.blocks[i].decode_next_token_static(
+                            h, k_cache[i], v_cache[i], src_len + pos + j
+                        )
+                    q, _ = self._probs(model.ar_predict_layer(h[:, -1]), n + j, draft_counts, params)
+                    draft = multinomial_sample_one_no_sync(q, generator).long()
+                    update_token_histogram(draft_counts, draft)
+                    drafts.append(draft)
+                    draft_probs.append(q)
+                    if int(draft) == self.EOS:
+                        break
+
+                # 校验: 完整模型一次前向处理 [最后一个token, 草稿...]
+                g = len(drafts)
+                tokens = torch.cat([token] + drafts, dim=1)
+                positions = y_len + pos + torch.arange(g + 1)
+                h = model.embed_next_tokens(tokens.view(-1, 1), positions).view(1, g + 1, -1)
+                cache_pos = src_len + pos
+                kv_len = cache_pos + g + 1
+                attn_mask = (
+                    torch.arange(kv_len).unsqueeze(0) > (cache_pos + torch.arange(g + 1)).unsqueeze(1)
+                ).view(1, 1, g + 1, kv_len).to(h.device)
+                h = model.t2s_transformer.decode_next_token_static(h, k_cache, v_cache, cache_pos, attn_mask)
+                target_logits = model.ar_predict_layer(h[0])
+
+                # 接受/拒绝, 结果暂存到 pending 中逐个输出
+                pending = []
+                verify_counts = token_counts.clone()
+                for i in range(g + 1):
+                    p, target_argmax = self._probs(target_logits[i:i + 1], n + i, verify_counts, params)
+                    if i == g:
+                        # 全部接受时再从完整模型多采样一个token
+                        pending.append((multinomial_sample_one_no_sync(p, generator).long(), target_argmax))
+                        break
+                    d, q = drafts[i], draft_probs[i]
+                    if torch.rand((), device=p.device, generator=generator) * q[0, d[0, 0]] < p[0, d[0, 0]]:
+                        accepted += 1
+                        pending.append((d, target_argmax))
+                        update_token_histogram(verify_counts, d)
+                        if int(d) == self.EOS or int(target_argmax) == self.EOS:
+                            break
+                        continue
+                    residual = (p - q).clamp(min=0)
+                    if float(residual.sum()) <= 0:
+                        residual = p
+                    pending.append((multinomial_sample_one_no_sync(residual, generator).long(), target_argmax))
+                    break
+                rounds += 1
+                drafted += g
+                token, argmax = pending.pop(0)
+        finally:
+            with self._lock:
+                self.rounds += rounds
+                self.drafted += drafted
+                self.accepted += accepted
+                self.tokens += y.shape[1] - prompt.shape[1]
+                self.busy_time += time.perf_counter() - start
+
+    def _probs(self, logits, n, token_counts, params):
+        """与 infer_panel_naive 相同的采样分布, 同时返回惩罚后logits的argmax(用于判断结束)"""
+        logits = logits.clone()
+        if n < MIN_TOKENS:   ###至少预测出10个token不然不给停止（0.4s）
+            logits[:, self.EOS] = -float("Inf")
+        probs = logits_to_probs(logits, token_counts=token_counts, **params)
+        return probs, torch.argmax(logits, dim=-1)
+
+    @staticmethod
+    def _static_cache(cache, max_len):
+        buffer = torch.zeros((cache.shape[0], max_len, cache.shape[2]), dtype=cache.dtype, device=cache.device)
+        buffer.narrow(1, 0, cache.shape[1]).copy_(cache)
+        return buffer
+
+    def stats(self):
+        with self._lock:
+            return {
+                "draft_layers": self.draft_layers,
+                "draft_tokens": self.draft_tokens,
+                "rounds": self.rounds,
+                "acceptance_rate": self.accepted / self.drafted if self.drafted else 0.0,
+                "tokens_per_round": self.tokens / self.rounds if self.rounds else 0.0,
+                "tokens_per_second": self.tokens / self.busy_time if self.busy_time else 0.0,
+                "tokens": self.tokens
+            }
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+合成结果缓存: 以全部输入(模型权重、参考音频、文本、采样参数、种子)的哈希为键,
+缓存整段输出音频(synthesis_cache) 或 单句音频(sentence_cache)
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import Optional
+import numpy as np
+import soundfile as sf
+
+from mockvox.config import get_config, SYNTH_CACHE_PATH, SENTENCE_CACHE_PATH
+from mockvox.utils import MockVoxLogger
+from mockvox.engine.v4.reference import reference_cache
+
+cfg = get_config()
+
+# 改变合成结果的代码变更时递增, 使旧缓存失效
+CACHE_VERSION = 2
+# 读取缓存流式输出时每块的样本数
+STREAM_CHUNK_SAMPLES = 48000
+
+def resolve_seed(seed: Optional[int]) -> Optional[int]:
+    """请求未指定种子时使用 SYNTHESIS_SEED; 负数表示不固定种子"""
+    seed = cfg.SYNTHESIS_SEED if seed is None else seed
+    return seed if seed >= 0 else None
+
+def normalize_sentence(text: str) -> str:
+    """句子缓存键与句子种子所用的文本: 规整空白"""
+    return " ".join(text.split())
+
+def sentence_seed(seed: int, text: str) -> int:
+    """由请求种子与规整后的句子派生该句的种子, 与句子所在位置无关"""
+    digest = hashlib.sha256(f"{seed}\n{normalize_sentence(text)}".encode()).digest()
+    return int.from_bytes(digest[:8], "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+class SynthesisCache:
+    """
+    磁盘缓存, 每个条目是 cache_dir 下的 <键>.wav, API 与 Celery 进程共用.
+    命中时更新文件修改时间, 写入后按修改时间淘汰最久未用的条目, 使总大小不超过 capacity 字节.
+    只缓存固定种子的请求(结果可复现), 命中率等计数为进程内统计.
+    """
+    def __init__(self, capacity: int, cache_dir: str):
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def key(self, gpt_path, sovits_path, ref_wav_path, seed: int, **params) -> str:
+        """
+        params 为 prompt_text、text、top_k 等合成参数. 模型与参考音频取文件内容哈希,
+        未指定的 CFM 参数与影响数值结果的推理配置一并计入;
+        GPT 批大小、调度器与投机解码决定随机数的消耗顺序, 也计入.
+        """
+        params = dict(params)
+        params["sample_steps"] = params.get("sample_steps") or cfg.CFM_STEPS
+        params["cfm_schedule"] = params.get("cfm_schedule") or cfg.CFM_SCHEDULE
+        material = {
+            "version": CACHE_VERSION,
+            "gpt": reference_cache.digest(gpt_path),
+            "sovits": reference_cache.digest(sovits_path),
+            "ref": reference_cache.digest(ref_wav_path),
+            "seed": seed,
+            "params": params,
+            "engine": [
+                cfg.INFERENCE_BACKEND, cfg.INFERENCE_PRECISION, cfg.CPU_QUANTIZE,
+                cfg.T2S_BATCH_SIZE, cfg.T2S_SCHEDULER, cfg.T2S_SPECULATIVE, cfg.CFM_BATCH
+            ],
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def file(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """命中时返回缓存文件路径"""
+        path = self.file(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def stream(self, path: str):
+        """按块读取缓存音频, 产出与 Inferencer.inference 相同的 (采样率, int16音频)"""
+        with sf.SoundFile(path) as f:
+            for block in f.blocks(blocksize=STREAM_CHUNK_SAMPLES, dtype="int16"):
+                yield f.samplerate, block
+
+    def load(self, key: str):
+        """命中时返回 (采样率, float32音频)"""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            audio, sampling_rate = sf.read(path, dtype="float32")
+        except (RuntimeError, OSError):
+            # 条目刚被淘汰或文件损坏
+            return None
+        return sampling_rate, audio
+
+    def save(self, key: str, sampling_rate: int, audio: np.ndarray):
+        """以32位浮点WAV保存音频, 读取后与写入时一致"""
+        self._commit(key, lambda tmp_file: sf.write(tmp_file, audio, int(sampling_rate), format="WAV", subtype="FLOAT"))
+
+    def put_file(self, key: str, path: str):
+        """复制已生成的音频文件到缓存"""
+        self._commit(key, lambda tmp_file: shutil.copyfile(path, tmp_file))
+
+    def record(self, key: str, results):
+        """
+        透传 (采样率, 音频) 生成器, 完整输出后把拼接的音频写入缓存;
+        中途断开(生成器被关闭)时不写入
+        """
+        chunks = []
+        sampling_rate = None
+        try:
+            for sampling_rate, audio in results:
+                chunks.append(audio)
+                yield sampling_rate, audio
+        finally:
+            if hasattr(results, "close"):
+                results.close()
+        if chunks:
+            audio = np.concatenate(chunks)
+            self._commit(key, lambda tmp_file: sf.write(tmp_file, audio, int(sampling_rate), format="WAV"))
+
+    def _commit(self, key: str, write):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 先写临时文件再替换, 避免其他进程读到写了一半的文件
+        tmp_file = f"{self.file(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            write(tmp_file)
+            os.replace(tmp_file, self.file(key))
+        except Exception as e:
+            MockVoxLogger.warning(f"Synthesis cache write failed: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return
+        with self._lock:
+            self.stores += 1
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".wav"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.capacity:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(entries),
+                "size": sum(size for _, size, _ in entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions
+            }
+
+synthesis_cache = SynthesisCache(cfg.SYNTHESIS_CACHE_SIZE, SYNTH_CACHE_PATH)
+sentence_cache = SynthesisCache(cfg.SENTENCE_CACHE_SIZE, SENTENCE_CACHE_PATH)
@@ -29,14 +29,23 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware import Middleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from celery.result import AsyncResult
+from celery import states
 import json
+import uuid
+import shutil
+import time
 from pathlib import Path
 import glob
 import torch
 import struct
 import gc
 import torch
-from mockvox.engine.v4.inference import Inferencer
+from mockvox.engine.v4.registry import model_registry
+from mockvox.engine.v4.pool import inference_pool
+from mockvox.engine.v4.reference import reference_cache
+from mockvox.engine.v4.synthesis_cache import synthesis_cache, sentence_cache, resolve_seed
+from mockvox.engine.v4.frontend_cache import frontend_cache
+from mockvox.models.v4 import CFM_STEP_TIERS, CFM_SCHEDULES
 
 from mockvox.config import (
     get_config,
@@ -58,12 +67,31 @@ from mockvox.worker import (
     add_audio_task,
     train_task, 
     inference_task, 
-    resume_task
+    resume_task,
+    prepare_reference_task
 )
 from mockvox.utils import MockVoxLogger, generate_unique_filename, allowed_file, i18n
+from mockvox.utils.executor import BoundedExecutor, ExecutorOverloaded
 
 cfg = get_config()
 
+# 模型加载、合成、磁盘读写等阻塞调用在有界线程池中执行, 不占用事件循环
+api_executor = BoundedExecutor(cfg.API_EXECUTOR_WORKERS, cfg.API_EXECUTOR_QUEUE, "mockvox-api")
+
+async def run_blocking(fn, *args, **kwargs):
+    """在线程池中执行阻塞调用, 线程池与等待队列都满时返回 503"""
+    try:
+        return await api_executor.run(fn, *args, **kwargs)
+    except ExecutorOverloaded:
+        raise HTTPException(503, i18n("服务繁忙, 请稍后重试"))
+
+def stream_blocking(gen_fn, *args, **kwargs):
+    """在线程池中迭代同步生成器, 经异步队列输出; 满时返回 503"""
+    try:
+        return api_executor.stream(gen_fn, *args, **kwargs)
+    except ExecutorOverloaded:
+        raise HTTPException(503, i18n("服务繁忙, 请稍后重试"))
+
 class SizeLimitMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         content_length = int(request.headers.get("content-length", 0))
@@ -101,7 +129,17 @@ async def asr_revision(
     results: str = Form("{}", description=i18n("JSON格式的校对结果")),
     denoised: bool = Form(True, description=i18n("是否已降噪"))
 ):
-    results_list = json.loads(results)
+    try:
+        results_list = json.loads(results)
+        return await run_blocking(save_asr_revision, file_id, results_list, denoised)
+    except json.JSONDecodeError:
+        raise HTTPException(
+            status_code=400,
+            detail=i18n("results参数中的JSON格式无效")
+        )
+
+def save_asr_revision(file_id, results_list, denoised):
+    """校验并保存ASR校对结果(磁盘读写, 在线程池中执行)"""
     wav_root = DENOISED_ROOT_PATH if denoised else SLICED_ROOT_PATH
     wav_root = Path(wav_root) / file_id
     asr_path = Path(ASR_PATH) / file_id / 'output.json'
@@ -109,44 +147,37 @@ async def asr_revision(
     with open(asr_path, "r", encoding="utf-8") as f:
         output_data = json.load(f)
 
-    try:
-        if not isinstance(results_list, list):
+    if not isinstance(results_list, list):
+        raise HTTPException(
+            status_code=422,
+            detail=i18n("无效格式: 结果应为JSON数组")
+        )
+
+    for item in results_list:
+        if not isinstance(item, dict):
             raise HTTPException(
                 status_code=422,
-                detail=i18n("无效格式: 结果应为JSON数组")
+                detail=f"{i18n('无效项格式: 应为字典(dict)，实际为')} {type(item)}"
+            )
+            
+        if "key" not in item or "text" not in item:
+            raise HTTPException(
+                status_code=422,
+                detail=i18n("无效项：缺少 key 或 text 字段")
             )
 
-        for item in results_list:
-            if not isinstance(item, dict):
-                raise HTTPException(
-                    status_code=422,
-                    detail=f"{i18n('无效项格式: 应为字典(dict)，实际为')} {type(item)}"
-                )
-                
-            if "key" not in item or "text" not in item:
-                raise HTTPException(
-                    status_code=422,
-                    detail=i18n("无效项：缺少 key 或 text 字段")
-                )
-
-            wav_path = wav_root / f"{item['key']}.wav"
-            if not wav_path.exists():
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"{i18n('音频文件未找到:')} {item['key']}.wav"
-                )
+        wav_path = wav_root / f"{item['key']}.wav"
+        if not wav_path.exists():
+            raise HTTPException(
+                status_code=404,
+                detail=f"{i18n('音频文件未找到:')} {item['key']}.wav"
+            )
 
-        output_data["results"] = results_list
-        with open(asr_path, "w", encoding="utf-8") as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
-            
-        return {"success": True, "message": i18n("ASR校对保存成功")}
+    output_data["results"] = results_list
+    with open(asr_path, "w", encoding="utf-8") as f:
+        json.dump(output_data, f, ensure_ascii=False, indent=2)
         
-    except json.JSONDecodeError:
-        raise HTTPException(
-            status_code=400,
-            detail=i18n("results参数中的JSON格式无效")
-        )
+    return {"success": True, "message": i18n("ASR校对保存成功")}
 
 @app.post(
     "/train",
@@ -264,15 +295,16 @@ async def start_inference(
     top_k:int = Form(15, description=i18n("GPT采样参数(无参考文本时不要太低。不懂就用默认)")), 
     temperature:float = Form(1, description=i18n("temperature")), 
     speed:float = Form(1, description=i18n("语速")),
+    sample_steps:int = Form(None, description=i18n("v4 CFM步数(4/8/16/32), 步数越少越快")),
+    cfm_schedule:str = Form(None, description=i18n("v4 CFM时间步调度(uniform/sway)")),
+    seed:int = Form(None, description=i18n("随机种子, 固定后相同请求的结果可复现并使用合成结果缓存")),
 ):
+    check_cfm_params(sample_steps, cfm_schedule)
     try:
         gpt_path = Path(WEIGHTS_PATH) / model_id / GPT_HALF_WEIGHTS_FILE
         if not gpt_path.exists():
             MockVoxLogger.error(i18n("路径错误! 找不到GPT模型"))
             return
-        gpt_ckpt = torch.load(gpt_path, map_location="cpu")
-        version = gpt_ckpt["config"]["model"]["version"]
-        MockVoxLogger.info(f"Model Version: {version}")
         sovits_path = Path(WEIGHTS_PATH) / model_id / SOVITS_HALF_WEIGHTS_FILE
         if not sovits_path.exists():
             MockVoxLogger.error(i18n("路径错误! 找不到SOVITS模型"))
@@ -283,11 +315,32 @@ async def start_inference(
         if filename == '':
             MockVoxLogger.error(i18n("上传参考音频"))
             return
+        ref_audio_path = str(Path(REF_AUDIO_PATH)/filename)
+        seed = resolve_seed(seed)
+        cache_key = None
+        if seed is not None and synthesis_cache.enabled:
+            cache_key = await run_blocking(
+                synthesis_cache.key, gpt_path, sovits_path, ref_audio_path, seed,
+                prompt_text=ref_text, prompt_language=ref_language, text=target_text, text_language=target_language,
+                top_p=top_p, top_k=top_k, temperature=temperature, speed=speed,
+                sample_steps=sample_steps, cfm_schedule=cfm_schedule, is_stream=False
+            )
+            task_id = await run_blocking(publish_cached_output, cache_key)
+            if task_id is not None:
+                MockVoxLogger.info(
+                    f"{i18n('推理结果已命中缓存')} \n"
+                    f"task_id: {task_id} \n"
+                    f"model_id: {model_id}"
+                )
+                return {
+                    "message": i18n("推理结果已命中缓存"),
+                    "task_id": task_id
+                }
         # 发送异步任务
         task = inference_task.delay(
             gpt_model_path=str(gpt_path),                   
             soVITS_model_path=str(sovits_path) , 
-            ref_audio_path=str(Path(REF_AUDIO_PATH)/filename), 
+            ref_audio_path=ref_audio_path, 
             ref_text=ref_text , 
             ref_language=ref_language, 
             target_text=target_text , 
@@ -296,7 +349,10 @@ async def start_inference(
             top_k=top_k , 
             temperature=temperature , 
             speed=speed,
-            version=version
+            sample_steps=sample_steps,
+            cfm_schedule=cfm_schedule,
+            seed=seed,
+            cache_key=cache_key
         )
         # 确保任务对象有效
         if not isinstance(task, AsyncResult):
@@ -323,6 +379,39 @@ async def start_inference(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{i18n('推理过程错误')}: {str(e)}")
 
+def publish_cached_output(cache_key):
+    """
+    合成结果缓存命中时, 输出文件直接取自缓存(硬链接), 并写入与推理任务相同格式的任务结果,
+    客户端照常通过 /tasks 与 /output 获取. 未命中返回 None
+    """
+    cache_path = synthesis_cache.lookup(cache_key)
+    if cache_path is None:
+        return None
+    task_id = str(uuid.uuid4())
+    output_path = os.path.join(OUT_PUT_PATH, task_id + ".WAV")
+    os.makedirs(OUT_PUT_PATH, exist_ok=True)
+    try:
+        os.link(cache_path, output_path)
+    except FileNotFoundError:
+        # 条目刚被淘汰
+        return None
+    except OSError:
+        # 不支持硬链接时复制
+        shutil.copyfile(cache_path, output_path)
+    celeryApp.backend.store_result(task_id, {
+        "status": "success",
+        "results": {"cached": True},
+        "time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+    }, states.SUCCESS)
+    return task_id
+
+def check_cfm_params(sample_steps, cfm_schedule):
+    """校验 v4 CFM 质量档位参数"""
+    if sample_steps is not None and sample_steps not in CFM_STEP_TIERS:
+        raise HTTPException(400, f"sample_steps: {', '.join(map(str, CFM_STEP_TIERS))}")
+    if cfm_schedule is not None and cfm_schedule not in CFM_SCHEDULES:
+        raise HTTPException(400, f"cfm_schedule: {', '.join(CFM_SCHEDULES)}")
+
 def generate_wav_header(sample_rate: int, channels: int, bits_per_sample: int):
     """
     生成用于流式传输的WAV文件头
@@ -368,16 +457,17 @@ async def start_streamInference(
     top_k:int = Query(15, title=i18n("GPT采样参数(无参考文本时不要太低。不懂就用默认)")), 
     temperature:float = Query(1, title=i18n("temperature")), 
     speed:float = Query(1, title=i18n("语速")),
+    sample_steps:int = Query(None, title=i18n("v4 CFM步数(4/8/16/32), 步数越少越快")),
+    cfm_schedule:str = Query(None, title=i18n("v4 CFM时间步调度(uniform/sway)")),
+    seed:int = Query(None, title=i18n("随机种子, 固定后相同请求的结果可复现并使用合成结果缓存")),
 ):
+    check_cfm_params(sample_steps, cfm_schedule)
     try:
 
         gpt_path = Path(WEIGHTS_PATH) / model_id / GPT_HALF_WEIGHTS_FILE
         if not gpt_path.exists():
             MockVoxLogger.error(i18n("路径错误! 找不到GPT模型"))
             return
-        gpt_ckpt = torch.load(gpt_path, map_location="cpu")
-        version = gpt_ckpt["config"]["model"]["version"]
-        MockVoxLogger.info(f"Model Version: {version}")
         sovits_path = Path(WEIGHTS_PATH) / model_id / SOVITS_HALF_WEIGHTS_FILE
         if not sovits_path.exists():
             MockVoxLogger.error(i18n("路径错误! 找不到SOVITS模型"))
@@ -388,17 +478,41 @@ async def start_streamInference(
         if filename == '':
             MockVoxLogger.error(i18n("请上传参考音频"))
             return
-        inference = Inferencer(gpt_path,sovits_path,version)
-        # Synthesize audio
-        synthesis_result = inference.inference(ref_wav_path=str(Path(REF_AUDIO_PATH)/filename),# 参考音频 
-                                    prompt_text=ref_text, # 参考文本
-                                    prompt_language=ref_language, 
-                                    text=target_text, # 目标文本
-                                    text_language=target_language, top_p=top_p, temperature=temperature, top_k=top_k, speed=speed,is_stream=True)
+        params = dict(ref_wav_path=str(Path(REF_AUDIO_PATH)/filename),# 参考音频 
+                      prompt_text=ref_text, # 参考文本
+                      prompt_language=ref_language, 
+                      text=target_text, # 目标文本
+                      text_language=target_language, top_p=top_p, temperature=temperature, top_k=top_k, speed=speed,is_stream=True,
+                      sample_steps=sample_steps, cfm_schedule=cfm_schedule, seed=resolve_seed(seed))
+        cache_key = None
+        cache_path = None
+        if params["seed"] is not None and synthesis_cache.enabled:
+            cache_key = await run_blocking(
+                synthesis_cache.key, gpt_path, sovits_path, params["ref_wav_path"], params["seed"],
+                **{name: value for name, value in params.items() if name not in ("ref_wav_path", "seed")}
+            )
+            cache_path = await run_blocking(synthesis_cache.lookup, cache_key)
+        if cache_path is not None:
+            MockVoxLogger.info(f"{i18n('推理结果已命中缓存')}: {model_id}")
+            results = synthesis_cache.stream(cache_path)
+        elif inference_pool.enabled:
+            # 转发给负责该模型的推理工作进程, 模型常驻在工作进程中
+            results = await run_blocking(inference_pool.inference, model_id, gpt_path, sovits_path, **params)
+        else:
+            # 模型加载与合成都在线程池中执行
+            inference = await run_blocking(model_registry.get, model_id, gpt_path, sovits_path)
+            MockVoxLogger.info(f"Model Version: {inference.version}")
+            # Synthesize audio
+            results = inference.inference(**params)
+        synthesis_result = results
+        if cache_key is not None and cache_path is None:
+            # 完整输出后写入合成结果缓存
+            synthesis_result = synthesis_cache.record(cache_key, synthesis_result)
 
         def audio_generator():
         # 初始标志，确保只发送一次WAV头
             header_sent = False
+            data_sent = False
             sample_rate = None
             buffer = bytearray()
             max_buffer_size = 44100 * 2  # 约0.5秒的数据量
@@ -415,8 +529,9 @@ async def start_streamInference(
                     )
                     yield wav_header
                     header_sent = True
-                # 当缓冲区达到一定大小时发送数据（减少小包传输）
-                if len(buffer) >= max_buffer_size:
+                # 当缓冲区达到一定大小时发送数据（减少小包传输）, 首包立即发送
+                if len(buffer) >= max_buffer_size or not data_sent:
+                    data_sent = True
                     yield bytes(buffer)
                     buffer = bytearray()
             if buffer:
@@ -424,11 +539,22 @@ async def start_streamInference(
             
         
 
+        try:
+            stream = stream_blocking(audio_generator)
+        except HTTPException:
+            # 线程池已满: 关闭已建立的连接(推理进程池)或未开始的合成
+            results.close()
+            raise
         return StreamingResponse(
-            audio_generator(),
+            stream,
             media_type="audio/wav",
             headers={"Content-Type": "audio/wav"}
         )
+    except HTTPException as he:
+        raise he
+    except ConnectionError as ce:
+        MockVoxLogger.critical(f"{i18n('推理工作进程连接失败')}: {str(ce)}")
+        raise HTTPException(503, i18n("系统暂时不可用"))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{i18n('推理过程错误')}: {str(e)}")
     finally:
@@ -480,6 +606,12 @@ async def upload_ref_audio(
     with open(save_path, 'wb') as f:
         while chunk := await file.read(1024 * 1024):    # 1Mb chunks
             f.write(chunk)
+
+    # 预先提取参考音频特征, 失败不影响上传
+    try:
+        prepare_reference_task.delay(ref_audio_path=save_path)
+    except Exception as e:
+        MockVoxLogger.warning(f"{i18n('参考音频特征预提取任务提交失败')}: {str(e)}")
     return {"file_id": Path(filename).stem}
 
 @app.post(
@@ -646,7 +778,11 @@ def get_task_status(task_id: str):
          summary=i18n("获取模型信息"),
          response_description=i18n("返回模型版本及训练轮次"),
          tags=[i18n("获取模型信息")])
-def get_model_info(model_id: str):
+async def get_model_info(model_id: str):
+    return await run_blocking(load_model_info, model_id)
+
+def load_model_info(model_id: str):
+    """读取训练权重中的版本与训练轮次(磁盘读取, 在线程池中执行)"""
     gpt_weights = Path(WEIGHTS_PATH) / model_id / GPT_WEIGHTS_FILE
     sovits_weights = Path(WEIGHTS_PATH) / model_id / SOVITS_G_WEIGHTS_FILE
     if not gpt_weights.exists():
@@ -668,6 +804,25 @@ def get_model_info(model_id: str):
         "GPT trained epoch": gpt_epoch
     }
 
+# 运行指标查询接口
+@app.get("/metrics",
+         summary=i18n("获取运行指标"),
+         response_description=i18n("返回常驻模型缓存等运行指标"),
+         tags=[i18n("获取运行指标")])
+def get_metrics():
+    return {
+        "model_registry": model_registry.stats(),
+        "reference_cache": reference_cache.stats(),
+        "t2s_decode": model_registry.decode_stats(),
+        "t2s_scheduler": model_registry.scheduler_stats(),
+        "t2s_speculative": model_registry.speculative_stats(),
+        "api_executor": api_executor.stats(),
+        "inference_pool": inference_pool.stats(),
+        "synthesis_cache": synthesis_cache.stats(),
+        "sentence_cache": sentence_cache.stats(),
+        "frontend_cache": frontend_cache.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -4,10 +4,11 @@ import torch.nn as nn
 from torch.nn import functional as F
 from torch.amp import autocast
 import contextlib
+import math
 import random
 
 from mockvox.text import symbols
-from mockvox.utils import init_weights, sequence_mask, rand_slice_segments, LRELU_SLOPE
+from mockvox.utils import init_weights, sequence_mask, rand_slice_segments, randn_like_seeded, LRELU_SLOPE
 from mockvox.nn import (
     MelStyleEncoder,
     ResidualVectorQuantizer,
@@ -181,7 +182,7 @@ class SynthesizerTrn(nn.Module):
         return o, y_mask, (z, z_p, m_p, logs_p)
 
     @torch.no_grad()
-    def decode(self, codes, text, refer, noise_scale=0.5,speed=1):
+    def decode(self, codes, text, refer, noise_scale=0.5,speed=1,generator=None):
         def get_ge(refer):
             ge = None
             if refer is not None:
@@ -211,7 +212,7 @@ class SynthesizerTrn(nn.Module):
         x, m_p, logs_p, y_mask = self.enc_p(
             quantized, y_lengths, text, text_lengths, ge,speed
         )
-        z_p = m_p + torch.randn_like(m_p) * torch.exp(logs_p) * noise_scale
+        z_p = m_p + randn_like_seeded(m_p, generator) * torch.exp(logs_p) * noise_scale
 
         z = self.flow(z_p, y_mask, g=ge, reverse=True)
 
@@ -437,6 +438,98 @@ class Generator(torch.nn.Module):
         for l in self.resblocks:
             l.remove_weight_norm()
 
+    def upsample_factor(self):
+        """每帧输入对应的输出样本数"""
+        factor = 1
+        for up in self.ups:
+            factor *= up.stride[0]
+        return factor
+
+    def receptive_field(self):
+        """单侧感受野, 以输入帧计(向上取整)"""
+        frames = (self.conv_pre.kernel_size[0] - 1) // 2 * self.conv_pre.dilation[0]
+        rate = 1
+        for i, up in enumerate(self.ups):
+            # 转置卷积的每个输出依赖约 kernel/stride 个输入
+            frames += up.kernel_size[0] / up.stride[0] / 2 / rate
+            rate *= up.stride[0]
+            # 同一级的多个残差块并联, 取最大; 残差块内的卷积串联, 累加
+            frames += max(
+                sum(
+                    (conv.kernel_size[0] - 1) * conv.dilation[0] / 2
+                    for conv in self.resblocks[i * self.num_kernels + j].modules()
+                    if isinstance(conv, nn.Conv1d)
+                )
+                for j in range(self.num_kernels)
+            ) / rate
+        frames += (self.conv_post.kernel_size[0] - 1) / 2 / rate
+        return math.ceil(frames)
+
+class ChunkedVocoder:
+    """
+    Generator 的分块包装: mel 按 chunk_size 帧分块声码, 每块两侧带不少于感受野的上下文帧,
+    去掉上下文对应的样本后, 相邻块以 overlap 帧交叉淡化拼接.
+    峰值内存只与 chunk_size 有关; stream() 接受逐步到来的 mel 块, 有足够右侧上下文即输出.
+    """
+    def __init__(self, generator: Generator, chunk_size: int, overlap: int = 8, padding: int = None):
+        self.generator = generator
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.padding = generator.receptive_field() if padding is None else padding
+        self.hop = generator.upsample_factor()
+
+    def __call__(self, mel):
+        """mel: (1, 通道数, 帧数), 返回一维音频"""
+        if self.chunk_size <= 0 or mel.shape[-1] <= self.chunk_size:
+            with torch.inference_mode():
+                return self.generator(mel)[0][0]
+        return torch.cat(list(self.stream([mel])))
+
+    def stream(self, mels):
+        """逐步输入 mel 块, 逐步产出一维音频"""
+        chunk_size = self.chunk_size if self.chunk_size > 0 else float("inf")
+        buffer = None # 缓存的 mel 帧 [offset, total)
+        offset = 0
+        total = 0
+        emitted = 0 # 已输出(含暂缓的重叠部分)音频的帧数
+        held = None
+        for mel in mels:
+            buffer = mel if buffer is None else torch.cat([buffer, mel], 2)
+            total += mel.shape[-1]
+            # 右侧上下文足够的帧可以输出
+            while min(total - self.padding, emitted + chunk_size) > emitted:
+                end = min(total - self.padding, emitted + chunk_size)
+                wav, held = self._vocode(buffer, offset, total, emitted, end, held, final=False)
+                emitted = end
+                drop = max(0, emitted - self.overlap - self.padding - offset)
+                buffer, offset = buffer[:, :, drop:], offset + drop
+                if wav.shape[0] > 0:
+                    yield wav
+        while emitted < total:
+            end = min(total, emitted + chunk_size)
+            wav, held = self._vocode(buffer, offset, total, emitted, end, held, final=end == total)
+            emitted = end
+            if wav.shape[0] > 0:
+                yield wav
+        if held is not None:
+            yield held
+
+    def _vocode(self, buffer, offset, total, start, end, held, final):
+        hop = self.hop
+        held_frames = held.shape[0] // hop if held is not None else 0
+        lo = max(0, start - held_frames - self.padding)
+        hi = min(total, end + self.padding)
+        with torch.inference_mode():
+            wav = self.generator(buffer[:, :, lo - offset : hi - offset])[0][0]
+        wav = wav[(start - held_frames - lo) * hop : (end - lo) * hop]
+        if held_frames > 0:
+            fade = torch.linspace(0, 1, held.shape[0], dtype=wav.dtype, device=wav.device)
+            wav = torch.cat([held * (1 - fade) + wav[:held.shape[0]] * fade, wav[held.shape[0]:]])
+        hold = 0 if final else min(self.overlap, end - start + held_frames) * hop
+        if hold > 0:
+            return wav[:-hold], wav[-hold:]
+        return wav, None
+
 class ResidualCouplingBlock(nn.Module):
     def __init__(
         self,
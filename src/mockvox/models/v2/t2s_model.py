@@ -1,7 +1,9 @@
 # modified from https://github.com/yangdongchao/SoundStorm/blob/master/soundstorm/s1/AR/models/t2s_model.py
 # reference: https://github.com/lifeiteng/vall-e
 import math
-from typing import List, Optional
+import time
+import threading
+from typing import Callable, List, Optional
 import torch
 from tqdm import tqdm
 from torch import nn
@@ -11,11 +13,14 @@ from torchmetrics.classification import MulticlassAccuracy
 from mockvox.nn.AR.utils import (
     sample,
     topk_sampling,
+    token_histogram,
+    update_token_histogram,
     make_pad_mask,
     dpo_loss,
     make_reject_y,
     get_batch_logps
 )
+from mockvox.utils import MockVoxLogger
 from mockvox.nn.AR import (
     SinePositionalEmbedding,
     TokenEmbedding,
@@ -73,9 +78,12 @@ class T2SMLP:
         self.w2 = w2
         self.b2 = b2
 
+    def linear(self, x:torch.Tensor, w:torch.Tensor, b:torch.Tensor):
+        return F.linear(x, w, b)
+
     def forward(self, x):
-        x = F.relu(F.linear(x, self.w1, self.b1))
-        x = F.linear(x, self.w2, self.b2)
+        x = F.relu(self.linear(x, self.w1, self.b1))
+        x = self.linear(x, self.w2, self.b2)
         return x
 
 
@@ -113,6 +121,9 @@ class T2SBlock:
 
         self.false = torch.tensor(False, dtype=torch.bool)
 
+    def linear(self, x:torch.Tensor, w:torch.Tensor, b:torch.Tensor):
+        return F.linear(x, w, b)
+
     @torch.jit.ignore
     def to_mask(self, x:torch.Tensor, padding_mask:Optional[torch.Tensor]):
         if padding_mask is None:
@@ -126,7 +137,7 @@ class T2SBlock:
     def process_prompt(self, x:torch.Tensor, attn_mask : torch.Tensor, padding_mask:Optional[torch.Tensor]=None, torch_sdpa:bool=True):
 
             
-        q, k, v = F.linear(self.to_mask(x, padding_mask), self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        q, k, v = self.linear(self.to_mask(x, padding_mask), self.qkv_w, self.qkv_b).chunk(3, dim=-1)
 
         batch_size = q.shape[0]
         q_len = q.shape[1]
@@ -146,7 +157,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(self.to_mask(attn, padding_mask), self.out_w, self.out_b)
+        attn = self.linear(self.to_mask(attn, padding_mask), self.out_w, self.out_b)
 
         x = x + attn
         x = F.layer_norm(
@@ -163,7 +174,7 @@ class T2SBlock:
         return x, k_cache, v_cache
     
     def decode_next_token(self, x:torch.Tensor, k_cache:torch.Tensor, v_cache:torch.Tensor, attn_mask:Optional[torch.Tensor]=None, torch_sdpa:bool=True):
-        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        q, k, v = self.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
 
         k_cache = torch.cat([k_cache, k], dim=1)
         v_cache = torch.cat([v_cache, v], dim=1)
@@ -183,7 +194,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(attn, self.out_w, self.out_b)
+        attn = self.linear(attn, self.out_w, self.out_b)
 
         x = x + attn
         x = F.layer_norm(
@@ -199,6 +210,88 @@ class T2SBlock:
         )
         return x, k_cache, v_cache
 
+    def decode_next_token_static(self, x:torch.Tensor, k_cache:torch.Tensor, v_cache:torch.Tensor, pos:int, attn_mask:Optional[torch.Tensor]=None, torch_sdpa:bool=True):
+        """
+        预分配KV缓存的解码: k_cache/v_cache 形状 (batch, max_len, hidden), 新的k/v原地写入第 pos 位起,
+        只对前 pos+q_len 个位置做注意力. 一次输入多个token(投机解码校验)时需传入因果 attn_mask
+        """
+        q, k, v = self.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+        kv_len = pos + q_len
+
+        k_cache.narrow(1, pos, q_len).copy_(k)
+        v_cache.narrow(1, pos, q_len).copy_(v)
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        if torch_sdpa:
+            if attn_mask is not None:
+                attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
+            else:
+                attn = F.scaled_dot_product_attention(q, k, v)
+        else:
+            attn = scaled_dot_product_attention(q, k, v, attn_mask)
+
+        attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
+        attn = self.linear(attn, self.out_w, self.out_b)
+
+        x = x + attn
+        x = F.layer_norm(
+            x, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1
+        )
+        x = x + self.mlp.forward(x)
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x
+
+    def decode_next_token_slots(self, x:torch.Tensor, k_cache:torch.Tensor, v_cache:torch.Tensor, positions:torch.Tensor, kv_len:int, attn_mask:torch.Tensor, torch_sdpa:bool=True):
+        """
+        连续批处理的解码: 每行是独立的序列, 新的k/v写入各自的 positions[i] 位,
+        attn_mask 形状 (batch, 1, 1, kv_len), True 表示该位置不可见
+        """
+        q, k, v = self.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+        rows = torch.arange(batch_size, device=x.device)
+        k_cache[rows, positions] = k.squeeze(1)
+        v_cache[rows, positions] = v.squeeze(1)
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        if torch_sdpa:
+            attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
+        else:
+            attn = scaled_dot_product_attention(q, k, v, attn_mask)
+
+        attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
+        attn = self.linear(attn, self.out_w, self.out_b)
+
+        x = x + attn
+        x = F.layer_norm(
+            x, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1
+        )
+        x = x + self.mlp.forward(x)
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x
+
 
 @torch.jit.script
 class T2STransformer:
@@ -230,6 +323,174 @@ class T2STransformer:
             x, k_cache[i], v_cache[i] = self.blocks[i].decode_next_token(x, k_cache[i], v_cache[i], attn_mask, torch_sdpa)
         return x, k_cache, v_cache
 
+    def process_prompt_static(
+        self, x:torch.Tensor, attn_mask : torch.Tensor,
+        max_len: int,
+        padding_mask : Optional[torch.Tensor]=None,
+        torch_sdpa:bool=True
+        ):
+        """处理提示并把KV写入预分配的 (batch, max_len, hidden) 缓存"""
+        k_cache : List[torch.Tensor] = []
+        v_cache : List[torch.Tensor] = []
+        for i in range(self.num_blocks):
+            x, k_cache_, v_cache_ = self.blocks[i].process_prompt(x, attn_mask, padding_mask, torch_sdpa)
+            k_buffer = torch.zeros((k_cache_.shape[0], max_len, k_cache_.shape[2]), dtype=k_cache_.dtype, device=k_cache_.device)
+            v_buffer = torch.zeros((v_cache_.shape[0], max_len, v_cache_.shape[2]), dtype=v_cache_.dtype, device=v_cache_.device)
+            k_buffer.narrow(1, 0, k_cache_.shape[1]).copy_(k_cache_)
+            v_buffer.narrow(1, 0, v_cache_.shape[1]).copy_(v_cache_)
+            k_cache.append(k_buffer)
+            v_cache.append(v_buffer)
+        return x, k_cache, v_cache
+
+    def decode_next_token_static(
+        self, x:torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        pos: int,
+        attn_mask : Optional[torch.Tensor]=None,
+        torch_sdpa:bool=True
+    ):
+        for i in range(self.num_blocks):
+            x = self.blocks[i].decode_next_token_static(x, k_cache[i], v_cache[i], pos, attn_mask, torch_sdpa)
+        return x
+
+    def decode_next_token_slots(
+        self, x:torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        positions: torch.Tensor,
+        kv_len: int,
+        attn_mask : torch.Tensor,
+        torch_sdpa:bool=True
+    ):
+        for i in range(self.num_blocks):
+            x = self.blocks[i].decode_next_token_slots(x, k_cache[i], v_cache[i], positions, kv_len, attn_mask, torch_sdpa)
+        return x
+
+
+class T2SMLPInt8(T2SMLP):
+    """w1/w2 为 int8 动态量化的 Linear 模块(含偏置)的 T2SMLP, 只在 Python 中调用"""
+    def linear(self, x, w, b):
+        return w(x)
+
+
+class T2SBlockInt8(T2SBlock):
+    """qkv/out 为 int8 动态量化的 Linear 模块(含偏置)的 T2SBlock, 只在 Python 中调用"""
+    def linear(self, x, w, b):
+        return w(x)
+
+
+def _int8_linear(weight, bias=None):
+    """由权重张量构造 int8 动态量化的 Linear (如 MultiheadAttention 的 in_proj)"""
+    linear = nn.Linear(weight.shape[1], weight.shape[0], bias=bias is not None)
+    with torch.no_grad():
+        linear.weight.copy_(weight.float())
+        if bias is not None:
+            linear.bias.copy_(bias.float())
+    return torch.ao.quantization.quantize_dynamic(nn.Sequential(linear), {nn.Linear}, dtype=torch.qint8)[0]
+
+
+class T2SDecodeStep(nn.Module):
+    """
+    预分配KV缓存的单token解码步, 与 T2STransformer.decode_next_token_static 计算相同.
+    注意力覆盖整个缓存长度 max_len, 未写入的位置由 attn_mask 屏蔽, 每步输入形状固定, 便于 torch.compile 整体编译.
+    权重直接引用 T2SBlock 中的张量, 不额外占用内存.
+    """
+    def __init__(self, transformer: T2STransformer, max_len: int):
+        super().__init__()
+        self.max_len = max_len
+        self.layers = [
+            (
+                block.num_heads, block.hidden_dim,
+                block.qkv_w, block.qkv_b, block.out_w, block.out_b,
+                block.mlp.w1, block.mlp.b1, block.mlp.w2, block.mlp.b2,
+                block.norm_w1, block.norm_b1, float(block.norm_eps1),
+                block.norm_w2, block.norm_b2, float(block.norm_eps2),
+            )
+            for block in transformer.blocks
+        ]
+
+    def forward(self, x: torch.Tensor, k_cache: List[torch.Tensor], v_cache: List[torch.Tensor], pos: torch.Tensor, attn_mask: torch.Tensor):
+        """x (batch, 1, hidden), pos (1,) 写入位置, attn_mask (1, 1, 1, max_len) True 表示可见"""
+        batch_size = x.shape[0]
+        for i, (num_heads, hidden_dim, qkv_w, qkv_b, out_w, out_b, w1, b1, w2, b2,
+                norm_w1, norm_b1, norm_eps1, norm_w2, norm_b2, norm_eps2) in enumerate(self.layers):
+            q, k, v = F.linear(x, qkv_w, qkv_b).chunk(3, dim=-1)
+            k_cache[i].index_copy_(1, pos, k)
+            v_cache[i].index_copy_(1, pos, v)
+
+            q = q.view(batch_size, 1, num_heads, -1).transpose(1, 2)
+            k = k_cache[i].view(batch_size, self.max_len, num_heads, -1).transpose(1, 2)
+            v = v_cache[i].view(batch_size, self.max_len, num_heads, -1).transpose(1, 2)
+            attn = F.scaled_dot_product_attention(q, k, v, attn_mask)
+            attn = attn.transpose(1, 2).reshape(batch_size, 1, -1)
+            attn = F.linear(attn, out_w, out_b)
+
+            x = F.layer_norm(x + attn, [hidden_dim], norm_w1, norm_b1, norm_eps1)
+            x = x + F.linear(F.relu(F.linear(x, w1, b1)), w2, b2)
+            x = F.layer_norm(x, [hidden_dim], norm_w2, norm_b2, norm_eps2)
+        return x
+
+
+class DecodeMetrics:
+    """
+    一次GPT解码循环的指标: 解码步数、生成token数、耗时和结束原因("eos"/"early_stop"/"max_steps").
+    解码结束时调用 callback(metrics), 代替逐步的进度条和打印.
+    """
+    def __init__(self, callback: Optional[Callable[["DecodeMetrics"], None]] = None):
+        self.callback = callback
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.0
+        self.steps = 0
+        self.tokens = 0
+        self.prefix_len = 0
+        self.stop_reason = None
+
+    def finish(self, steps: int, tokens: int, stop_reason: str, prefix_len: int = 0):
+        self.elapsed = time.perf_counter() - self.start_time
+        self.steps = steps
+        self.tokens = tokens
+        self.prefix_len = prefix_len
+        self.stop_reason = stop_reason
+        MockVoxLogger.debug(
+            f"T2S decoding {stop_reason} [{prefix_len} -> {prefix_len + tokens}], "
+            f"{steps} steps, {self.tokens_per_second:.1f} tokens/s"
+        )
+        if self.callback is not None:
+            self.callback(self)
+
+    @property
+    def tokens_per_second(self):
+        return self.tokens / self.elapsed if self.elapsed > 0 else 0.0
+
+class DecodeStats:
+    """累计多次解码的 DecodeMetrics, 可直接作为 Text2SemanticDecoder.decode_hook"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decodes = 0
+        self.steps = 0
+        self.tokens = 0
+        self.elapsed = 0.0
+        self.stop_reasons = {}
+
+    def __call__(self, metrics: DecodeMetrics):
+        with self._lock:
+            self.decodes += 1
+            self.steps += metrics.steps
+            self.tokens += metrics.tokens
+            self.elapsed += metrics.elapsed
+            self.stop_reasons[metrics.stop_reason] = self.stop_reasons.get(metrics.stop_reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "decodes": self.decodes,
+                "steps": self.steps,
+                "tokens": self.tokens,
+                "tokens_per_second": self.tokens / self.elapsed if self.elapsed else 0.0,
+                "stop_reasons": dict(self.stop_reasons)
+            }
+
 
 class Text2SemanticDecoder(nn.Module):
     def __init__(self, config, norm_first=False, top_k=3):
@@ -315,6 +576,81 @@ class Text2SemanticDecoder(nn.Module):
             blocks.append(block)
         
         self.t2s_transformer = T2STransformer(self.num_layers, blocks)
+        # 每次推理解码结束时以 DecodeMetrics 调用, 也可在调用时通过 decode_metrics 参数单独指定
+        self.decode_hook: Optional[Callable[[DecodeMetrics], None]] = None
+        # compile_decode_step 成功后为编译好的单token解码步
+        self.compiled_decode_step = None
+        self.compiled_max_len = 0
+        self.quantized = False
+
+    def quantize_int8(self):
+        """
+        CPU 推理: Linear 层改为 int8 动态量化(激活保持 fp32), 并用量化后的层重建 t2s_transformer.
+        需在加载权重后调用, 之后不能再训练或转换精度.
+        """
+        torch.ao.quantization.quantize_dynamic(self, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        blocks = []
+        for i in range(self.num_layers):
+            layer = self.h.layers[i]
+            # linear1/linear2 已被原地量化; MultiheadAttention 的投影不是 nn.Linear, 单独构造
+            t2smlp = T2SMLPInt8(layer.linear1, None, layer.linear2, None)
+            block = T2SBlockInt8(
+                self.num_head,
+                self.model_dim,
+                t2smlp,
+                _int8_linear(layer.self_attn.in_proj_weight, layer.self_attn.in_proj_bias),
+                None,
+                _int8_linear(layer.self_attn.out_proj.weight, layer.self_attn.out_proj.bias),
+                None,
+                layer.norm1.weight,
+                layer.norm1.bias,
+                layer.norm1.eps,
+                layer.norm2.weight,
+                layer.norm2.bias,
+                layer.norm2.eps
+            )
+            blocks.append(block)
+        self.t2s_transformer = T2STransformer(self.num_layers, blocks)
+        self.compiled_decode_step = None
+        self.quantized = True
+        return self
+
+    def compile_decode_step(self, max_len: int, warmup_steps: int = 3) -> bool:
+        """
+        用 torch.compile 编译预分配KV缓存的单token解码步并预热. 之后 static_kv_cache 解码中
+        总长度不超过 max_len 的序列走编译路径, 其余走原路径; 编译或预热失败时保持原路径, 返回 False.
+        """
+        self.compiled_decode_step = None
+        if self.quantized:
+            MockVoxLogger.warning("T2S decode step compilation is not supported for int8 models, staying eager")
+            return False
+        if not hasattr(torch, "compile"):
+            MockVoxLogger.warning("torch.compile is not available, T2S decode step stays eager")
+            return False
+        weight = self.ar_predict_layer.weight
+        try:
+            step = T2SDecodeStep(self.t2s_transformer, max_len)
+            compiled = torch.compile(step, dynamic=False)
+            with torch.no_grad():
+                x = torch.zeros((1, 1, self.model_dim), dtype=weight.dtype, device=weight.device)
+                k_cache = [torch.zeros((1, max_len, self.model_dim), dtype=weight.dtype, device=weight.device) for _ in range(self.num_layers)]
+                v_cache = [torch.zeros_like(k) for k in k_cache]
+                positions = torch.arange(max_len, device=weight.device)
+                for pos in range(warmup_steps):
+                    attn_mask = (positions <= pos).view(1, 1, 1, max_len)
+                    compiled(x, k_cache, v_cache, positions[pos:pos + 1], attn_mask)
+        except Exception as e:
+            MockVoxLogger.warning(f"T2S decode step compilation failed, falling back to eager: {e}")
+            return False
+        self.compiled_decode_step = compiled
+        self.compiled_max_len = max_len
+        return True
+
+    def _decode_steps(self, kwargs):
+        """解码循环的步数迭代器与指标对象, progress=True 时显示进度条(调试用)"""
+        metrics = kwargs.get("decode_metrics") or DecodeMetrics(self.decode_hook)
+        steps = tqdm(range(1500)) if kwargs.get("progress", False) else range(1500)
+        return steps, metrics
 
     def make_input_data(self, x, x_lens, y, y_lens, bert_feature):
         x = self.ar_text_embedding(x)
@@ -494,6 +830,7 @@ class Text2SemanticDecoder(nn.Module):
             top_k: int = -100,
             early_stop_num: int = -1,
             temperature: float = 1.0,
+            **kwargs,
     ):
         x = self.ar_text_embedding(x)
         x = x + self.bert_proj(bert_feature.transpose(1, 2))
@@ -505,7 +842,9 @@ class Text2SemanticDecoder(nn.Module):
         x_len = x.shape[1]
         x_attn_mask = torch.zeros((x_len, x_len), dtype=torch.bool)
         stop = False
-        for _ in tqdm(range(1500)):
+        steps, metrics = self._decode_steps(kwargs)
+        stop_reason = "max_steps"
+        for idx in steps:
             y_emb = self.ar_audio_embedding(y)
             y_pos = self.ar_audio_position(y_emb)
             # x 和逐渐增长的 y 一起输入给模型
@@ -535,23 +874,24 @@ class Text2SemanticDecoder(nn.Module):
             )
 
             if early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num:
-                print("use early stop num:", early_stop_num)
+                stop_reason = "early_stop"
                 stop = True
 
             if torch.argmax(logits, dim=-1)[0] == self.EOS or samples[0, 0] == self.EOS:
                 # print(torch.argmax(logits, dim=-1)[0] == self.EOS, samples[0, 0] == self.EOS)
+                stop_reason = "eos"
                 stop = True
             if stop:
                 if prompts.shape[1] == y.shape[1]:
                     y = torch.concat([y, torch.zeros_like(samples)], dim=1)
-                    print("bad zero prediction")
-                print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                    MockVoxLogger.warning("T2S bad zero prediction")
                 break
             # 本次生成的 semantic_ids 和之前的 y 构成新的 y
             # print(samples.shape)#[1,1]#第一个1是bs
             # import os
             # os._exit(2333)
             y = torch.concat([y, samples], dim=1)
+        metrics.finish(idx + 1, y.shape[1] - prefix_len, stop_reason, prefix_len)
         return y
 
     def pad_y_eos(self, y, y_mask_int, eos_id):
@@ -561,6 +901,53 @@ class Text2SemanticDecoder(nn.Module):
         # 错位
         return targets[:, :-1], targets[:, 1:]
 
+    def prefill(
+        self,
+        x:torch.LongTensor,  #####全部文本token
+        prompts:torch.LongTensor,  ####参考音频token
+        bert_feature:torch.LongTensor,
+    ):
+        """
+        单条序列的首步前向(供连续批处理调度器使用).
+        返回 最后位置的logits, 各层KV缓存, 音频段提示长度
+        """
+        x = self.ar_text_embedding(x)
+        x = x + self.bert_proj(bert_feature.transpose(1, 2))
+        x = self.ar_text_position(x)
+
+        y_emb = self.ar_audio_embedding(prompts)
+        y_len = y_emb.shape[1]
+        y_pos = self.ar_audio_position(y_emb)
+        xy_pos = torch.concat([x, y_pos], dim=1)
+
+        x_len = x.shape[1]
+        src_len = x_len + y_len
+        x_attn_mask_pad = F.pad(
+            torch.zeros((x_len, x_len), dtype=torch.bool),
+            (0, y_len),
+            value=True,
+        )
+        y_attn_mask = F.pad(
+            torch.triu(torch.ones(y_len, y_len, dtype=torch.bool), diagonal=1),
+            (x_len, 0),
+            value=False,
+        )
+        xy_attn_mask = torch.concat([x_attn_mask_pad, y_attn_mask], dim=0)\
+                                                .unsqueeze(0)\
+                                                .expand(self.num_head, -1, -1)\
+                                                .view(1, self.num_head, src_len, src_len)\
+                                                .to(device=x.device, dtype=torch.bool)
+        xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+        logits = self.ar_predict_layer(xy_dec[:, -1])
+        return logits, k_cache, v_cache, y_len
+
+    def embed_next_tokens(self, tokens:torch.LongTensor, positions:torch.LongTensor):
+        """tokens (batch, 1) 在各自音频段位置 positions (batch,) 上的输入嵌入"""
+        y_emb = self.ar_audio_embedding(tokens)
+        pe = self.ar_audio_position.pe
+        pe = pe[0, positions.to(pe.device)].unsqueeze(1).to(dtype=y_emb.dtype, device=y_emb.device)
+        return y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * pe
+
     def infer_panel_batch_infer(
         self,
         x:List[torch.LongTensor],  #####全部文本token
@@ -575,7 +962,7 @@ class Text2SemanticDecoder(nn.Module):
         **kwargs,
     ):
         if prompts is None:
-            print("Warning: Prompt free is not supported batch_infer! switch to naive_infer")
+            MockVoxLogger.warning("Prompt free is not supported batch_infer! switch to naive_infer")
             return self.infer_panel_naive_batched(x, x_lens, prompts, bert_feature, top_k=top_k, top_p=top_p, early_stop_num=early_stop_num, temperature=temperature, **kwargs)
 
 
@@ -656,7 +1043,12 @@ class Text2SemanticDecoder(nn.Module):
         y_list = [None]*y.shape[0]
         batch_idx_map = list(range(y.shape[0]))
         idx_list = [None]*y.shape[0]
-        for idx in tqdm(range(1500)):
+        token_counts = token_histogram(y, self.vocab_size)
+        # 随机数生成器: 单个, 或每行一个的列表(随行一起移出批)
+        generator = kwargs.get("generator")
+        steps, metrics = self._decode_steps(kwargs)
+        stop_reason = "max_steps"
+        for idx in steps:
             if idx == 0:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, xy_padding_mask, False)
             else:
@@ -667,15 +1059,18 @@ class Text2SemanticDecoder(nn.Module):
 
             if idx == 0:
                 xy_attn_mask = F.pad(xy_attn_mask[:,:,-1].unsqueeze(-2),(0,1),value=False)
-                logits = logits[:, :-1]
             else:
                 xy_attn_mask = F.pad(xy_attn_mask,(0,1),value=False)
+            if(idx<11):###至少预测出10个token不然不给停止（0.4s）
+                logits = logits[:, :-1]
 
             samples = sample(
-                    logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
+                    logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature,
+                    token_counts=token_counts, generator=generator
                 )[0]
 
             y = torch.concat([y, samples], dim=1)
+            update_token_histogram(token_counts, samples)
             
             ####### 移除batch中已经生成完毕的序列,进一步优化计算量
             tokens = torch.argmax(logits, dim=-1)
@@ -699,6 +1094,9 @@ class Text2SemanticDecoder(nn.Module):
             if reserved_idx_of_batch_for_y is not None:
                 # index = torch.LongTensor(batch_idx_map).to(y.device)
                 y = torch.index_select(y, dim=0, index=reserved_idx_of_batch_for_y)
+                token_counts = torch.index_select(token_counts, dim=0, index=reserved_idx_of_batch_for_y)
+                if isinstance(generator, list):
+                    generator = [generator[i] for i in reserved_idx_of_batch_for_y.tolist()]
                 xy_attn_mask = torch.index_select(xy_attn_mask, dim=0, index=reserved_idx_of_batch_for_y)
                 if k_cache is not None :
                     for i in range(len(k_cache)):
@@ -707,7 +1105,7 @@ class Text2SemanticDecoder(nn.Module):
                 
                 
             if (early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num) or idx==1499:
-                print("use early stop num:", early_stop_num)
+                stop_reason = "max_steps" if idx == 1499 else "early_stop"
                 stop = True
                 for i, batch_index in enumerate(batch_idx_map):
                     batch_index = batch_idx_map[i]
@@ -715,13 +1113,14 @@ class Text2SemanticDecoder(nn.Module):
                     y_list[batch_index] = y[i, :-1]
                 
             if not (None in idx_list):
+                if not stop:
+                    stop_reason = "eos"
                 stop = True
                 
             if stop:
                 if y.shape[1]==0:
                     y = torch.concat([y, torch.zeros_like(samples)], dim=1)
-                    print("bad zero prediction")
-                print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                    MockVoxLogger.warning("T2S bad zero prediction")
                 break
 
             ####################### update next step ###################################
@@ -732,6 +1131,7 @@ class Text2SemanticDecoder(nn.Module):
             for i in range(x.shape[0]):
                 if idx_list[i] is None:
                     idx_list[i] = 1500-1  ###如果没有生成到EOS，就用最大长度代替
+        metrics.finish(idx + 1, sum(item.shape[-1] - prefix_len + 1 for item in y_list if item is not None), stop_reason, prefix_len)
                     
         if ref_free:
             return y_list, [0]*x.shape[0]
@@ -752,7 +1152,9 @@ class Text2SemanticDecoder(nn.Module):
         ):
         y_list = []
         idx_list = []
+        generator = kwargs.pop("generator", None)
         for i in range(len(x)):
+            kwargs["generator"] = generator[i] if isinstance(generator, list) else generator
             y, idx = self.infer_panel_naive(x[i].unsqueeze(0), 
                                                   x_lens[i], 
                                                   prompts[i].unsqueeze(0) if prompts is not None else None, 
@@ -768,7 +1170,7 @@ class Text2SemanticDecoder(nn.Module):
         
         return y_list, idx_list
     
-    def infer_panel_naive(
+    def infer_panel_naive_stream(
         self,
         x:torch.LongTensor,  #####全部文本token
         x_lens:torch.LongTensor,
@@ -781,6 +1183,7 @@ class Text2SemanticDecoder(nn.Module):
         repetition_penalty: float = 1.35,
         **kwargs
     ):
+        """逐token生成, 每步产出 (当前y, idx, 是否结束), 供边生成边解码使用"""
         x = self.ar_text_embedding(x)
         x = x + self.bert_proj(bert_feature.transpose(1, 2))
         x = self.ar_text_position(x)
@@ -830,9 +1233,33 @@ class Text2SemanticDecoder(nn.Module):
                                                 .view(bsz, self.num_head, src_len, src_len)\
                                                 .to(device=x.device, dtype=torch.bool)
 
-        for idx in tqdm(range(1500)):
+        # 预分配KV缓存: 提示长度 + 最多生成的token数, 避免每步 torch.cat
+        static_kv_cache = kwargs.get("static_kv_cache", False)
+        max_kv_len = src_len + (min(early_stop_num, 1500) if early_stop_num != -1 else 1500) + 1
+        # 放得进编译时的固定长度则走编译好的解码步
+        compiled_step = None
+        if static_kv_cache and self.compiled_decode_step is not None and bsz == 1 and max_kv_len <= self.compiled_max_len:
+            compiled_step = self.compiled_decode_step
+            max_kv_len = self.compiled_max_len
+            cache_positions = torch.arange(max_kv_len, device=x.device)
+        # 重复惩罚用的token计数, 逐步累加, 不必每步扫描整个 y
+        token_counts = token_histogram(y, self.vocab_size)
+        generator = kwargs.get("generator")
+        steps, metrics = self._decode_steps(kwargs)
+
+        for idx in steps:
             if xy_attn_mask is not None:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+                if static_kv_cache:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt_static(xy_pos, xy_attn_mask, max_kv_len, None)
+                else:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+            elif compiled_step is not None:
+                pos = src_len + idx - 1
+                xy_dec = compiled_step(
+                    xy_pos, k_cache, v_cache, cache_positions[pos:pos + 1], (cache_positions <= pos).view(1, 1, 1, -1)
+                )
+            elif static_kv_cache:
+                xy_dec = self.t2s_transformer.decode_next_token_static(xy_pos, k_cache, v_cache, src_len + idx - 1)
             else:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache)
 
@@ -846,29 +1273,54 @@ class Text2SemanticDecoder(nn.Module):
                 logits = logits[:, :-1]
 
             samples = sample(
-                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
+                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature,
+                token_counts=token_counts, generator=generator
             )[0]
 
             y = torch.concat([y, samples], dim=1)
+            update_token_histogram(token_counts, samples)
 
+            stop_reason = "max_steps"
             if early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num:
-                print("use early stop num:", early_stop_num)
+                stop_reason = "early_stop"
                 stop = True
 
             if torch.argmax(logits, dim=-1)[0] == self.EOS or samples[0, 0] == self.EOS:
+                stop_reason = "eos"
                 stop = True
             if stop:
                 if y.shape[1] == 0:
                     y = torch.concat([y, torch.zeros_like(samples)], dim=1)
-                    print("bad zero prediction")
-                print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                    MockVoxLogger.warning("T2S bad zero prediction")
+            if stop or idx == 1499:
+                metrics.finish(idx + 1, y.shape[1] - prefix_len, stop_reason, prefix_len)
+            yield y, idx, stop or idx == 1499
+            if stop:
                 break
 
             ####################### update next step ###################################
             y_emb = self.ar_audio_embedding(y[:, -1:])
             xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[:, y_len + idx].to(dtype=y_emb.dtype,device=y_emb.device)
 
-        if ref_free:
+
+    def infer_panel_naive(
+        self,
+        x:torch.LongTensor,  #####全部文本token
+        x_lens:torch.LongTensor,
+        prompts:torch.LongTensor,  ####参考音频token
+        bert_feature:torch.LongTensor,
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs
+    ):
+        for y, idx, _ in self.infer_panel_naive_stream(
+            x, x_lens, prompts, bert_feature, top_k, top_p, early_stop_num, temperature, repetition_penalty, **kwargs
+        ):
+            pass
+        if prompts is None:
             return y[:, :-1], 0
         return y[:, :-1], idx
     
@@ -886,4 +1338,9 @@ class Text2SemanticDecoder(nn.Module):
         repetition_penalty: float = 1.35,
         **kwargs
     ):
+        # x 为多句的列表时批量推理, parallel_infer 为真则所有句子在同一批中解码
+        if isinstance(x, list):
+            if kwargs.pop("parallel_infer", True):
+                return self.infer_panel_batch_infer(x, x_lens, prompts, bert_feature, top_k, top_p, early_stop_num, temperature, repetition_penalty, **kwargs)
+            return self.infer_panel_naive_batched(x, x_lens, prompts, bert_feature, top_k, top_p, early_stop_num, temperature, repetition_penalty, **kwargs)
         return self.infer_panel_naive(x, x_lens, prompts, bert_feature, top_k, top_p, early_stop_num, temperature, repetition_penalty, **kwargs)
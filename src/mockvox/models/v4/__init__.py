@@ -5,7 +5,7 @@ from .dataset import (
     Text2SemanticDataset,
     GPTBucketSampler
 )
-from .synthesizer import SynthesizerTrnV3
+from .synthesizer import SynthesizerTrnV3, CFM_STEP_TIERS, CFM_SCHEDULES
 
 __all__ = [
     "TextAudioSpeakerDataset",
@@ -13,5 +13,7 @@ __all__ = [
     "SoVITsBucketSampler",
     "Text2SemanticDataset",
     "GPTBucketSampler",
-    "SynthesizerTrnV3"
+    "SynthesizerTrnV3",
+    "CFM_STEP_TIERS",
+    "CFM_SCHEDULES"
 ]
\ No newline at end of file
@@ -3,10 +3,11 @@ import torch
 import torch.nn as nn
 from torch.nn import functional as F
 import contextlib
+import math
 import random
 
 from mockvox.text import symbols
-from mockvox.utils import sequence_mask
+from mockvox.utils import sequence_mask, randn_like_seeded
 from mockvox.nn import (
     MelStyleEncoder,
     ResidualVectorQuantizer,
@@ -161,6 +162,27 @@ class SynthesizerTrnV3(nn.Module):
         quantized, codes, commit_loss, quantized_list = self.quantizer(ssl)
         return codes.transpose(0, 1)
 
+# 推理质量档位(CFM步数)与时间步调度方式
+CFM_STEP_TIERS = (4, 8, 16, 32)
+CFM_SCHEDULES = ("uniform", "sway")
+# 训练时 shortcut 条件的最小步长, 更小的步长按普通流匹配(d=0)条件
+CFM_MIN_SHORTCUT_STEP = 1 / 64
+
+def cfm_time_steps(n_timesteps, schedule="uniform"):
+    """
+    返回 n_timesteps+1 个时间点 (0 到 1).
+    uniform: 等间隔; sway: t = 1 - cos(pi/2 * u), 在噪声端(t 接近 0)步长更小
+    """
+    if schedule == "uniform":
+        ts = [0]
+        d = 1 / n_timesteps
+        for _ in range(n_timesteps):
+            ts.append(ts[-1] + d)
+        return ts
+    if schedule == "sway":
+        return [1 - math.cos(math.pi / 2 * j / n_timesteps) for j in range(n_timesteps + 1)]
+    raise ValueError(f"Unknown CFM schedule: {schedule}")
+
 class CFM(nn.Module):
     def __init__(
         self,
@@ -174,27 +196,45 @@ class CFM(nn.Module):
         self.criterion = nn.MSELoss()
 
     @torch.inference_mode()
-    def inference(self, mu, x_lens, prompt, n_timesteps, temperature=1.0, inference_cfg_rate=0):
-        """Forward diffusion"""
+    def inference(self, mu, x_lens, prompt, n_timesteps, temperature=1.0, inference_cfg_rate=0, schedule="uniform", generator=None):
+        """
+        Forward diffusion
+        每一步把实际步长作为 d 条件传给 DiT(shortcut 训练), 非均匀调度下各步步长不同;
+        generator 为初始噪声的随机数生成器, 可为每行一个的列表
+        """
         B, T = mu.size(0), mu.size(1)
-        x = torch.randn([B, self.in_channels, T], device=mu.device,dtype=mu.dtype) * temperature
+        if isinstance(generator, list):
+            # 每行按自身长度从各自的生成器取噪声, 与该行单独推理时取到的噪声相同
+            x = mu.new_zeros([B, self.in_channels, T])
+            for i, row_generator in enumerate(generator):
+                length = int(x_lens[i])
+                x[i, :, :length] = randn_like_seeded(x[i, :, :length], row_generator)
+            x = x * temperature
+        else:
+            x = randn_like_seeded(mu.new_empty([B, self.in_channels, T]), generator) * temperature
+        # 多条长度不同的序列补齐成批时, 补齐部分保持为0
+        x_mask = sequence_mask(x_lens, T).unsqueeze(1).to(x.dtype) if B > 1 else None
+        if x_mask is not None:
+            x = x * x_mask
         prompt_len = prompt.size(-1)
         prompt_x = torch.zeros_like(x,dtype=mu.dtype)
         prompt_x[..., :prompt_len] = prompt[..., :prompt_len]
         x[..., :prompt_len] = 0
         mu = mu.transpose(2,1)
-        t = 0
-        d = 1 / n_timesteps
+        ts = cfm_time_steps(n_timesteps, schedule)
         for j in range(n_timesteps):
+            t = ts[j]
+            d = ts[j + 1] - ts[j]
             t_tensor = torch.ones(x.shape[0], device=x.device,dtype=mu.dtype) * t
-            d_tensor = torch.ones(x.shape[0], device=x.device,dtype=mu.dtype) * d
+            d_tensor = torch.ones(x.shape[0], device=x.device,dtype=mu.dtype) * (d if d >= CFM_MIN_SHORTCUT_STEP else 0)
             v_pred = self.estimator(x, prompt_x, x_lens, t_tensor,d_tensor, mu, use_grad_ckpt=False,drop_audio_cond=False,drop_text=False).transpose(2, 1)
             if inference_cfg_rate>1e-5:
                 neg = self.estimator(x, prompt_x, x_lens, t_tensor, d_tensor, mu, use_grad_ckpt=False, drop_audio_cond=True, drop_text=True).transpose(2, 1)
                 v_pred=v_pred+(v_pred-neg)*inference_cfg_rate
             x = x + d * v_pred
-            t = t + d
             x[:, :, :prompt_len] = 0
+            if x_mask is not None:
+                x = x * x_mask
         return x
     
     def forward(self, x1, x_lens, prompt_lens, mu, use_grad_ckpt):
@@ -2,7 +2,9 @@
 # reference: https://github.com/lifeiteng/vall-e
 import torch
 import torch.nn.functional as F
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Union
+
+from mockvox.utils.tools import exponential_like_seeded
 
 def sequence_mask(length, max_length=None):
     if max_length is None:
@@ -98,32 +100,109 @@ def topk_sampling(logits, top_k=10, top_p=1.0, temperature=1.0):
 
 def multinomial_sample_one_no_sync(
     probs_sort,
+    generator=None,
 ):  # Does multinomial sampling without a cuda synchronization
-    q = torch.empty_like(probs_sort).exponential_(1)
+    # generator: 单个 torch.Generator, 或每行一个的列表; None 用全局随机状态
+    q = exponential_like_seeded(probs_sort, generator)
     return torch.argmax(probs_sort / q, dim=-1, keepdim=True).to(dtype=torch.int)
 
 
+def token_histogram(tokens: torch.Tensor, vocab_size: int) -> torch.Tensor:
+    """tokens (batch, len) 中各token出现次数, 形状 (batch, vocab_size)"""
+    tokens = tokens.long()
+    counts = torch.zeros((tokens.shape[0], vocab_size), dtype=torch.int32, device=tokens.device)
+    return counts.scatter_add_(1, tokens, torch.ones_like(tokens, dtype=torch.int32))
+
+
+def update_token_histogram(counts: torch.Tensor, samples: torch.Tensor) -> torch.Tensor:
+    """把本步采样的 samples (batch, 1) 计入直方图"""
+    samples = samples.long()
+    return counts.scatter_add_(1, samples, torch.ones_like(samples, dtype=torch.int32))
+
+
+def apply_repetition_penalty(
+    logits,
+    previous_tokens: Optional[torch.Tensor] = None,
+    repetition_penalty: Union[float, torch.Tensor] = 1.0,
+    token_counts: Optional[torch.Tensor] = None,
+):
+    """
+    出现过的token: 正分数除以惩罚系数, 负分数乘以惩罚系数(每个token只惩罚一次).
+    优先使用解码循环维护的 token_counts 直方图, 避免每步对整个历史 gather/scatter.
+    与原实现一致, 原地修改 logits.
+    """
+    if not _any_not_equal(repetition_penalty, 1.0):
+        return logits
+    if token_counts is None:
+        if previous_tokens is None:
+            return logits
+        token_counts = token_histogram(previous_tokens, logits.size(-1))
+    if isinstance(repetition_penalty, torch.Tensor):
+        repetition_penalty = repetition_penalty.to(logits).unsqueeze(-1)
+    penalized = torch.where(logits < 0, logits * repetition_penalty, logits / repetition_penalty)
+    seen = token_counts[:, :logits.size(-1)] > 0
+    return logits.copy_(torch.where(seen, penalized, logits))
+
+
+def top_k_probs(
+    logits,
+    temperature: Union[float, torch.Tensor] = 1.0,
+    top_k: Union[int, torch.Tensor] = 15,
+    top_p: Optional[Union[float, torch.Tensor]] = None,
+):
+    """
+    不排序整个词表的 top-k + top-p: 先取最大的 k 个, 再在这 k 个里做 top-p.
+    top-p 的累计概率按整个词表归一化(logsumexp), 结果与"先全词表 top-p 再 top-k"相同.
+    返回 (token下标 (batch, k), 概率 (batch, k)), 被过滤的位置概率为0.
+    """
+    vocab_size = logits.size(-1)
+    if isinstance(top_k, torch.Tensor):
+        # 逐行 top_k, k<=0 表示不限制
+        top_k = top_k.to(device=logits.device, dtype=torch.long)
+        top_k = torch.where(top_k > 0, top_k, vocab_size).clamp(max=vocab_size)
+        k = int(top_k.max())
+    else:
+        k = min(top_k, vocab_size) if top_k > 0 else vocab_size
+    values, indices = torch.topk(logits, k)
+    removed = torch.zeros_like(values, dtype=torch.bool)
+    if isinstance(top_k, torch.Tensor):
+        removed |= torch.arange(k, device=logits.device).unsqueeze(0) >= top_k.unsqueeze(-1)
+
+    if top_p is not None and _any_less(top_p, 1.0):
+        if isinstance(top_p, torch.Tensor):
+            top_p = top_p.to(logits).unsqueeze(-1)
+        log_norm = torch.logsumexp(logits.float(), dim=-1, keepdim=True)
+        cum_probs = torch.cumsum(torch.exp(values.float() - log_norm), dim=-1)
+        removed |= cum_probs > top_p
+    removed[:, 0] = False  # keep at least one option
+
+    if isinstance(temperature, torch.Tensor):
+        values = values / temperature.to(values).clamp(min=1e-5).unsqueeze(-1)
+    else:
+        values = values / max(temperature, 1e-5)
+    values = values.masked_fill(removed, -float("Inf"))
+    return indices, torch.nn.functional.softmax(values, dim=-1)
+
+
 def logits_to_probs(
     logits,
     previous_tokens: Optional[torch.Tensor] = None,
-    temperature: float = 1.0,
-    top_k: Optional[int] = None,
-    top_p: Optional[int] = None,
-    repetition_penalty: float = 1.0,
+    temperature: Union[float, torch.Tensor] = 1.0,
+    top_k: Optional[Union[int, torch.Tensor]] = None,
+    top_p: Optional[Union[float, torch.Tensor]] = None,
+    repetition_penalty: Union[float, torch.Tensor] = 1.0,
+    token_counts: Optional[torch.Tensor] = None,
 ):
-    # if previous_tokens is not None:
-    #     previous_tokens = previous_tokens.squeeze()
-    # print(logits.shape,previous_tokens.shape)
-    # pdb.set_trace()
-    if previous_tokens is not None and repetition_penalty != 1.0:
-        previous_tokens = previous_tokens.long()
-        score = torch.gather(logits, dim=1, index=previous_tokens)
-        score = torch.where(
-            score < 0, score * repetition_penalty, score / repetition_penalty
-        )
-        logits.scatter_(dim=1, index=previous_tokens, src=score)
+    # temperature/top_k/top_p/repetition_penalty 可以是标量, 也可以是形状 (batch,) 的逐行参数
+    logits = apply_repetition_penalty(logits, previous_tokens, repetition_penalty, token_counts)
+
+    if top_k is not None:
+        indices, probs = top_k_probs(logits, temperature, top_k, top_p)
+        return torch.zeros_like(logits).scatter_(1, indices, probs.to(logits.dtype))
 
-    if top_p is not None and top_p < 1.0:
+    if top_p is not None and _any_less(top_p, 1.0):
+        if isinstance(top_p, torch.Tensor):
+            top_p = top_p.to(logits).unsqueeze(-1)
         sorted_logits, sorted_indices = torch.sort(logits, descending=True)
         cum_probs = torch.cumsum(
             torch.nn.functional.softmax(sorted_logits, dim=-1), dim=-1
@@ -135,26 +214,50 @@ def logits_to_probs(
         )
         logits = logits.masked_fill(indices_to_remove, -float("Inf"))
 
-    logits = logits / max(temperature, 1e-5)
-
-    if top_k is not None:
-        v, _ = torch.topk(logits, min(top_k, logits.size(-1)))
-        pivot = v[: , -1].unsqueeze(-1)
-        logits = torch.where(logits < pivot, -float("Inf"), logits)
+    if isinstance(temperature, torch.Tensor):
+        logits = logits / temperature.to(logits).clamp(min=1e-5).unsqueeze(-1)
+    else:
+        logits = logits / max(temperature, 1e-5)
 
     probs = torch.nn.functional.softmax(logits, dim=-1)
     return probs
 
+def _any_not_equal(value, target):
+    if isinstance(value, torch.Tensor):
+        return bool((value != target).any())
+    return value != target
+
+def _any_less(value, target):
+    if isinstance(value, torch.Tensor):
+        return bool((value < target).any())
+    return value < target
+
 
 def sample(
     logits,
     previous_tokens: Optional[torch.Tensor] = None,
     **sampling_kwargs,
 ) -> Tuple[torch.Tensor, torch.Tensor]:
-    probs = logits_to_probs(
-        logits=logits, previous_tokens=previous_tokens, **sampling_kwargs
+    generator = sampling_kwargs.pop("generator", None)
+    top_k = sampling_kwargs.get("top_k")
+    if top_k is None:
+        probs = logits_to_probs(
+            logits=logits, previous_tokens=previous_tokens, **sampling_kwargs
+        )
+        idx_next = multinomial_sample_one_no_sync(probs, generator)
+        return idx_next, probs
+    # 只在 top-k 范围内采样
+    logits = apply_repetition_penalty(
+        logits,
+        previous_tokens,
+        sampling_kwargs.get("repetition_penalty", 1.0),
+        sampling_kwargs.get("token_counts"),
+    )
+    indices, probs_k = top_k_probs(
+        logits, sampling_kwargs.get("temperature", 1.0), top_k, sampling_kwargs.get("top_p")
     )
-    idx_next = multinomial_sample_one_no_sync(probs)
+    idx_next = indices.gather(1, multinomial_sample_one_no_sync(probs_k, generator).long()).to(dtype=torch.int)
+    probs = torch.zeros_like(logits).scatter_(1, indices, probs_k.to(logits.dtype))
     return idx_next, probs
 
 def dpo_loss(policy_chosen_logps: torch.FloatTensor,
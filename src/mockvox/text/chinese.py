@@ -1,5 +1,7 @@
 import os
 import re
+import threading
+from functools import lru_cache
 from pypinyin import lazy_pinyin, Style
 from pypinyin.contrib.tone_convert import to_initials, to_finals_tone3
 from mockvox.text.g2pw import correct_pronunciation
@@ -17,11 +19,20 @@ pinyin_to_symbol_map = {
 
 g2pw_model_path = os.path.join(PRETRAINED_PATH, 'G2PWModel')
 bert_model_path = os.path.join(PRETRAINED_PATH, 'GPT-SoVITS/chinese-roberta-wwm-ext-large')
-g2pw = G2PWPinyin(
-    model_dir=g2pw_model_path,
-    model_source=bert_model_path,
-    v_to_u=False,
-    neutral_tone_with_five=True)
+_g2pw = None
+_g2pw_lock = threading.Lock()
+
+def get_g2pw() -> G2PWPinyin:
+    """g2pW 多音字模型在首次中文 G2P 时加载(缺少模型文件时下载), 导入本模块不加载"""
+    global _g2pw
+    with _g2pw_lock:
+        if _g2pw is None:
+            _g2pw = G2PWPinyin(
+                model_dir=g2pw_model_path,
+                model_source=bert_model_path,
+                v_to_u=False,
+                neutral_tone_with_five=True)
+    return _g2pw
 
 rep_map = {
     "：": ",",
@@ -42,6 +53,24 @@ rep_map = {
 }
 
 tone_modifier = ToneSandhi()
+text_normalizer = TextNormalizer()
+
+# 文本规整结果缓存: 整篇预测多音字时已规整过的文本, 逐句前端处理时直接复用
+NORMALIZE_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_text(text: str, mixed: bool) -> str:
+    sentences = text_normalizer.normalize(text)
+    dest_text = ""
+    for sentence in sentences:
+        if mixed:
+            dest_text += ChineseNormalizer.replace_punctuation_with_en(sentence)
+        else:
+            dest_text += ChineseNormalizer.replace_punctuation(sentence)
+
+    # 避免重复标点引起的参考泄露
+    dest_text = ChineseNormalizer.replace_consecutive_punctuation(dest_text)
+    return dest_text
 
 def _get_initials_finals(word):
     initials = []
@@ -106,29 +135,44 @@ def _merge_erhua(initials: list[str],
 
 class ChineseNormalizer:
     def __init__(self, mixed=False):
-        self.tx = TextNormalizer()
+        self.tx = text_normalizer
         self.mixed = mixed
 
     def g2p(self, text):
-        pattern = r"(?<=[{0}])\s*".format("".join(punctuation))
-        sentences = [i for i in re.split(pattern, text) if i.strip() != ""]
+        sentences = self._split(text)
+        # 全部分句的多音字一次批量预测, 逐句推理时直接命中
+        get_g2pw().prefetch([self._strip_english(seg) for seg in sentences])
         phones, word2ph = self._g2p(sentences)
         return phones, word2ph
 
+    def prefetch(self, texts):
+        """规整整篇文本并一次批量预测其中全部多音字, 之后逐句 g2p 直接命中"""
+        segments = [seg for text in texts for seg in self._split(self.do_normalize(text))]
+        get_g2pw().prefetch([self._strip_english(seg) for seg in segments])
+
+    @staticmethod
+    def _split(text):
+        pattern = r"(?<=[{0}])\s*".format("".join(punctuation))
+        return [i for i in re.split(pattern, text) if i.strip() != ""]
+
+    @staticmethod
+    def _strip_english(seg):
+        return re.sub("[a-zA-Z]+", "", seg)
+
     def _g2p(self, segments):
         phones_list = []
         word2ph = []
         for seg in segments:
             pinyins = []
             # Replace all English words in the sentence
-            seg = re.sub("[a-zA-Z]+", "", seg)
+            seg = self._strip_english(seg)
             seg_cut = psg.lcut(seg)
             seg_cut = tone_modifier.pre_merge_for_modify(seg_cut)
             initials = []
             finals = []
 
             # g2pw采用整句推理
-            pinyins = g2pw.lazy_pinyin(seg, neutral_tone_with_five=True, style=Style.TONE3)
+            pinyins = get_g2pw().lazy_pinyin(seg, neutral_tone_with_five=True, style=Style.TONE3)
 
             pre_word_length = 0
             for word, pos in seg_cut:
@@ -250,14 +294,4 @@ class ChineseNormalizer:
         return result
         
     def do_normalize(self, text) -> str:
-        sentences = self.tx.normalize(text)
-        dest_text = ""
-        for sentence in sentences:
-            if self.mixed:
-                dest_text += self.replace_punctuation_with_en(sentence)
-            else:
-                dest_text += self.replace_punctuation(sentence)
-
-        # 避免重复标点引起的参考泄露
-        dest_text = self.replace_consecutive_punctuation(dest_text)
-        return dest_text
\ No newline at end of file
+        return normalize_text(text, self.mixed)
\ No newline at end of file
@@ -85,6 +85,13 @@ def prepare_onnx_input(tokenizer,
         char_ids.append(char_id)
         position_ids.append(position_id)
 
+    # 不同句子的查询长度不同, 补齐到批内最长(补齐位置 attention_mask 为0, 不影响结果)
+    max_tokens = max([len(input_id) for input_id in input_ids], default=0)
+    pad_id = tokenizer.pad_token_id or 0
+    input_ids = [input_id + [pad_id] * (max_tokens - len(input_id)) for input_id in input_ids]
+    token_type_ids = [token_type_id + [0] * (max_tokens - len(token_type_id)) for token_type_id in token_type_ids]
+    attention_masks = [attention_mask + [0] * (max_tokens - len(attention_mask)) for attention_mask in attention_masks]
+
     outputs = {
         'input_ids': np.array(input_ids).astype(np.int64),
         'token_type_ids': np.array(token_type_ids).astype(np.int64),
@@ -34,6 +34,12 @@ class G2PWPinyin(Pinyin):
     def get_seg(self, **kwargs):
         return simple_seg
 
+    def prefetch(self, texts):
+        """按 lazy_pinyin 相同的分词取出全部汉字串, 一次批量预测多音字"""
+        hans = [word for text in texts if text for word in self.seg(text) if RE_HANS.match(word)]
+        if hans:
+            self._g2pw.prefetch(hans)
+
 
 class Converter(UltimateConverter):
     def __init__(self, g2pw_instance, v_to_u=False,
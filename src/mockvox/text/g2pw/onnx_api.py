@@ -5,7 +5,9 @@ import warnings
 warnings.filterwarnings("ignore")
 import json
 import os
+import threading
 import zipfile,requests
+from collections import OrderedDict
 from typing import Any
 from typing import Dict
 from typing import List
@@ -24,6 +26,9 @@ from .dataset import get_phoneme_labels
 from .dataset import prepare_onnx_input
 from .utils import load_config
 from mockvox.text.zh_normalization import tranditional_to_simplified
+from mockvox.config import get_config
+
+cfg = get_config()
 
 model_version = '1.1'
 
@@ -85,7 +90,8 @@ class G2PWOnnxConverter:
         sess_options = onnxruntime.SessionOptions()
         sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
         sess_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
-        sess_options.intra_op_num_threads = 2
+        sess_options.intra_op_num_threads = cfg.G2PW_INTRA_OP_THREADS
+        sess_options.inter_op_num_threads = cfg.G2PW_INTER_OP_THREADS
         try:
             self.session_g2pW = onnxruntime.InferenceSession(os.path.join(uncompress_path, 'g2pW.onnx'),sess_options=sess_options, providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
         except:
@@ -162,6 +168,12 @@ class G2PWOnnxConverter:
         if self.enable_opencc:
             self.cc = OpenCC('s2tw')
 
+        # 汉字串 -> 预测结果, 整篇文本批量预测后逐句查询时直接命中
+        self.cache_size = cfg.G2PW_CACHE_SIZE
+        self.batch_size = cfg.G2PW_BATCH_SIZE
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
     def _convert_bopomofo_to_pinyin(self, bopomofo: str) -> str:
         tone = bopomofo[-1]
         assert tone in '12345'
@@ -176,6 +188,43 @@ class G2PWOnnxConverter:
         if isinstance(sentences, str):
             sentences = [sentences]
 
+        results = [self._cache_get(sent) for sent in sentences]
+        misses = list(dict.fromkeys(
+            sent for sent, result in zip(sentences, results) if result is None))
+        if len(misses) == 0:
+            return results
+
+        predicted = dict(zip(misses, self._predict(misses)))
+        for sent in misses:
+            self._cache_put(sent, predicted[sent])
+        return [
+            list(predicted[sent]) if result is None else result
+            for sent, result in zip(sentences, results)
+        ]
+
+    def prefetch(self, sentences: List[str]):
+        """一次批量预测整篇文本的全部多音字并缓存, 之后逐句调用直接命中"""
+        if self.cache_size > 0:
+            self(sentences)
+
+    def _cache_get(self, sent: str):
+        with self._cache_lock:
+            result = self._cache.get(sent)
+            if result is None:
+                return None
+            self._cache.move_to_end(sent)
+            return list(result)
+
+    def _cache_put(self, sent: str, result: List[str]):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[sent] = list(result)
+            self._cache.move_to_end(sent)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _predict(self, sentences: List[str]) -> List[List[str]]:
         if self.enable_opencc:
             translated_sentences = []
             for sent in sentences:
@@ -190,20 +239,28 @@ class G2PWOnnxConverter:
             # sentences no polyphonic words
             return partial_results
 
-        onnx_input = prepare_onnx_input(
-            tokenizer=self.tokenizer,
-            labels=self.labels,
-            char2phonemes=self.char2phonemes,
-            chars=self.chars,
-            texts=texts,
-            query_ids=query_ids,
-            use_mask=self.config.use_mask,
-            window_size=None)
-
-        preds, confidences = predict(
-            session=self.session_g2pW,
-            onnx_input=onnx_input,
-            labels=self.labels)
+        # 按句子长度排序后分批, 同一批内补齐的长度接近
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batch_size = self.batch_size if self.batch_size > 0 else len(order)
+        preds = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            onnx_input = prepare_onnx_input(
+                tokenizer=self.tokenizer,
+                labels=self.labels,
+                char2phonemes=self.char2phonemes,
+                chars=self.chars,
+                texts=[texts[i] for i in batch],
+                query_ids=[query_ids[i] for i in batch],
+                use_mask=self.config.use_mask,
+                window_size=None)
+
+            batch_preds, _ = predict(
+                session=self.session_g2pW,
+                onnx_input=onnx_input,
+                labels=self.labels)
+            for i, pred in zip(batch, batch_preds):
+                preds[i] = pred
         if self.config.use_char_phoneme:
             preds = [pred.split(' ')[1] for pred in preds]
 
@@ -1,5 +1,6 @@
 # reference: https://github.com/ORI-Muchim/MB-iSTFT-VITS-Korean/blob/main/text/korean.py
 import re
+import threading
 from jamo import h2j, j2hcj, hangul_to_jamo
 import ko_pron
 from g2pk2 import G2p
@@ -249,13 +250,22 @@ def korean_to_lazy_ipa(text):
     return text
 
 
-_g2p = G2p()
+_g2p = None
+_g2p_lock = threading.Lock()
+
+def get_g2p() -> G2p:
+    """g2pk2 在首次韩语 G2P 时创建(依赖 nltk 的 cmudict 等资源), 导入本模块不创建"""
+    global _g2p
+    with _g2p_lock:
+        if _g2p is None:
+            _g2p = G2p()
+    return _g2p
 
 
 def korean_to_ipa(text):
     text = latin_to_hangul(text)
     text = number_to_hangul(text)
-    text = _g2p(text)
+    text = get_g2p()(text)
     text = fix_g2pk2_error(text)
     text = korean_to_lazy_ipa(text)
     return text.replace("ʧ", "tʃ").replace("ʥ", "dʑ")
@@ -292,7 +302,7 @@ class KoreanNormalizer:
         return text
 
     def g2p(self, text):
-        text = _g2p(text)
+        text = get_g2p()(text)
         phones, word2ph = divide_hangul(text)
         phones = fix_g2pk2_error(phones)
         phones = re.sub(r"([\u3131-\u3163])$", r"\1.", phones)
@@ -48,3 +48,8 @@ class Normalizer:
     
     def g2p(self, text):
         return self.normalizer.g2p(text)
+
+    def prefetch(self, texts):
+        '''整篇文本的批量预处理(如中文多音字批量预测), 未实现的语言不做处理'''
+        if hasattr(self.normalizer, "prefetch"):
+            self.normalizer.prefetch(texts)
@@ -27,14 +27,17 @@ for i, item in enumerate(simplified_charcters):
     t2s_dict[traditional_characters[i]] = item
 
 
+# 导入时构建的 str.translate 映射表, 转换时不再逐字查字典
+t2s_table = str.maketrans(t2s_dict)
+s2t_table = str.maketrans(s2t_dict)
+
+
 def tranditional_to_simplified(text: str) -> str:
-    return "".join(
-        [t2s_dict[item] if item in t2s_dict else item for item in text])
+    return text.translate(t2s_table)
 
 
 def simplified_to_traditional(text: str) -> str:
-    return "".join(
-        [s2t_dict[item] if item in s2t_dict else item for item in text])
+    return text.translate(s2t_table)
 
 
 if __name__ == "__main__":
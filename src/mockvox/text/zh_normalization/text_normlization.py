@@ -56,6 +56,38 @@ from .quantifier import replace_measure
 from .quantifier import replace_temperature
 
 
+# 逐字符替换(含希腊字母与兜底的数学运算符), 替换结果都是汉字, 互不影响, 合并为一张映射表
+POST_REPLACE_MAP = {
+    '/': '每',
+    '①': '一', '②': '二', '③': '三', '④': '四', '⑤': '五',
+    '⑥': '六', '⑦': '七', '⑧': '八', '⑨': '九', '⑩': '十',
+    'α': '阿尔法', 'β': '贝塔', 'γ': '伽玛', 'Γ': '伽玛', 'δ': '德尔塔', 'Δ': '德尔塔',
+    'ε': '艾普西龙', 'ζ': '捷塔', 'η': '依塔', 'θ': '西塔', 'Θ': '西塔', 'ι': '艾欧塔',
+    'κ': '喀帕', 'λ': '拉姆达', 'Λ': '拉姆达', 'μ': '缪', 'ν': '拗', 'ξ': '克西', 'Ξ': '克西',
+    'ο': '欧米克伦', 'π': '派', 'Π': '派', 'ρ': '肉', 'ς': '西格玛', 'Σ': '西格玛', 'σ': '西格玛',
+    'τ': '套', 'υ': '宇普西龙', 'φ': '服艾', 'Φ': '服艾', 'χ': '器', 'ψ': '普赛', 'Ψ': '普赛',
+    'ω': '欧米伽', 'Ω': '欧米伽',
+    # 兜底数学运算，顺便兼容懒人用语
+    '+': '加', '-': '减', '×': '乘', '÷': '除', '=': '等',
+}
+POST_REPLACE_TABLE = str.maketrans(POST_REPLACE_MAP)
+
+# 全角字母与数字转半角; F2H_SPACE 的键是字符而非码位, str.translate 不会生效, 保持原行为不合并
+F2H_TABLE = {**F2H_ASCII_LETTERS, **F2H_DIGITS}
+
+RE_SPLIT_FILTER = re.compile(r'[——《》【】<>{}()（）#&@“”^_|\\]')
+# re filter special characters, have one more character "-" than RE_SPLIT_FILTER
+RE_POST_FILTER = re.compile(r'[-——《》【】<=>{}()（）#&@“”^_|\\]')
+RE_NEWLINES = re.compile(r'\n+')
+
+# NSW 片段: 任何规则的匹配都从下列字符开始, 且其中相邻两个这类字符之间最多隔4个其他字符
+# (如 "年"、"摄氏度~"), 匹配末尾最多再带4个其他字符(如 "多千万元").
+# 片段之外的文字不会被任何规则改写, 片段边界两侧也不是数字或运算符, 前后查找的结果与整句一致
+NSW_CHARS = r'\dA-Za-z.+\-×÷=⁰¹²³⁴⁵⁶⁷⁸⁹ˣʸⁿ'
+RE_NSW_SPAN = re.compile(
+    r'[{0}](?:[^{0}]{{0,4}}[{0}])*[^{0}]{{0,4}}'.format(NSW_CHARS))
+
+
 class TextNormalizer():
     def __init__(self):
         self.SENTENCE_SPLITOR = re.compile(r'([：、，；。？！,;?!][”’]?)')
@@ -71,100 +103,70 @@ class TextNormalizer():
         if lang == "zh":
             text = text.replace(" ", "")
             # 过滤掉特殊字符
-            text = re.sub(r'[——《》【】<>{}()（）#&@“”^_|\\]', '', text)
+            text = RE_SPLIT_FILTER.sub('', text)
         text = self.SENTENCE_SPLITOR.sub(r'\1\n', text)
         text = text.strip()
-        sentences = [sentence.strip() for sentence in re.split(r'\n+', text)]
+        sentences = [sentence.strip() for sentence in RE_NEWLINES.split(text)]
         return sentences
 
     def _post_replace(self, sentence: str) -> str:
-        sentence = sentence.replace('/', '每')
-        # sentence = sentence.replace('~', '至')
-        # sentence = sentence.replace('～', '至')
-        sentence = sentence.replace('①', '一')
-        sentence = sentence.replace('②', '二')
-        sentence = sentence.replace('③', '三')
-        sentence = sentence.replace('④', '四')
-        sentence = sentence.replace('⑤', '五')
-        sentence = sentence.replace('⑥', '六')
-        sentence = sentence.replace('⑦', '七')
-        sentence = sentence.replace('⑧', '八')
-        sentence = sentence.replace('⑨', '九')
-        sentence = sentence.replace('⑩', '十')
-        sentence = sentence.replace('α', '阿尔法')
-        sentence = sentence.replace('β', '贝塔')
-        sentence = sentence.replace('γ', '伽玛').replace('Γ', '伽玛')
-        sentence = sentence.replace('δ', '德尔塔').replace('Δ', '德尔塔')
-        sentence = sentence.replace('ε', '艾普西龙')
-        sentence = sentence.replace('ζ', '捷塔')
-        sentence = sentence.replace('η', '依塔')
-        sentence = sentence.replace('θ', '西塔').replace('Θ', '西塔')
-        sentence = sentence.replace('ι', '艾欧塔')
-        sentence = sentence.replace('κ', '喀帕')
-        sentence = sentence.replace('λ', '拉姆达').replace('Λ', '拉姆达')
-        sentence = sentence.replace('μ', '缪')
-        sentence = sentence.replace('ν', '拗')
-        sentence = sentence.replace('ξ', '克西').replace('Ξ', '克西')
-        sentence = sentence.replace('ο', '欧米克伦')
-        sentence = sentence.replace('π', '派').replace('Π', '派')
-        sentence = sentence.replace('ρ', '肉')
-        sentence = sentence.replace('ς', '西格玛').replace('Σ', '西格玛').replace(
-            'σ', '西格玛')
-        sentence = sentence.replace('τ', '套')
-        sentence = sentence.replace('υ', '宇普西龙')
-        sentence = sentence.replace('φ', '服艾').replace('Φ', '服艾')
-        sentence = sentence.replace('χ', '器')
-        sentence = sentence.replace('ψ', '普赛').replace('Ψ', '普赛')
-        sentence = sentence.replace('ω', '欧米伽').replace('Ω', '欧米伽')
-        # 兜底数学运算，顺便兼容懒人用语
-        sentence = sentence.replace('+', '加')
-        sentence = sentence.replace('-', '减')
-        sentence = sentence.replace('×', '乘')
-        sentence = sentence.replace('÷', '除')
-        sentence = sentence.replace('=', '等')
-        # re filter special characters, have one more character "-" than line 68
-        sentence = re.sub(r'[-——《》【】<=>{}()（）#&@“”^_|\\]', '', sentence)
+        sentence = sentence.translate(POST_REPLACE_TABLE)
+        sentence = RE_POST_FILTER.sub('', sentence)
         return sentence
 
-    def normalize_sentence(self, sentence: str) -> str:
-        # basic character conversions
-        sentence = tranditional_to_simplified(sentence)
-        sentence = sentence.translate(F2H_ASCII_LETTERS).translate(
-            F2H_DIGITS).translate(F2H_SPACE)
-
+    def _normalize_nsw(self, text: str) -> str:
+        """
+        对一个NSW片段按顺序应用全部规则. 后面的规则会处理前面规则的输出
+        (如 "2m" -> "2米" -> "两米"), 因此片段内仍逐条执行;
+        匹配必须包含的字符不在当前文本中时跳过该规则
+        """
         # number related NSW verbalization
-        sentence = RE_DATE.sub(replace_date, sentence)
-        sentence = RE_DATE2.sub(replace_date2, sentence)
+        if '年' in text:
+            text = RE_DATE.sub(replace_date, text)
+        text = RE_DATE2.sub(replace_date2, text)
 
         # range first
-        sentence = RE_TIME_RANGE.sub(replace_time, sentence)
-        sentence = RE_TIME.sub(replace_time, sentence)
+        if ':' in text:
+            text = RE_TIME_RANGE.sub(replace_time, text)
+            text = RE_TIME.sub(replace_time, text)
 
         # 处理~波浪号作为至的替换
-        sentence = RE_TO_RANGE.sub(replace_to_range, sentence)
-        sentence = RE_TEMPERATURE.sub(replace_temperature, sentence)
-        sentence = replace_measure(sentence)
+        if '~' in text:
+            text = RE_TO_RANGE.sub(replace_to_range, text)
+        if '度' in text or '℃' in text or '°' in text:
+            text = RE_TEMPERATURE.sub(replace_temperature, text)
+        text = replace_measure(text)
 
         # 处理数学运算
-        while RE_ASMD.search(sentence):
-            sentence = RE_ASMD.sub(replace_asmd, sentence)
-        sentence = RE_POWER.sub(replace_power, sentence)
-
-        sentence = RE_FRAC.sub(replace_frac, sentence)
-        sentence = RE_PERCENTAGE.sub(replace_percentage, sentence)
-        sentence = RE_MOBILE_PHONE.sub(replace_mobile, sentence)
-
-        sentence = RE_TELEPHONE.sub(replace_phone, sentence)
-        sentence = RE_NATIONAL_UNIFORM_NUMBER.sub(replace_phone, sentence)
+        while RE_ASMD.search(text):
+            text = RE_ASMD.sub(replace_asmd, text)
+        text = RE_POWER.sub(replace_power, text)
+
+        if '/' in text:
+            text = RE_FRAC.sub(replace_frac, text)
+        if '%' in text:
+            text = RE_PERCENTAGE.sub(replace_percentage, text)
+        text = RE_MOBILE_PHONE.sub(replace_mobile, text)
+
+        text = RE_TELEPHONE.sub(replace_phone, text)
+        text = RE_NATIONAL_UNIFORM_NUMBER.sub(replace_phone, text)
+
+        if '-' in text or '~' in text:
+            text = RE_RANGE.sub(replace_range, text)
+            text = RE_INTEGER.sub(replace_negative_num, text)
+        text = RE_DECIMAL_NUM.sub(replace_number, text)
+        text = RE_POSITIVE_QUANTIFIERS.sub(replace_positive_quantifier, text)
+        text = RE_DEFAULT_NUM.sub(replace_default_num, text)
+        text = RE_NUMBER.sub(replace_number, text)
+        return text
 
-        sentence = RE_RANGE.sub(replace_range, sentence)
+    def normalize_sentence(self, sentence: str) -> str:
+        # basic character conversions
+        sentence = tranditional_to_simplified(sentence)
+        sentence = sentence.translate(F2H_TABLE)
 
-        sentence = RE_INTEGER.sub(replace_negative_num, sentence)
-        sentence = RE_DECIMAL_NUM.sub(replace_number, sentence)
-        sentence = RE_POSITIVE_QUANTIFIERS.sub(replace_positive_quantifier,
-                                               sentence)
-        sentence = RE_DEFAULT_NUM.sub(replace_default_num, sentence)
-        sentence = RE_NUMBER.sub(replace_number, sentence)
+        # 一次扫描找出全部NSW片段, 只对片段应用规则, 其余文字原样保留
+        sentence = RE_NSW_SPAN.sub(lambda match: self._normalize_nsw(match.group(0)), sentence)
         sentence = self._post_replace(sentence)
 
         return sentence
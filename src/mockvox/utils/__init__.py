@@ -41,6 +41,8 @@ __all__ = [
     "kl_divergence",
     "rand_gumbel",
     "rand_gumbel_like",
+    "randn_like_seeded",
+    "exponential_like_seeded",
     "slice_segments",
     "rand_slice_segments",
     "get_timing_signal_1d",
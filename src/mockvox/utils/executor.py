@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""有界线程池: 把阻塞调用(模型加载、合成、磁盘读写)移出事件循环"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 流式合成时线程与事件循环之间最多缓存的数据块数
+STREAM_QUEUE_SIZE = 8
+
+class ExecutorOverloaded(Exception):
+    """线程池与等待队列都已满"""
+
+class BoundedExecutor:
+    """
+    最多 max_workers 个任务同时执行, 另有最多 max_queue 个任务排队;
+    超出时 submit/run/stream 立即抛出 ExecutorOverloaded, 由接口返回 503.
+    """
+    def __init__(self, max_workers: int, max_queue: int, name: str = "executor"):
+        self.max_workers = max(max_workers, 1)
+        self.max_queue = max(max_queue, 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务, 返回 concurrent.futures.Future"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorOverloaded()
+        with self._lock:
+            self._pending += 1
+        try:
+            return self._executor.submit(self._call, fn, args, kwargs)
+        except BaseException:
+            self._release(started=False)
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        """在线程池中执行 fn 并等待结果"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stream(self, gen_fn, *args, **kwargs):
+        """
+        在线程池中迭代同步生成器 gen_fn(*args, **kwargs), 返回异步迭代器.
+        调用时立即占用名额(满时抛出 ExecutorOverloaded); 数据块经有界的 asyncio.Queue 传给事件循环,
+        消费方断开时生成器在线程中被关闭.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        cancelled = threading.Event()
+        done = object()
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def produce():
+            generator = gen_fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    if cancelled.is_set():
+                        break
+                    put((item, None))
+                    if cancelled.is_set():
+                        break
+            except BaseException as e:
+                if not cancelled.is_set():
+                    put((done, e))
+                return
+            finally:
+                generator.close()
+            if not cancelled.is_set():
+                put((done, None))
+
+        self.submit(produce)
+
+        async def consume():
+            try:
+                while True:
+                    item, error = await queue.get()
+                    if item is done:
+                        if error is not None:
+                            raise error
+                        return
+                    yield item
+            finally:
+                cancelled.set()
+                # 腾出队列, 让阻塞在 put 上的线程返回
+                while not queue.empty():
+                    queue.get_nowait()
+        return consume()
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(started=True)
+
+    def _release(self, started: bool):
+        with self._lock:
+            if started:
+                self._running -= 1
+                self._completed += 1
+            else:
+                self._pending -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -76,6 +76,20 @@ def rand_gumbel_like(x):
     g = rand_gumbel(x.size()).to(dtype=x.dtype, device=x.device)
     return g
 
+def _rows_like(x, generator, fill):
+    """按 generator 生成与 x 同形状的随机张量: None 用全局随机状态, 列表则每行(第0维)各用一个生成器"""
+    if generator is None or isinstance(generator, torch.Generator):
+        return fill(torch.empty_like(x), generator)
+    return torch.stack([fill(torch.empty_like(row), g) for row, g in zip(x, generator)])
+
+def randn_like_seeded(x, generator=None):
+    """与 x 同设备/精度的标准正态噪声, 可指定随机数生成器"""
+    return _rows_like(x, generator, lambda t, g: t.normal_(generator=g))
+
+def exponential_like_seeded(x, generator=None):
+    """与 x 同设备/精度、参数为1的指数分布样本, 可指定随机数生成器"""
+    return _rows_like(x, generator, lambda t, g: t.exponential_(1, generator=g))
+
 def slice_segments(x, ids_str, segment_size=4):
     """从张量中切片固定长度的片段
     Args:
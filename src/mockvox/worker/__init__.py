@@ -1,7 +1,7 @@
 from .worker import celeryApp
 from .train_stage1 import process_file_task, add_audio_task
 from .train_stage2 import train_task, resume_task
-from .inference import inference_task
+from .inference import inference_task, prepare_reference_task
 
 __all__ = [
     "celeryApp", 
@@ -9,5 +9,6 @@ __all__ = [
     "add_audio_task",
     "train_task", 
     "resume_task", 
-    "inference_task"
+    "inference_task",
+    "prepare_reference_task"
 ]
\ No newline at end of file
@@ -1,5 +1,8 @@
 # from .worker import app
-from mockvox.engine.v4.inference import Inferencer
+from mockvox.engine.v4.registry import model_registry
+from mockvox.engine.v4.pool import inference_pool
+from mockvox.engine.v4.reference import ReferenceExtractor
+from mockvox.engine.v4.synthesis_cache import synthesis_cache
 from mockvox.utils import i18n
 import soundfile as sf
 import torch
@@ -7,7 +10,8 @@ import gc
 import os
 import time
 from pathlib import Path
-from mockvox.config import OUT_PUT_PATH
+from mockvox.config import OUT_PUT_PATH, SOVITS_MODEL_CONFIG
+from mockvox.utils import get_hparams_from_file, MockVoxLogger
 from .worker import celeryApp
 
 @celeryApp.task(name="inference", bind=True)
@@ -22,16 +26,27 @@ def inference_task(self,gpt_model_path:str ,
                    top_k:int, 
                    temperature:float, 
                    speed:float,
-                   version: str
+                   sample_steps: int = None,
+                   cfm_schedule: str = None,
+                   seed: int = None,
+                   cache_key: str = None
 ):
     
-    inference = Inferencer(gpt_model_path,soVITS_model_path,version)
-    # Synthesize audio
-    synthesis_result = inference.inference(ref_wav_path=ref_audio_path,# 参考音频 
-                                prompt_text=ref_text, # 参考文本
-                                prompt_language=i18n(ref_language), 
-                                text=target_text, # 目标文本
-                                text_language=i18n(target_language), top_p=top_p, temperature=temperature, top_k=top_k, speed=speed)
+    # 权重目录结构为 WEIGHTS_PATH/<model_id>/gpt.pth
+    model_id = Path(gpt_model_path).parent.name
+    params = dict(ref_wav_path=ref_audio_path,# 参考音频 
+                  prompt_text=ref_text, # 参考文本
+                  prompt_language=i18n(ref_language), 
+                  text=target_text, # 目标文本
+                  text_language=i18n(target_language), top_p=top_p, temperature=temperature, top_k=top_k, speed=speed,
+                  sample_steps=sample_steps, cfm_schedule=cfm_schedule, seed=seed)
+    if inference_pool.enabled:
+        # 转发给负责该模型的推理工作进程, Celery 进程内不加载模型
+        synthesis_result = inference_pool.inference(model_id, gpt_model_path, soVITS_model_path, **params)
+    else:
+        inference = model_registry.get(model_id, gpt_model_path, soVITS_model_path)
+        # Synthesize audio
+        synthesis_result = inference.inference(**params)
     if torch.cuda.is_available():
             torch.cuda.empty_cache()
             torch.cuda.synchronize()
@@ -42,6 +57,9 @@ def inference_task(self,gpt_model_path:str ,
     if result_list:
         last_sampling_rate, last_audio_data = result_list[-1]
         sf.write( outputname,  last_audio_data, int(last_sampling_rate))
+        if cache_key:
+            # 固定种子的结果写入合成结果缓存, 相同请求不再合成
+            synthesis_cache.put_file(cache_key, outputname)
         return {
             "status": "success", 
             "results": {}, 
@@ -52,4 +70,29 @@ def inference_task(self,gpt_model_path:str ,
         "status": "fail", 
         "results": {}, 
         "time":time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-    }
\ No newline at end of file
+    }
+
+@celeryApp.task(name="prepare reference", bind=True)
+def prepare_reference_task(self, ref_audio_path: str):
+    """
+    上传参考音频后预先提取与模型无关的参考特征(HuBERT、频谱、v4 mel谱), 写入磁盘缓存供推理复用.
+    上传时还没有参考文本, 参考文本的音素与BERT、提示语义token(依赖模型)在各模型首次合成时计算
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    hps = get_hparams_from_file(SOVITS_MODEL_CONFIG)
+    try:
+        for version in ("v2", "v4"):
+            hps.model.version = version
+            ReferenceExtractor(hps, device).load(ref_audio_path)
+    except OSError as e:
+        MockVoxLogger.error(f"{ref_audio_path}: {str(e)}")
+        return {
+            "status": "fail",
+            "results": {"error": str(e)},
+            "time":time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+        }
+    return {
+        "status": "success",
+        "results": {},
+        "time":time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+    }
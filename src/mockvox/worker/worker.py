@@ -1,7 +1,64 @@
+import os
 from celery import Celery
-from mockvox.config import celery_config
+from celery.signals import celeryd_init, worker_process_init
+from mockvox.config import get_config, celery_config, INFERENCE_QUEUE, QUEUE_CONCURRENCY
+from mockvox.utils import MockVoxLogger
+
+cfg = get_config()
 
 celeryApp = Celery("worker")
 celeryApp.config_from_object(celery_config)
 
-celeryApp.autodiscover_tasks()
\ No newline at end of file
+celeryApp.autodiscover_tasks()
+
+# 当前 worker 只消费的队列(celery worker -Q <队列>), 消费多个队列时为 None; 在主进程中确定, 由 prefork 子进程继承
+worker_profile = None
+
+@celeryd_init.connect
+def configure_worker(conf=None, options=None, **kwargs):
+    """按 -Q 指定的队列确定 worker 类型, 未指定 --concurrency 时使用该队列的进程数配置"""
+    global worker_profile
+    queues = (options or {}).get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    queues = [queue.strip() for queue in queues if queue.strip()]
+    if len(queues) != 1 or queues[0] not in QUEUE_CONCURRENCY:
+        return
+    worker_profile = queues[0]
+    if not options.get("concurrency"):
+        conf.worker_concurrency = QUEUE_CONCURRENCY[worker_profile]
+    MockVoxLogger.info(f"Celery worker profile: {worker_profile} | concurrency: {options.get('concurrency') or conf.worker_concurrency}")
+
+@worker_process_init.connect
+def preload_models(**kwargs):
+    """
+    worker 子进程启动时预加载所属队列需要的模型, 首个任务不再承担加载耗时.
+    推理: 共享的 CNHubert、BERT、声码器、中文多音字模型(g2pW)与 CELERY_PRELOAD_MODELS 中的模型(启用推理进程池时模型在池中, 不预加载);
+    预处理与训练任务的模型按任务参数加载且用完释放显存, 不预加载.
+    """
+    if worker_profile != INFERENCE_QUEUE:
+        return
+    from mockvox.engine.v4.pool import inference_pool
+    if inference_pool.enabled:
+        return
+
+    import torch
+    from mockvox.engine.v4.inference import Inferencer
+    from mockvox.engine.v4.registry import model_registry
+    from mockvox.engine.v4.shared import SharedModels
+    from mockvox.text.chinese import get_g2pw
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    try:
+        SharedModels.ssl_model(device)
+        SharedModels.vocoder(device)
+        get_g2pw()
+        for language in filter(None, (language.strip() for language in cfg.CELERY_PRELOAD_LANGUAGES.split(","))):
+            SharedModels.bert(Inferencer.MODEL_MAPPING.get(language, "GPT-SoVITS/chinese-roberta-wwm-ext-large"), device)
+        for model_id in filter(None, (model_id.strip() for model_id in cfg.CELERY_PRELOAD_MODELS.split(","))):
+            model_registry.get(model_id)
+    except Exception as e:
+        # 预加载失败不影响 worker 启动, 任务执行时再按需加载
+        MockVoxLogger.warning(f"Celery worker model preload failed: {e}")
+        return
+    MockVoxLogger.info(f"Celery worker models preloaded | pid: {os.getpid()}")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""GPT 采样: 与原来基于全词表排序的 top-p、gather/scatter 重复惩罚实现等价"""
+import pytest
+import torch
+
+from mockvox.nn.AR.utils import logits_to_probs, sample, token_histogram
+
+VOCAB_SIZE = 1025
+
+def legacy_logits_to_probs(logits, previous_tokens=None, temperature=1.0, top_k=None, top_p=None, repetition_penalty=1.0):
+    """原实现: gather/scatter 重复惩罚, 全词表排序做 top-p, 再做 top-k"""
+    if previous_tokens is not None and repetition_penalty != 1.0:
+        previous_tokens = previous_tokens.long()
+        score = torch.gather(logits, dim=1, index=previous_tokens)
+        score = torch.where(score < 0, score * repetition_penalty, score / repetition_penalty)
+        logits.scatter_(dim=1, index=previous_tokens, src=score)
+    if top_p is not None and top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
+        cum_probs = torch.cumsum(torch.nn.functional.softmax(sorted_logits, dim=-1), dim=-1)
+        sorted_indices_to_remove = cum_probs > top_p
+        sorted_indices_to_remove[:, 0] = False
+        indices_to_remove = sorted_indices_to_remove.scatter(dim=1, index=sorted_indices, src=sorted_indices_to_remove)
+        logits = logits.masked_fill(indices_to_remove, -float("Inf"))
+    logits = logits / max(temperature, 1e-5)
+    if top_k is not None:
+        v, _ = torch.topk(logits, min(top_k, logits.size(-1)))
+        pivot = v[:, -1].unsqueeze(-1)
+        logits = torch.where(logits < pivot, -float("Inf"), logits)
+    return torch.nn.functional.softmax(logits, dim=-1)
+
+def make_inputs(seed, batch=4, history=60):
+    generator = torch.Generator().manual_seed(seed)
+    logits = torch.randn(batch, VOCAB_SIZE, generator=generator) * 3
+    previous_tokens = torch.randint(0, VOCAB_SIZE, (batch, history), generator=generator)
+    return logits, previous_tokens
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("top_k, top_p, temperature, repetition_penalty", [
+    (None, None, 1.0, 1.0),
+    (None, 0.8, 0.7, 1.35),
+    (15, None, 1.0, 1.35),
+    (15, 1.0, 1.2, 1.0),
+    (15, 0.6, 0.7, 1.35),
+    (1, 0.9, 1.0, 1.35),
+    (2000, 0.95, 1.0, 1.35),
+])
+def test_logits_to_probs_matches_legacy(seed, top_k, top_p, temperature, repetition_penalty):
+    logits, previous_tokens = make_inputs(seed)
+    expected = legacy_logits_to_probs(
+        logits.clone(), previous_tokens, temperature=temperature, top_k=top_k, top_p=top_p,
+        repetition_penalty=repetition_penalty
+    )
+    probs = logits_to_probs(
+        logits.clone(), previous_tokens, temperature=temperature, top_k=top_k, top_p=top_p,
+        repetition_penalty=repetition_penalty
+    )
+    assert torch.allclose(probs, expected, atol=1e-6)
+    # 解码循环维护的直方图与逐步扫描历史结果相同
+    counted = logits_to_probs(
+        logits.clone(), temperature=temperature, top_k=top_k, top_p=top_p,
+        repetition_penalty=repetition_penalty, token_counts=token_histogram(previous_tokens, VOCAB_SIZE)
+    )
+    assert torch.allclose(counted, expected, atol=1e-6)
+
+def test_per_row_parameters_match_legacy_rows():
+    logits, previous_tokens = make_inputs(7)
+    top_k, top_p = [5, 15, 50, 15], [1.0, 0.8, 0.6, 0.9]
+    temperature, repetition_penalty = [1.0, 0.7, 1.3, 1.0], [1.35, 1.0, 1.35, 1.2]
+    probs = logits_to_probs(
+        logits.clone(), previous_tokens,
+        temperature=torch.tensor(temperature), top_k=torch.tensor(top_k), top_p=torch.tensor(top_p),
+        repetition_penalty=torch.tensor(repetition_penalty)
+    )
+    for row in range(logits.shape[0]):
+        expected = legacy_logits_to_probs(
+            logits[row:row + 1].clone(), previous_tokens[row:row + 1], temperature=temperature[row],
+            top_k=top_k[row], top_p=top_p[row], repetition_penalty=repetition_penalty[row]
+        )
+        assert torch.allclose(probs[row:row + 1], expected, atol=1e-6)
+
+@pytest.mark.parametrize("top_k", [None, 15])
+def test_sample_stays_in_support_and_follows_generator(top_k):
+    logits, previous_tokens = make_inputs(3)
+    params = dict(top_k=top_k, top_p=0.8, temperature=0.7, repetition_penalty=1.35)
+    expected = legacy_logits_to_probs(logits.clone(), previous_tokens, **params)
+    samples = []
+    for _ in range(2):
+        idx_next, probs = sample(logits.clone(), previous_tokens, generator=torch.Generator().manual_seed(11), **params)
+        assert torch.allclose(probs, expected, atol=1e-6)
+        assert bool((expected.gather(1, idx_next.long()) > 0).all())
+        samples.append(idx_next)
+    # 同一种子的生成器采样结果相同
+    assert torch.equal(samples[0], samples[1])
+
+def test_sample_with_per_row_generators_is_independent_of_batch():
+    logits, previous_tokens = make_inputs(5)
+    params = dict(top_k=15, top_p=0.9, temperature=1.0, repetition_penalty=1.35)
+    generators = [torch.Generator().manual_seed(i) for i in range(logits.shape[0])]
+    batched, _ = sample(logits.clone(), previous_tokens, generator=generators, **params)
+    for row in range(logits.shape[0]):
+        single, _ = sample(
+            logits[row:row + 1].clone(), previous_tokens[row:row + 1],
+            generator=torch.Generator().manual_seed(row), **params
+        )
+        assert torch.equal(batched[row:row + 1], single)
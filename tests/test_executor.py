@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""有界线程池: 名额用满时拒绝, 流式消费方断开时关闭生成器并归还名额"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mockvox.utils.executor import BoundedExecutor, ExecutorOverloaded
+
+TIMEOUT = 5
+
+def wait_until(predicate, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_submit_rejects_when_workers_and_queue_are_full():
+    executor = BoundedExecutor(max_workers=1, max_queue=1, name="test")
+    release = threading.Event()
+    try:
+        running = executor.submit(release.wait, TIMEOUT)
+        queued = executor.submit(release.wait, TIMEOUT)
+        with pytest.raises(ExecutorOverloaded):
+            executor.submit(release.wait, TIMEOUT)
+        assert wait_until(lambda: executor.stats()["running"] == 1)
+        stats = executor.stats()
+        assert (stats["queued"], stats["rejected"]) == (1, 1)
+
+        release.set()
+        assert running.result(TIMEOUT) and queued.result(TIMEOUT)
+        assert wait_until(lambda: executor.stats()["completed"] == 2)
+        # 名额归还后可以再次提交
+        assert executor.submit(lambda: 42).result(TIMEOUT) == 42
+    finally:
+        release.set()
+        executor.shutdown()
+
+def test_run_returns_result_and_propagates_errors():
+    executor = BoundedExecutor(max_workers=2, max_queue=0, name="test")
+
+    def fail():
+        raise ValueError("boom")
+
+    async def main():
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        with pytest.raises(ValueError):
+            await executor.run(fail)
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
+
+def test_stream_rejects_when_full():
+    executor = BoundedExecutor(max_workers=1, max_queue=0, name="test")
+    release = threading.Event()
+
+    async def main():
+        executor.submit(release.wait, TIMEOUT)
+        with pytest.raises(ExecutorOverloaded):
+            executor.stream(iter, [1])
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        executor.shutdown()
+
+def test_stream_yields_items_and_errors():
+    executor = BoundedExecutor(max_workers=1, max_queue=0, name="test")
+
+    def chunks(n, fail=False):
+        for i in range(n):
+            yield i
+        if fail:
+            raise RuntimeError("synthesis failed")
+
+    async def main():
+        assert [item async for item in executor.stream(chunks, 20)] == list(range(20))
+        # 线程在送出结束标记后才归还名额, 等待期间事件循环需继续运行
+        while executor.stats()["running"]:
+            await asyncio.sleep(0.01)
+        received = []
+        with pytest.raises(RuntimeError):
+            async for item in executor.stream(chunks, 3, fail=True):
+                received.append(item)
+        assert received == [0, 1, 2]
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
+
+def test_stream_cancellation_closes_generator_and_frees_slot():
+    executor = BoundedExecutor(max_workers=1, max_queue=0, name="test")
+    closed = threading.Event()
+    produced = []
+
+    def endless():
+        try:
+            i = 0
+            while True:
+                produced.append(i)
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    async def main():
+        stream = executor.stream(endless)
+        received = []
+        async for item in stream:
+            received.append(item)
+            if len(received) == 3:
+                break
+        # 消费方断开
+        await stream.aclose()
+        assert received == [0, 1, 2]
+        await asyncio.get_running_loop().run_in_executor(None, closed.wait, TIMEOUT)
+
+    try:
+        asyncio.run(main())
+        assert closed.is_set()
+        assert wait_until(lambda: executor.stats()["running"] == 0)
+        # 生成器没有一直运行下去, 且名额已归还
+        assert len(produced) < 100
+        assert executor.submit(lambda: "free").result(TIMEOUT) == "free"
+    finally:
+        executor.shutdown()
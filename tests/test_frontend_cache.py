@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""文本前端缓存: 按条目大小做 LRU 淘汰"""
+import torch
+
+from mockvox.engine.v4.frontend_cache import FrontendCache
+
+def make_entry(phones=4, bert_frames=4):
+    segments = [(list(range(phones)), [1] * phones, "文" * phones, "zh")]
+    return segments, [torch.zeros(1024, bert_frames)]
+
+def entry_size(phones=4, bert_frames=4):
+    return FrontendCache._entry_size(make_entry(phones, bert_frames))
+
+def test_get_returns_put_entry():
+    cache = FrontendCache(capacity=entry_size() * 4)
+    segments, berts = make_entry()
+    cache.put("a", segments, berts)
+    entry = cache.get("a")
+    assert entry[0] == segments and torch.equal(entry[1][0], berts[0])
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_evicts_least_recently_used_within_capacity():
+    cache = FrontendCache(capacity=entry_size() * 3)
+    for key in "abc":
+        cache.put(key, *make_entry())
+    # 访问 a 后 b 成为最久未用
+    assert cache.get("a") is not None
+    cache.put("d", *make_entry())
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.evictions == 1
+    assert cache._size == entry_size() * 3
+
+def test_large_entry_evicts_several_and_oversize_entry_is_skipped():
+    cache = FrontendCache(capacity=entry_size() * 3)
+    for key in "abc":
+        cache.put(key, *make_entry())
+    cache.put("big", *make_entry(bert_frames=8))
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("big") is not None
+    assert cache.evictions == 2
+    # 超过总容量的条目不缓存, 也不挤掉已有条目
+    cache.put("huge", *make_entry(bert_frames=64))
+    assert cache.get("huge") is None
+    assert cache.get("c") is not None and cache.get("big") is not None
+
+def test_zero_capacity_disables_memory_cache():
+    cache = FrontendCache(capacity=0)
+    cache.put("a", *make_entry())
+    assert not cache.enabled
+    assert cache.get("a") is None
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""推理进程池: CPU列表解析、分组与 model_id 到工作进程的路由"""
+from multiprocessing import Pipe
+
+import numpy as np
+import pytest
+
+from mockvox.engine.v4 import pool
+from mockvox.engine.v4.pool import PoolResults, parse_affinity, parse_cpus, route, split_cpus
+
+MODEL_IDS = [f"model-{i}" for i in range(200)]
+
+def test_parse_cpus_ranges_and_duplicates():
+    assert parse_cpus("0-3,12, 14-15") == [0, 1, 2, 3, 12, 14, 15]
+    assert parse_cpus("3,1,1-2,") == [1, 2, 3]
+
+def test_parse_cpus_defaults_to_available():
+    cpus = parse_cpus("  ")
+    assert cpus and cpus == sorted(set(cpus))
+
+@pytest.mark.parametrize("cpus, workers", [(8, 2), (8, 3), (7, 7), (16, 5)])
+def test_split_cpus_contiguous_and_complete(cpus, workers):
+    groups = split_cpus(list(range(cpus)), workers)
+    assert len(groups) == workers
+    assert all(groups)
+    assert [cpu for group in groups for cpu in group] == list(range(cpus))
+    assert max(map(len, groups)) - min(map(len, groups)) <= 1
+
+def test_split_cpus_shares_cpus_when_workers_exceed_cpus():
+    assert split_cpus([4, 5], 5) == [[4], [5], [4], [5], [4]]
+
+def test_parse_affinity():
+    assert parse_affinity("a=0, b = 2,bad") == {"a": 0, "b": 2}
+
+def test_route_is_stable_and_in_range(monkeypatch):
+    monkeypatch.setattr(pool.cfg, "INFERENCE_POOL_AFFINITY", "")
+    for workers in (1, 3, 8):
+        indexes = [route(model_id, workers) for model_id in MODEL_IDS]
+        assert all(0 <= index < workers for index in indexes)
+        assert indexes == [route(model_id, workers) for model_id in MODEL_IDS]
+    # 模型大致均匀分布到各进程
+    assert len(set(route(model_id, 4) for model_id in MODEL_IDS)) == 4
+
+def test_route_moves_few_models_when_workers_grow(monkeypatch):
+    monkeypatch.setattr(pool.cfg, "INFERENCE_POOL_AFFINITY", "")
+    for model_id in MODEL_IDS:
+        before, after = route(model_id, 4), route(model_id, 5)
+        # rendezvous 哈希: 只会迁移到新增的进程
+        assert after == before or after == 4
+
+def test_route_prefers_affinity(monkeypatch):
+    monkeypatch.setattr(pool.cfg, "INFERENCE_POOL_AFFINITY", "model-1=2,model-2=9")
+    assert route("model-1", 4) == 2
+    # 超出进程数的固定分配被忽略
+    monkeypatch.setattr(pool.cfg, "INFERENCE_POOL_AFFINITY", "")
+    expected = route("model-2", 4)
+    monkeypatch.setattr(pool.cfg, "INFERENCE_POOL_AFFINITY", "model-1=2,model-2=9")
+    assert route("model-2", 4) == expected
+
+def test_pool_results_yield_chunks_and_close_connection():
+    client, worker = Pipe()
+    audio = np.arange(6, dtype=np.int16)
+    worker.send(("chunk", 32000, str(audio.dtype)))
+    worker.send_bytes(audio.tobytes())
+    worker.send(("done", None))
+    chunks = list(PoolResults(client))
+    assert len(chunks) == 1 and chunks[0][0] == 32000
+    assert np.array_equal(chunks[0][1], audio)
+    assert client.closed
+
+def test_pool_results_close_before_iteration_closes_connection():
+    client, _ = Pipe()
+    results = PoolResults(client)
+    # 线程池已满时接口在开始迭代前关闭
+    results.close()
+    assert client.closed
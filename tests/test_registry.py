@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""常驻模型注册表: 同一模型不并发加载, 加载失败后其余请求重新加载"""
+import threading
+import time
+
+import pytest
+
+from mockvox.engine.v4 import registry
+from mockvox.engine.v4.registry import ModelRegistry
+
+class FakeInferencer:
+    """第一次加载失败, 记录同时进行的加载数"""
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    loads = 0
+
+    def __init__(self, gpt_path, sovits_path):
+        cls = type(self)
+        with cls.lock:
+            cls.loads += 1
+            attempt = cls.loads
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            time.sleep(0.05)
+            if attempt == 1:
+                raise RuntimeError("load failed")
+        finally:
+            with cls.lock:
+                cls.active -= 1
+        self.version = "v4"
+
+    def memory_footprint(self):
+        return 1
+
+@pytest.fixture
+def weights(tmp_path):
+    gpt_path, sovits_path = tmp_path / "gpt.pth", tmp_path / "sovits.pth"
+    gpt_path.write_bytes(b"gpt")
+    sovits_path.write_bytes(b"sovits")
+    return str(gpt_path), str(sovits_path)
+
+def test_failed_load_is_retried_without_concurrent_loads(monkeypatch, weights):
+    monkeypatch.setattr(registry, "Inferencer", FakeInferencer)
+    model_registry = ModelRegistry(memory_budget=1024)
+    results, errors = [], []
+
+    def get():
+        try:
+            results.append(model_registry.get("model", *weights))
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # 第一次加载失败时到达的请求
+    time.sleep(0.06)
+    late = [threading.Thread(target=get) for _ in range(4)]
+    for thread in late:
+        thread.start()
+    for thread in threads + late:
+        thread.join(5)
+
+    assert FakeInferencer.max_active == 1
+    assert FakeInferencer.loads == 2
+    assert len(errors) == 1
+    assert len(results) == 7 and all(inferencer is results[0] for inferencer in results)
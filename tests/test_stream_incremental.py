@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""v2 流式合成的分段逻辑: 用假的语义token流与解码器驱动 Inferencer.synthesize_incremental"""
+import pytest
+import torch
+
+from mockvox.engine.v4 import inference
+from mockvox.engine.v4.inference import Inferencer
+
+SAMPLES_PER_TOKEN = 4
+PROMPT_LEN = 5
+
+class FakeDecoder:
+    """逐个产出 (y, idx, done), 最后一个token为EOS"""
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+    def stream(self, all_phoneme_ids, prompt, bert, **kwargs):
+        y = prompt
+        for idx in range(self.tokens + 1):
+            y = torch.cat([y, torch.full((1, 1), idx, dtype=torch.long)], dim=1)
+            yield y, idx, idx == self.tokens
+
+def make_inferencer(tokens: int):
+    inferencer = Inferencer.__new__(Inferencer)
+    inferencer.device = "cpu"
+    inferencer.hz = 50
+    inferencer.max_sec = 10
+    inferencer.onnx_t2s = None
+    inferencer.speculative = FakeDecoder(tokens)
+    inferencer.get_refers = lambda ref, inp_refs: None
+    # 每个token解码为 SAMPLES_PER_TOKEN 个值为1的样本
+    inferencer.vits_decode = lambda codes, text, refers, speed=1, generator=None: torch.ones(1, 1, codes.shape[-1] * SAMPLES_PER_TOKEN)
+    return inferencer
+
+@pytest.mark.parametrize("window", [1, 2, 7, 25, 100])
+def test_incremental_stream_emits_every_token(monkeypatch, window):
+    tokens = 30
+    monkeypatch.setattr(inference.cfg, "V2_STREAM_WINDOW", window)
+    monkeypatch.setattr(inference.cfg, "V2_STREAM_LOOKBACK", 3)
+    ref = {"phones": [1, 2], "bert": torch.zeros(1024, 2), "prompt": torch.zeros(1, PROMPT_LEN, dtype=torch.long)}
+    frontend = ([3, 4, 5], torch.zeros(1024, 3), "text")
+
+    chunks = list(make_inferencer(tokens).synthesize_incremental(ref, frontend))
+
+    audio = torch.cat(chunks)
+    assert audio.shape[0] == tokens * SAMPLES_PER_TOKEN
+    assert torch.allclose(audio, torch.ones_like(audio))
+    if window < tokens:
+        assert len(chunks) > 1
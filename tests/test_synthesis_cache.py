@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""合成结果缓存: 原子写入、按修改时间的 LRU 淘汰、完整输出后才写入"""
+import os
+
+import numpy as np
+import pytest
+
+from mockvox.engine.v4.synthesis_cache import SynthesisCache, sentence_seed
+
+SAMPLING_RATE = 32000
+
+def audio(seconds=0.1, value=0.25):
+    return np.full(int(SAMPLING_RATE * seconds), value, dtype=np.float32)
+
+def entry_size(cache_dir):
+    probe = SynthesisCache(capacity=1 << 30, cache_dir=str(cache_dir / "probe"))
+    probe.save("probe", SAMPLING_RATE, audio())
+    return os.path.getsize(probe.file("probe"))
+
+def age(cache, key, seconds):
+    """把条目的修改时间往前调, 模拟较早写入或访问"""
+    stat = os.stat(cache.file(key))
+    os.utime(cache.file(key), (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+def test_save_load_round_trip(tmp_path):
+    cache = SynthesisCache(capacity=1 << 30, cache_dir=str(tmp_path))
+    assert cache.load("missing") is None
+    cache.save("a", SAMPLING_RATE, audio(value=0.5))
+    sampling_rate, loaded = cache.load("a")
+    assert sampling_rate == SAMPLING_RATE
+    assert np.array_equal(loaded, audio(value=0.5))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["stores"]) == (1, 1, 1, 1)
+
+def test_evicts_least_recently_used(tmp_path):
+    size = entry_size(tmp_path)
+    cache = SynthesisCache(capacity=size * 3, cache_dir=str(tmp_path / "cache"))
+    for i, key in enumerate("abc"):
+        cache.save(key, SAMPLING_RATE, audio())
+        age(cache, key, 100 - i * 10)
+    # 命中更新修改时间, b 成为最久未用
+    assert cache.lookup("a") is not None
+    cache.save("d", SAMPLING_RATE, audio())
+    assert cache.lookup("b") is None
+    assert all(cache.lookup(key) is not None for key in "acd")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] <= size * 3
+
+def results(chunks):
+    for chunk in chunks:
+        yield SAMPLING_RATE, chunk
+
+def test_record_writes_after_full_output(tmp_path):
+    cache = SynthesisCache(capacity=1 << 30, cache_dir=str(tmp_path))
+    chunks = [audio(value=0.25), audio(value=0.5)]
+    assert [chunk for _, chunk in cache.record("a", results(chunks))] == chunks
+    assert cache.lookup("a") is not None
+
+def test_record_does_not_write_when_closed_early(tmp_path):
+    cache = SynthesisCache(capacity=1 << 30, cache_dir=str(tmp_path))
+    closed = []
+
+    def source():
+        try:
+            yield from results([audio(), audio(), audio()])
+        finally:
+            closed.append(True)
+
+    recorded = cache.record("a", source())
+    next(recorded)
+    # 客户端中途断开
+    recorded.close()
+    assert closed == [True]
+    assert cache.lookup("a") is None
+    assert cache.stats()["stores"] == 0
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for name in ("gpt.pth", "sovits.pth", "ref.wav"):
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+def test_key_covers_seed_and_text(tmp_path, files):
+    cache = SynthesisCache(capacity=1 << 30, cache_dir=str(tmp_path))
+    key = cache.key(*files, 1, text="你好。", top_k=15)
+    assert key == cache.key(*files, 1, text="你好。", top_k=15)
+    assert key != cache.key(*files, 2, text="你好。", top_k=15)
+    assert key != cache.key(*files, 1, text="再见。", top_k=15)
+    assert key != cache.key(*files, 1, text="你好。", top_k=5)
+
+def test_sentence_seed_ignores_whitespace():
+    assert sentence_seed(7, "今天 天气\n很好。") == sentence_seed(7, " 今天  天气 很好。 ")
+    assert sentence_seed(7, "今天天气很好。") != sentence_seed(8, "今天天气很好。")
+    assert 0 <= sentence_seed(7, "今天天气很好。") < 2 ** 63
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""中文文本规整: 单次扫描的实现与原来逐条规则作用于整句的实现输出一致"""
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from mockvox.text.zh_normalization import TextNormalizer
+
+BENCHMARK_PATH = Path(__file__).resolve().parents[1] / "benchmarks" / "zh_normalization.py"
+
+@pytest.fixture(scope="module")
+def benchmark():
+    spec = importlib.util.spec_from_file_location("zh_normalization_benchmark", BENCHMARK_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.mark.parametrize("seed", range(3))
+def test_normalize_sentence_matches_legacy(benchmark, seed):
+    normalizer = TextNormalizer()
+    corpus = benchmark.make_corpus(2000, seed, plain_ratio=0.1)
+    mismatches = [
+        (sentence, legacy, fast)
+        for sentence in corpus
+        for legacy, fast in [(benchmark.legacy_normalize_sentence(sentence), normalizer.normalize_sentence(sentence))]
+        if legacy != fast
+    ]
+    assert not mismatches, mismatches[:5]